@@ -0,0 +1,218 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+
+from compare_engine import KeyFilter, compare_keyed_sheet, compare_custom_sheet
+from rtest import load_compare_workbooks
+from run_profile import RunProfile
+from xlsx_reader import file_digest, formula_index, probe_workbook
+from xlsx_writer import patch_workbook, PatchUnsupported
+
+try:
+    import resource
+except ImportError:  # Windows: fall back to tracemalloc
+    resource = None
+
+
+MODES = ("standard", "custom")
+
+# Column names of the fixtures made by generateexcel2.create_benchmark_files
+FIXTURE_HEADER_ROW = 4
+FIXTURE_STANDARD_KEYS = ("Team", "App Name", "Category")
+FIXTURE_CUSTOM_KEYS = ("Test ID",)
+
+# generateexcel2.py lives at the root of the repository
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", ".."))
+
+
+def _fixture_pair(fixture_dir, rows, columns, change_rate, formula_share, duplicate_rate):
+    """Old/new fixture files for a size and generator settings, generated on first use"""
+    if _REPO_ROOT not in sys.path:
+        sys.path.append(_REPO_ROOT)
+    from generateexcel2 import benchmark_fixture_name, create_benchmark_files
+    name = benchmark_fixture_name(rows, columns, change_rate, formula_share, duplicate_rate)
+    old_file = os.path.join(fixture_dir, f"{name}_old.xlsx")
+    new_file = os.path.join(fixture_dir, f"{name}_new.xlsx")
+    if os.path.exists(old_file) and os.path.exists(new_file):
+        return old_file, new_file
+
+    print(f"Generating {name} fixtures in {fixture_dir}...")
+    return create_benchmark_files(fixture_dir, rows, columns, change_rate, formula_share, duplicate_rate)
+
+
+def run_compare(old_file, new_file, mode, output_file):
+    """Run one compare the way the tool does, without any UI
+
+    Loads both workbooks with the tool's own loader, compares every sheet
+    they share, writes the changes into the old workbook and saves it to
+    output_file. Returns the RunProfile.
+    """
+    profile = RunProfile()
+    new_sheets = probe_workbook(new_file)
+    sheet_names = [name for name in probe_workbook(old_file) if name in new_sheets]
+    old_book, new_wb = load_compare_workbooks(old_file, new_file, sheet_names, FIXTURE_HEADER_ROW)
+    old_digest = file_digest(old_file)
+    profile.lap("load")
+
+    if mode == "standard":
+        team, app, category = FIXTURE_STANDARD_KEYS
+        settings = {"header_row": FIXTURE_HEADER_ROW, "team_column": team, "app_name_column": app,
+                    "category_column": category, "additional_criteria": [], "filters": [],
+                    "formula_map": {}}
+        compare_sheet = compare_keyed_sheet
+    else:
+        settings = {"header_row": FIXTURE_HEADER_ROW, "key_columns": list(FIXTURE_CUSTOM_KEYS),
+                    "key_filter": KeyFilter([]), "formula_map": {}}
+        compare_sheet = compare_custom_sheet
+
+    edits = {}
+    for sheet_name in sheet_names:
+        formula_cells = formula_index(old_file, sheet_name, old_digest)
+        profile.lap("formula scan", sheet_name)
+        result = compare_sheet(old_book.formula_sheet(sheet_name), old_book.value_sheet(sheet_name),
+                               new_wb[sheet_name], formula_cells, settings, profile=profile)
+        old_sheet = old_book.formula_sheet(sheet_name)
+        for old_row, _, col, _, new_value in result.changes:
+            old_sheet.cell(row=old_row, column=col).value = new_value
+        edits[sheet_name] = {(old_row, col): new_value for old_row, _, col, _, new_value in result.changes}
+        profile.count("cells written", len(result.changes), sheet_name)
+        profile.lap("write", sheet_name)
+
+    try:
+        patch_workbook(old_file, output_file, edits)
+    except PatchUnsupported as e:
+        print(f"Fast save not possible ({e}), saving the whole workbook")
+        old_book.save(output_file)
+    profile.lap("save")
+    old_book.close()
+    profile.finish()
+    return profile
+
+
+def _peak_memory_mb():
+    """Peak memory of this process in MB and how it was measured"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1), "maxrss"
+    return round(tracemalloc.get_traced_memory()[1] / (1 << 20), 1), "tracemalloc"
+
+
+def _run_case(old_file, new_file, mode):
+    """Benchmark one compare in this (fresh) process and return its record"""
+    if resource is None:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        profile = run_compare(old_file, new_file, mode, os.path.join(temp_dir, "updated.xlsx"))
+    report = profile.to_dict()
+    peak_mb, peak_source = _peak_memory_mb()
+    rows = report["counters"]["rows scanned"]
+    cells = report["counters"]["cells compared"]
+    return {
+        "mode": mode,
+        "old_file": os.path.basename(old_file),
+        "old_file_mb": round(os.path.getsize(old_file) / (1 << 20), 2),
+        "wall_s": report["wall_s"],
+        "rows_per_s": round(rows / report["wall_s"]) if report["wall_s"] else None,
+        "cells_per_s": round(cells / report["wall_s"]) if report["wall_s"] else None,
+        "peak_memory_mb": peak_mb,
+        "peak_memory_source": peak_source,
+        "phases": report["phases"],
+        "counters": report["counters"],
+    }
+
+
+def run_case(old_file, new_file, mode):
+    """Benchmark one compare in a fresh process, so peak memory is not shared between cases"""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_case, (old_file, new_file, mode))
+
+
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "openpyxl": openpyxl.__version__,
+        "pandas": pd.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+def _print_record(record, baseline=None):
+    line = (f"{record['mode']:<8} {record['old_file']:<64} {record['wall_s']:>9.2f}s "
+            f"{record['rows_per_s'] or 0:>10} rows/s {record['peak_memory_mb']:>9.1f} MB")
+    if baseline:
+        speedup = baseline["wall_s"] / record["wall_s"] if record["wall_s"] else 0
+        memory = record["peak_memory_mb"] - baseline["peak_memory_mb"]
+        line += f"   vs baseline: {speedup:.2f}x speed, {memory:+.1f} MB"
+    print(line)
+
+
+def _load_baseline(filename):
+    """Latest record per (mode, fixture) from an earlier results file"""
+    baseline = {}
+    with open(filename, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                record = json.loads(line)
+                baseline[(record["mode"], record["old_file"])] = record
+    return baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compare engine on generated fixtures")
+    parser.add_argument("--sizes", default="10000x10,100000x50",
+                        help="comma separated ROWSxCOLUMNS fixture sizes (default: %(default)s)")
+    parser.add_argument("--modes", default=",".join(MODES), help="compare modes to run (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case")
+    parser.add_argument("--fixture-dir", default="benchmark_files")
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--formula-share", type=float, default=0.1)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    parser.add_argument("--label", default="", help="release or branch name stored with the results")
+    parser.add_argument("--output", default="benchmark_results.jsonl",
+                        help="results are appended here, one JSON record per run")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+    sizes = []
+    for size in args.sizes.split(","):
+        rows, _, columns = size.strip().lower().partition("x")
+        sizes.append((int(rows), int(columns)))
+
+    baseline = _load_baseline(args.baseline) if args.baseline else {}
+    environment = _environment()
+    started = datetime.now().isoformat(timespec="seconds")
+
+    with open(args.output, "a", encoding="utf-8") as results:
+        for rows, columns in sizes:
+            old_file, new_file = _fixture_pair(args.fixture_dir, rows, columns, args.change_rate,
+                                               args.formula_share, args.duplicate_rate)
+            for mode in modes:
+                for run in range(args.repeat):
+                    record = run_case(old_file, new_file, mode)
+                    record.update(label=args.label, started=started, run=run + 1, rows=rows,
+                                  columns=columns, environment=environment)
+                    results.write(json.dumps(record) + "\n")
+                    results.flush()
+                    _print_record(record, baseline.get((mode, record["old_file"])))
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,183 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# File formats a change log can be written in
+FORMATS = ("csv", "jsonl", "parquet")
+
+# Columns of every change log, in file order
+COLUMNS = ("sheet", "row", "col", "key", "old", "new")
+
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+class ChangeLog:
+    """Every cell change of a run, held column by column
+
+    Changes are added one sheet at a time as a batch of arrays: sheet (an
+    int32 id into self.sheets), row and col of the old workbook, and the
+    key, old and new value of each change. When the log has a writer,
+    each batch is written out as soon as it is added, so the file grows
+    while the run is still going.
+    """
+
+    def __init__(self, writer=None):
+        self.sheets = []  # Sheet id -> sheet name
+        self.writer = writer
+        self._batches = []
+
+    def __len__(self):
+        return sum(len(batch["row"]) for batch in self._batches)
+
+    def add(self, sheet_name, changes, keys):
+        """Add (old_row, new_row, col, old_value, new_value) changes of a sheet and the key of each"""
+        if not changes:
+            return
+        if sheet_name not in self.sheets:
+            self.sheets.append(sheet_name)
+        count = len(changes)
+        batch = {
+            "sheet": np.full(count, self.sheets.index(sheet_name), dtype=np.int32),
+            "row": np.fromiter((change[0] for change in changes), dtype=np.int64, count=count),
+            "col": np.fromiter((change[2] for change in changes), dtype=np.int32, count=count),
+            "key": _object_array(keys),
+            "old": _object_array([change[3] for change in changes]),
+            "new": _object_array([change[4] for change in changes]),
+        }
+        self._batches.append(batch)
+        if self.writer is not None:
+            self.writer.write(self.sheets, batch)
+
+    def column(self, name):
+        """One column over every batch as a single array"""
+        if not self._batches:
+            return np.empty(0, dtype=object if name in ("key", "old", "new") else np.int64)
+        return np.concatenate([batch[name] for batch in self._batches])
+
+    def to_frame(self):
+        """The whole log as a DataFrame (sheet as a categorical)"""
+        frame = pd.DataFrame({name: self.column(name) for name in COLUMNS})
+        frame["sheet"] = pd.Categorical.from_codes(frame["sheet"].astype(np.int32), categories=self.sheets)
+        return frame
+
+    def close(self, commit=True):
+        """Finish the file on disk; without commit a partly written log is removed"""
+        if self.writer is not None:
+            if commit:
+                self.writer.commit()
+            else:
+                self.writer.discard()
+            self.writer = None
+
+
+class _LogWriter:
+    """Writes batches to <filename>.partial and renames it into place on commit"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.partial_file = filename + ".partial"
+        self._fh = None
+
+    def write(self, sheets, batch):
+        raise NotImplementedError
+
+    def _close_file(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def commit(self):
+        self._close_file()
+        os.replace(self.partial_file, self.filename)
+        print(f"Change log saved to {self.filename}")
+
+    def discard(self):
+        self._close_file()
+        if os.path.exists(self.partial_file):
+            os.remove(self.partial_file)
+
+
+class _CsvWriter(_LogWriter):
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._fh = open(self.partial_file, "w", newline="", encoding="utf-8")
+        self._csv = csv.writer(self._fh)
+        self._csv.writerow(COLUMNS)
+
+    def write(self, sheets, batch):
+        names = [sheets[sheet_id] for sheet_id in batch["sheet"].tolist()]
+        self._csv.writerows(zip(names, batch["row"].tolist(), batch["col"].tolist(), batch["key"],
+                                ["" if value is None else value for value in batch["old"]],
+                                ["" if value is None else value for value in batch["new"]]))
+        self._fh.flush()
+
+
+class _JsonlWriter(_LogWriter):
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._fh = open(self.partial_file, "w", encoding="utf-8")
+
+    def write(self, sheets, batch):
+        for sheet_id, row, col, key, old, new in zip(batch["sheet"].tolist(), batch["row"].tolist(),
+                                                     batch["col"].tolist(), batch["key"], batch["old"],
+                                                     batch["new"]):
+            record = {"sheet": sheets[sheet_id], "row": row, "col": col, "key": key, "old": old, "new": new}
+            # Dates and times are written as text
+            self._fh.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+
+class _ParquetWriter(_LogWriter):
+    """One row group per batch; old and new values are stored as text since their types vary"""
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet change logs need the pyarrow package (pip install pyarrow)")
+        self._pa = pa
+        self._schema = pa.schema([("sheet", pa.string()), ("row", pa.int64()), ("col", pa.int32()),
+                                  ("key", pa.string()), ("old", pa.string()), ("new", pa.string())])
+        self._fh = pq.ParquetWriter(self.partial_file, self._schema)
+
+    def write(self, sheets, batch):
+        pa = self._pa
+        names = np.asarray(sheets, dtype=object)[batch["sheet"]]
+        table = pa.Table.from_arrays([
+            pa.array(names, pa.string()),
+            pa.array(batch["row"], pa.int64()),
+            pa.array(batch["col"], pa.int32()),
+            pa.array(batch["key"], pa.string()),
+            pa.array([_text(value) for value in batch["old"]], pa.string()),
+            pa.array([_text(value) for value in batch["new"]], pa.string()),
+        ], schema=self._schema)
+        self._fh.write_table(table)
+
+
+_WRITERS = {"csv": _CsvWriter, "jsonl": _JsonlWriter, "parquet": _ParquetWriter}
+
+
+def change_log_file(base_file, log_format):
+    """Change log filename that goes with a workbook: <workbook>_changes.<format>"""
+    return f"{os.path.splitext(base_file)[0]}_changes.{log_format}"
+
+
+def open_change_log(filename, log_format):
+    """ChangeLog that streams every added batch to filename in the given format"""
+    if log_format not in _WRITERS:
+        raise ValueError(f"Unknown change log format: {log_format}")
+    return ChangeLog(_WRITERS[log_format](filename))
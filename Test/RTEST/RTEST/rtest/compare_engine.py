@@ -0,0 +1,896 @@
+import fnmatch
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from csv_reader import is_delimited, read_csv_workbook
+from job_runner import JobCancelled
+from row_fingerprints import SheetFingerprints, block_fingerprints, load_sidecar
+from run_profile import RunProfile
+from streamed_sheet import stream_sheet
+from xlsx_reader import FormulaIndex, ValueSheet, file_digest, formula_index, read_sheet_views, read_value_workbook
+
+
+# Set in worker processes by init_worker; shared with the process that cancels
+_worker_cancel_event = None
+
+# infer_dtype results that can hold a mix of numbers and other values
+_MIXED_KINDS = ("mixed", "mixed-integer")
+# infer_dtype results where every non-missing value is a number
+_NUMERIC_KINDS = ("integer", "floating", "mixed-integer-float", "boolean")
+
+
+def value_getter(sheet):
+    """Return a fast (row, col) -> value lookup that does not create empty cells"""
+    if isinstance(sheet, ValueSheet):
+        return sheet.value
+
+    cells = getattr(sheet, '_cells', None)
+    if cells is None:
+        # Read-only worksheets have no cell dictionary
+        return lambda row, col: sheet.cell(row=row, column=col).value
+
+    def get(row, col):
+        cell = cells.get((row, col))
+        return None if cell is None else cell.value
+    return get
+
+
+def header_columns(sheet, header_row):
+    """Indices of the columns with a header, the only ones a keyed compare reads from the new sheet"""
+    get = value_getter(sheet)
+    return {col for col in range(1, sheet.max_column + 1) if get(header_row, col)}
+
+
+def read_columns(sheet, col_indices, first_row, last_row):
+    """Pull whole columns (1-based indices) out of a sheet as lists"""
+    if isinstance(sheet, ValueSheet):
+        return sheet.read_columns(col_indices, first_row, last_row)
+    rows = range(first_row, last_row + 1)
+    get = value_getter(sheet)
+    return [[get(row, col) for row in rows] for col in col_indices]
+
+
+def normalize_key_values(values, numeric_as_int=False):
+    """Bulk version of the per-cell normalize_value helpers
+
+    Missing values become "" and everything else is str(value).strip().
+    With numeric_as_int, whole numbers are written without a decimal part
+    (5.0 -> "5"), which is what custom mode has always done.
+    """
+    series = pd.Series(values, dtype=object)
+    missing = series.isna()
+    normalized = series.astype(str).str.strip()
+
+    if numeric_as_int and len(series):
+        kind = pd.api.types.infer_dtype(series, skipna=True)
+        if kind in _NUMERIC_KINDS:
+            numeric = ~missing
+        elif kind in _MIXED_KINDS:
+            numeric = series.map(lambda v: isinstance(v, (int, float))).astype(bool) & ~missing
+        else:
+            numeric = None
+
+        if numeric is not None and numeric.any():
+            numbers = series[numeric].astype(float)
+            whole = np.isfinite(numbers) & (np.floor(numbers) == numbers)
+            small = whole & (numbers.abs() < 2 ** 53)
+            normalized[small[small].index] = numbers[small].astype(np.int64).astype(str)
+            large = whole & ~small
+            if large.any():
+                normalized[large[large].index] = numbers[large].map(lambda v: str(int(v)))
+
+    normalized[missing] = ""
+    return normalized
+
+
+# Multiplier folding the per-part hashes into one 64-bit key hash (the 64-bit FNV prime)
+_HASH_PRIME = np.uint64(0x100000001B3)
+
+
+def _value_hashes(values):
+    """64-bit hash of each value of an object array, stable across stores and runs"""
+    return pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+
+
+class KeyStore:
+    """Key index of a sheet: one entry per data row with a non-empty key
+
+    Every key part is dictionary encoded: its distinct normalized values
+    are held once in values[part] and each entry stores an int32 code into
+    them. Entries also carry a 64-bit hash of the whole key, which is what
+    two stores are joined on, so no key strings are ever built. When a key
+    appears more than once the last row wins.
+    """
+
+    def __init__(self, sheet, key_col_indices, first_row, last_row, numeric_as_int=False):
+        self.values = []  # Per part: object array of the distinct normalized values
+        codes = []
+        for column in read_columns(sheet, key_col_indices, first_row, last_row):
+            part_codes, distinct = pd.factorize(normalize_key_values(column, numeric_as_int))
+            self.values.append(np.asarray(distinct, dtype=object))
+            codes.append(part_codes.astype(np.int32))
+        rows = np.arange(first_row, first_row + max(0, last_row - first_row + 1), dtype=np.int64)
+
+        # Only keep rows where at least one key component is non-empty
+        keep = np.zeros(len(rows), dtype=bool)
+        for values, part_codes in zip(self.values, codes):
+            empty = np.flatnonzero(values == "")
+            keep |= part_codes != (empty[0] if len(empty) else -1)
+        if len(rows) and keep.any():
+            # Codes are per-column, so equal code tuples mean equal keys
+            kept = pd.DataFrame({i: part_codes[keep] for i, part_codes in enumerate(codes)})
+            keep[keep] = ~kept.duplicated(keep="last").to_numpy()
+
+        self.codes = [part_codes[keep] for part_codes in codes]
+        self.rows = rows[keep]
+        self.hashes = np.zeros(len(self.rows), dtype=np.uint64)
+        for values, part_codes in zip(self.values, self.codes):
+            self.hashes = self.hashes * _HASH_PRIME ^ _value_hashes(values)[part_codes]
+        self._code_maps = None
+        self._hash_order = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def part(self, part):
+        """(distinct values, code of every entry) of one key part"""
+        return self.values[part], self.codes[part]
+
+    def lookup(self, key):
+        """Sheet row holding a key given as its normalized parts, or None"""
+        if self._code_maps is None:
+            self._code_maps = [{value: code for code, value in enumerate(values)} for values in self.values]
+            self._hash_order = np.argsort(self.hashes, kind="stable")
+        key_codes = [code_map.get(value) for code_map, value in zip(self._code_maps, key)]
+        if len(key_codes) != len(self.codes) or None in key_codes:
+            return None
+
+        key_hash = np.zeros(1, dtype=np.uint64)
+        for values, code in zip(self.values, key_codes):
+            key_hash = key_hash * _HASH_PRIME ^ _value_hashes(values[code:code + 1])
+        sorted_hashes = self.hashes[self._hash_order]
+        first = np.searchsorted(sorted_hashes, key_hash[0], side="left")
+        last = np.searchsorted(sorted_hashes, key_hash[0], side="right")
+        for position in self._hash_order[first:last]:
+            if all(part_codes[position] == code for part_codes, code in zip(self.codes, key_codes)):
+                return int(self.rows[position])
+        return None
+
+    def intersect(self, other):
+        """Hash join with another store built over the same key columns
+
+        Candidate pairs come from equal hashes and are then checked part by
+        part through code translation tables, so hash collisions can never
+        produce a false match.
+        """
+        pairs = pd.DataFrame({"hash": self.hashes, "old": np.arange(len(self))}).merge(
+            pd.DataFrame({"hash": other.hashes, "new": np.arange(len(other))}), on="hash")
+        old_positions = pairs["old"].to_numpy()
+        new_positions = pairs["new"].to_numpy()
+
+        same = np.ones(len(pairs), dtype=bool)
+        for part, values in enumerate(self.values):
+            # Code of each of our values in the other store's dictionary (-1 if absent)
+            translate = pd.Index(other.values[part]).get_indexer(values)
+            same &= translate[self.codes[part][old_positions]] == other.codes[part][new_positions]
+        return KeyMatches(self, old_positions[same], other.rows[new_positions[same]])
+
+
+class KeyMatches:
+    """Keys present in both stores: positions in the old store with the aligned new-sheet rows"""
+
+    def __init__(self, store, positions, new_rows):
+        self.store = store
+        self.positions = positions
+        self.old_rows = store.rows[positions]
+        self.new_rows = new_rows
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, selector):
+        """Subset by boolean mask or index array"""
+        return KeyMatches(self.store, self.positions[selector], self.new_rows[selector])
+
+    @property
+    def key_hashes(self):
+        return self.store.hashes[self.positions]
+
+    def part(self, part):
+        """(distinct values, code of every match) of one key part"""
+        values, codes = self.store.part(part)
+        return values, codes[self.positions]
+
+    def sorted_by_old_row(self):
+        return self[np.argsort(self.old_rows, kind="stable")]
+
+
+class ColumnStats:
+    """Distinct values, their counts and non-empty counts for every column of a sheet
+
+    Built in one pass over the sheet so value pickers never rescan it.
+    Values are counted as text, and empty/falsy cells are left out the same
+    way the pickers always skipped them.
+    """
+
+    def __init__(self, sheet, header_row):
+        self.header_row = header_row
+        self.headers = {}  # header value -> first column index with that header
+        max_col = sheet.max_column
+        header_values = read_columns(sheet, range(1, max_col + 1), header_row, header_row)
+        for col, (value,) in enumerate(header_values, start=1):
+            if value is not None:
+                self.headers.setdefault(value, col)
+
+        self.counts = {}
+        self.non_empty = {}
+        columns = read_columns(sheet, range(1, max_col + 1), header_row + 1, sheet.max_row)
+        for col, values in enumerate(columns, start=1):
+            counts = Counter(str(value) for value in values if value)
+            self.counts[col] = counts
+            self.non_empty[col] = sum(counts.values())
+
+    def column_index(self, header, as_text=False):
+        """Column holding header (compared as str when as_text), or None"""
+        if not as_text:
+            return self.headers.get(header)
+        for value, col in self.headers.items():
+            if str(value) == header:
+                return col
+        return None
+
+    def distinct(self, col):
+        """Sorted distinct non-empty values of a column"""
+        return sorted(self.counts.get(col, ()))
+
+
+class ValueFilter:
+    """Filter values for one key component, compiled once per job
+
+    Values match whole key values case-insensitively. Only with patterns
+    on are values containing * or ? shell-style wildcards matched against
+    the whole value, and values starting with "re:" regular expressions
+    searched in the value; an invalid expression raises ValueError.
+    """
+
+    def __init__(self, values, patterns=False):
+        self.values = tuple(values)
+        exact = set()
+        globs = []
+        regexes = []
+        for value in self.values:
+            if patterns and value[:3].lower() == "re:":
+                try:
+                    regexes.append(re.compile(value[3:], re.IGNORECASE))
+                except re.error as e:
+                    raise ValueError(f"Invalid regular expression in filter '{value}': {e}")
+            elif patterns and ("*" in value or "?" in value):
+                globs.append(re.compile(fnmatch.translate(value.casefold())))
+            else:
+                exact.add(value.casefold())
+        self.exact = frozenset(exact)
+        self.globs = tuple(globs)
+        self.regexes = tuple(regexes)
+
+    def __bool__(self):
+        return bool(self.values)
+
+    def mask(self, series):
+        """Boolean array of the entries of a string Series that pass this filter"""
+        folded = series.str.casefold()
+        passed = folded.isin(self.exact).to_numpy(dtype=bool, copy=True)
+        for pattern in self.globs:
+            passed |= folded.str.match(pattern).to_numpy(dtype=bool)
+        for pattern in self.regexes:
+            passed |= series.str.contains(pattern).to_numpy(dtype=bool)
+        return passed
+
+
+class KeyFilter:
+    """All active filters of a job evaluated as one mask over the key parts
+
+    Takes (part_index, ValueFilter) pairs. Values within one ValueFilter
+    are ORed; separate filters are ANDed, even when they target the same
+    key part.
+    """
+
+    def __init__(self, part_filters):
+        self.part_filters = [(part, value_filter) for part, value_filter in part_filters if value_filter]
+
+    def __bool__(self):
+        return bool(self.part_filters)
+
+    def mask(self, matches):
+        """Boolean array of the KeyMatches that pass every filter"""
+        passed = np.ones(len(matches), dtype=bool)
+        for part, value_filter in self.part_filters:
+            # Each distinct value is tested once, then spread over the matches by code
+            values, codes = matches.part(part)
+            passed &= value_filter.mask(pd.Series(values, dtype=object))[codes]
+        return passed
+
+
+# Matched rows are diffed this many at a time to bound the size of the matrices
+DIFF_BLOCK_ROWS = 5000
+
+_looks_like_formula = np.frompyfunc(lambda v: isinstance(v, str) and v.startswith('='), 1, 1)
+_as_text = np.frompyfunc(lambda v: "" if v is None else str(v), 1, 1)
+_is_present = np.frompyfunc(lambda v: v is not None, 1, 1)
+
+
+def read_block(sheet, rows, cols):
+    """2-D object matrix of values for the given rows and columns"""
+    if isinstance(sheet, ValueSheet):
+        return sheet.read_block(rows, cols)
+    get = value_getter(sheet)
+    block = np.empty((len(rows), len(cols)), dtype=object)
+    for j, col in enumerate(cols):
+        block[:, j] = [get(row, col) for row in rows]
+    return block
+
+
+class BlockDiff:
+    """Changed-cell mask for one block of matched rows"""
+
+    def __init__(self, old_rows, new_rows, cols, old_values, new_values, changed, skipped_formula):
+        self.old_rows = old_rows
+        self.new_rows = new_rows
+        self.cols = cols
+        self.old_values = old_values
+        self.new_values = new_values
+        self.changed = changed
+        self.skipped_formula = skipped_formula
+
+    @property
+    def cells_compared(self):
+        return self.changed.size
+
+    def changes(self):
+        """Yield (old_row, new_row, col, old_value, new_value) for every flagged cell"""
+        for i, j in zip(*np.nonzero(self.changed)):
+            yield (int(self.old_rows[i]), int(self.new_rows[i]), self.cols[j],
+                   self.old_values[i, j], self.new_values[i, j])
+
+
+def diff_matched_rows(old_sheet, new_sheet, old_rows, new_rows, cols, formula_cells=None,
+                      skip_cols=(), as_text=False, block_rows=DIFF_BLOCK_ROWS):
+    """Diff matched rows block by block and yield a BlockDiff for each block
+
+    old_rows[i] is compared with new_rows[i] over cols. Columns in skip_cols
+    (formula columns) and cells in formula_cells (a FormulaIndex) are never
+    flagged, and neither is text that looks like a formula. With as_text the
+    values are compared as strings (None as ""), otherwise with !=.
+    """
+    old_rows = np.asarray(old_rows, dtype=np.int64)
+    new_rows = np.asarray(new_rows, dtype=np.int64)
+    skipped_cols = [col for col in cols if col in skip_cols]
+    cols = [col for col in cols if col not in skip_cols]
+
+    for start in range(0, len(old_rows), block_rows):
+        block_old_rows = old_rows[start:start + block_rows]
+        block_new_rows = new_rows[start:start + block_rows]
+        old_values = read_block(old_sheet, block_old_rows, cols)
+        new_values = read_block(new_sheet, block_new_rows, cols)
+
+        protected = np.zeros(old_values.shape, dtype=bool)
+        if formula_cells is not None:
+            protected |= formula_cells.mask(block_old_rows, cols)
+        if old_values.size:
+            protected |= _looks_like_formula(old_values).astype(bool)
+
+        if as_text:
+            changed = _as_text(old_values) != _as_text(new_values)
+        else:
+            changed = old_values != new_values
+        changed = np.asarray(changed, dtype=bool) & ~protected
+
+        skipped_formula = int(protected.sum()) + len(skipped_cols) * len(block_old_rows)
+        yield BlockDiff(block_old_rows, block_new_rows, cols, old_values, new_values,
+                        changed, skipped_formula)
+
+
+def fingerprint_rows(sheet, rows, cols, as_text=False, block_rows=DIFF_BLOCK_ROWS):
+    """64-bit fingerprint of the values in cols of each of the given rows"""
+    rows = np.asarray(rows, dtype=np.int64)
+    fingerprints = np.zeros(len(rows), dtype=np.uint64)
+    for start in range(0, len(rows), block_rows):
+        block = read_block(sheet, rows[start:start + block_rows], cols)
+        fingerprints[start:start + block_rows] = block_fingerprints(block, as_text)
+    return fingerprints
+
+
+class SheetResult:
+    """Outcome of comparing one sheet, small enough to send back from a worker process"""
+
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
+        self.changes = []  # (old_row, new_row, col, old_value, new_value)
+        self.transposed = False  # Row-based result: new_row is the old row, the new cell may sit in another column
+        self.change_keys = []  # Key of the row of each change, its parts joined with " | "
+        self.matched_rows = 0
+        self.skipped_formula = 0
+        self.errors = []  # Messages to show the user
+        self.skipped = False  # True when the sheet could not be compared at all
+        self.profile = None  # RunProfile the phases of this sheet were booked to
+        self.comments = {}  # (new_row, col) -> comment of a changed new cell, sent along by worker processes
+        # Set when settings["incremental"] is on: SheetFingerprints to record
+        # for the output workbook (every matched row is in sync once the
+        # changes are written) and for the unchanged input workbook
+        self.fingerprints = None
+        self.in_sync_fingerprints = None
+
+
+def _no_checkpoint():
+    pass
+
+
+def _unchanged_rows(result, matches, new_sheet, cols, signature, previous, profile, as_text=False):
+    """Fingerprint the matched new rows and return (fingerprints, unchanged mask)
+
+    A row whose key and fingerprint are in previous (the sidecar of the
+    old workbook, taken with the same signature) was already in sync with
+    an identical new row, so diffing it again cannot find a change.
+    """
+    fingerprints = fingerprint_rows(new_sheet, matches.new_rows, cols, as_text)
+    unchanged = np.zeros(len(matches), dtype=bool)
+    if previous is not None and previous.signature == signature:
+        unchanged = previous.unchanged(matches.key_hashes, fingerprints)
+        print(f"Skipping {int(unchanged.sum())} rows unchanged since the last run")
+    profile.lap("fingerprint", result.sheet_name)
+    profile.count("rows unchanged", int(unchanged.sum()), result.sheet_name)
+    return fingerprints, unchanged
+
+
+def _record_change_keys(result, matches):
+    """Set the key of each change from the matches (sorted by old row) it was diffed from"""
+    if not result.changes:
+        return
+    changed_rows = np.fromiter((change[0] for change in result.changes), dtype=np.int64,
+                               count=len(result.changes))
+    positions = np.searchsorted(matches.old_rows, changed_rows)
+    parts = []
+    for part in range(len(matches.store.values)):
+        values, codes = matches.part(part)
+        parts.append(values[codes[positions]])
+    result.change_keys = [" | ".join(key) for key in zip(*parts)]
+
+
+def _record_fingerprints(result, matches, signature, fingerprints):
+    """Set the fingerprints to save for the output and the input workbook"""
+    key_hashes = matches.key_hashes
+    changed = np.isin(matches.old_rows, [change[0] for change in result.changes])
+    result.fingerprints = SheetFingerprints(signature, key_hashes, fingerprints)
+    result.in_sync_fingerprints = SheetFingerprints(signature, key_hashes[~changed], fingerprints[~changed])
+
+
+def compare_keyed_sheet(old_sheet_raw, old_sheet_eval, new_sheet, formula_cells, settings,
+                        checkpoint=_no_checkpoint, profile=None, previous=None):
+    """Compare one sheet in standard mode (Team/App/Category keys) and list the changes
+
+    settings is a plain dict: header_row, team_column, app_name_column,
+    category_column, additional_criteria [(label, column name)], filters
+    [(label, ValueFilter)], formula_map ({sheet: {formula column: source
+    column}}) and incremental. Nothing is written to the sheets; the
+    caller applies result.changes. checkpoint()
+    is called between phases and raises JobCancelled to abandon the sheet.
+    Phase times and counters go to profile (a new RunProfile when not
+    given), which is returned as result.profile. With incremental on,
+    matched rows unchanged since previous (SheetFingerprints from the old
+    workbook's sidecar) are not diffed again.
+    """
+    result = SheetResult(old_sheet_raw.title)
+    result.profile = profile = profile if profile is not None else RunProfile()
+    sheet_name = result.sheet_name
+    header_row = settings["header_row"]
+    formula_map = settings["formula_map"].get(sheet_name, {})
+
+    # Create a mapping of column names to column indices
+    headers = {}
+    col_to_name = {}  # Reverse mapping
+    get_old = value_getter(old_sheet_raw)
+    for col in range(1, old_sheet_raw.max_column + 1):
+        cell_value = get_old(header_row, col)
+        if cell_value:
+            headers[cell_value] = col
+            col_to_name[col] = cell_value
+
+    # Set up the team/app/cat column indexes
+    key_col_indices = []
+    for setting, description in (("team_column", "Team"), ("app_name_column", "App name"),
+                                 ("category_column", "Category")):
+        column = settings[setting]
+        if column not in headers:
+            result.errors.append(f"{description} column '{column}' not found in headers.")
+            result.skipped = True
+            profile.lap("header map", sheet_name)
+            return result
+        key_col_indices.append(headers[column])
+
+    # Process additional criteria columns
+    additional_col_indices = []
+    for criteria_label, col_name in settings["additional_criteria"]:
+        if col_name in headers:
+            additional_col_indices.append((criteria_label, headers[col_name]))
+        elif col_name:  # Only report if a column was selected
+            result.errors.append(f"Additional criteria column '{col_name}' not found in headers.")
+    key_col_indices += [col_idx for _, col_idx in additional_col_indices]
+    profile.lap("header map", sheet_name)
+
+    # Build the key index of each sheet from whole key columns
+    # Old file uses evaluated values (formula results)
+    print(f"Processing {old_sheet_eval.max_row} rows in old sheet")
+    old_keys = KeyStore(old_sheet_eval, key_col_indices, header_row + 1, old_sheet_eval.max_row)
+    checkpoint()
+    print(f"Processing {new_sheet.max_row} rows in new sheet")
+    new_keys = KeyStore(new_sheet, key_col_indices, header_row + 1, new_sheet.max_row)
+    checkpoint()
+
+    # Hash join the two indexes into aligned (old_row, new_row) pairs
+    matches = old_keys.intersect(new_keys)
+    print(f"Found {len(old_keys)} keys in old file, {len(new_keys)} keys in new file")
+    print(f"Common keys before filtering: {len(matches)}")
+    profile.lap("key build", sheet_name)
+    profile.count("rows scanned", max(0, old_sheet_eval.max_row - header_row) +
+                  max(0, new_sheet.max_row - header_row), sheet_name)
+
+    # Apply filters if specified - use the EVALUATED values for filtering
+    # Key parts are team, app, category, then each additional criteria column found
+    part_for_label = {"Team": 0, "App Name": 1, "Category": 2}
+    for part, (criteria_label, _) in enumerate(additional_col_indices, start=3):
+        part_for_label.setdefault(criteria_label, part)
+    key_filter = KeyFilter((part_for_label[label], value_filter)
+                           for label, value_filter in settings["filters"]
+                           if label in part_for_label)
+    if key_filter:
+        matches = matches[key_filter.mask(matches)]
+
+    print(f"Keys after filtering: {len(matches)}")
+    result.matched_rows = len(matches)
+    profile.lap("filter", sheet_name)
+    profile.count("keys matched", len(matches), sheet_name)
+    checkpoint()
+    print(f"Detected {len(formula_cells)} formula cells to preserve")
+
+    # Create a set of formula columns to avoid
+    formula_columns = set()
+    for formula_col, src_col in formula_map.items():
+        if formula_col in headers:
+            formula_columns.add(headers[formula_col])
+            print(f"Excluding formula column: {formula_col} (column {headers[formula_col]})")
+
+    # Matched rows in old-sheet order, aligned with their new-sheet rows
+    matches = matches.sorted_by_old_row()
+    old_rows = matches.old_rows
+    new_rows = matches.new_rows
+
+    # Only named columns present in both sheets are compared
+    compare_cols = [col for col in range(1, min(old_sheet_raw.max_column, new_sheet.max_column) + 1)
+                    if col in col_to_name]
+
+    # Rows unchanged since the last run of this workbook need no diff
+    if settings.get("incremental"):
+        signature = ["standard", header_row, key_col_indices, compare_cols, sorted(formula_columns)]
+        fingerprints, unchanged = _unchanged_rows(result, matches, new_sheet, compare_cols,
+                                                  signature, previous, profile)
+        old_rows, new_rows = old_rows[~unchanged], new_rows[~unchanged]
+        checkpoint()
+
+    # Diff the matched rows block by block
+    for block in diff_matched_rows(old_sheet_raw, new_sheet, old_rows, new_rows, compare_cols,
+                                   formula_cells, skip_cols=formula_columns):
+        checkpoint()
+        result.skipped_formula += block.skipped_formula
+        result.changes.extend(block.changes())
+    _record_change_keys(result, matches)
+    profile.lap("diff", sheet_name)
+    if settings.get("incremental"):
+        _record_fingerprints(result, matches, signature, fingerprints)
+    profile.count("cells compared", len(old_rows) * len(compare_cols) - result.skipped_formula, sheet_name)
+    profile.count("formula cells skipped", result.skipped_formula, sheet_name)
+    return result
+
+
+def compare_custom_sheet(old_sheet_raw, old_sheet_eval, new_sheet, formula_cells, settings,
+                         checkpoint=_no_checkpoint, profile=None, previous=None):
+    """Compare one sheet in custom mode (user-chosen key columns) and list the changes
+
+    settings is a plain dict: header_row, key_columns (header names),
+    key_filter (KeyFilter over the key parts), formula_map (per sheet, as
+    in compare_keyed_sheet) and incremental. Values are compared as text
+    and the key columns themselves are never changed. Nothing is written to the sheets; the
+    caller applies result.changes.
+    """
+    result = SheetResult(old_sheet_raw.title)
+    result.profile = profile = profile if profile is not None else RunProfile()
+    sheet_name = result.sheet_name
+    header_row = settings["header_row"]
+    key_columns = settings["key_columns"]
+    key_filter = settings["key_filter"]
+
+    # Create column mappings from header row
+    headers = {}
+    col_to_name = {}
+    get_old = value_getter(old_sheet_raw)
+    for col in range(1, old_sheet_raw.max_column + 1):
+        cell_value = get_old(header_row, col)
+        if cell_value:
+            headers[str(cell_value)] = col
+            col_to_name[col] = str(cell_value)
+
+    # Print found headers for debugging
+    print(f"Found {len(headers)} headers in sheet {sheet_name}")
+
+    # Validate all key columns exist in the headers
+    missing_columns = [col for col in key_columns if col not in headers]
+    profile.lap("header map", sheet_name)
+    if missing_columns:
+        result.errors.append(f"Key column(s) not found in sheet '{sheet_name}': {', '.join(missing_columns)}")
+        result.skipped = True
+        return result
+
+    key_col_indices = [headers[key_col] for key_col in key_columns]
+
+    # Build the key index of each sheet from whole key columns
+    # Numbers are normalized without a decimal part for whole values
+    # Old file uses evaluated values (formula results)
+    print(f"Processing {old_sheet_eval.max_row - header_row} rows in old sheet")
+    old_keys = KeyStore(old_sheet_eval, key_col_indices, header_row + 1,
+                        old_sheet_eval.max_row, numeric_as_int=True)
+    print(f"Processing {new_sheet.max_row - header_row} rows in new sheet")
+    new_keys = KeyStore(new_sheet, key_col_indices, header_row + 1,
+                        new_sheet.max_row, numeric_as_int=True)
+    checkpoint()
+
+    # Hash join the two indexes into aligned (old_row, new_row) pairs
+    matches = old_keys.intersect(new_keys)
+    print(f"Found {len(old_keys)} keys in old file, {len(new_keys)} keys in new file")
+    profile.lap("key build", sheet_name)
+    profile.count("rows scanned", max(0, old_sheet_eval.max_row - header_row) +
+                  max(0, new_sheet.max_row - header_row), sheet_name)
+    print(f"Common keys before filtering: {len(matches)}")
+
+    # Apply filters if specified
+    if key_filter:
+        matches = matches[key_filter.mask(matches)]
+
+    print(f"Keys after filtering: {len(matches)}")
+    result.matched_rows = len(matches)
+    profile.lap("filter", sheet_name)
+    profile.count("keys matched", len(matches), sheet_name)
+    checkpoint()
+
+    # If no keys match after filtering, inform the user but continue with other sheets
+    if not len(matches):
+        print(f"No matching rows found in sheet {sheet_name} after applying filters")
+        return result
+
+    print(f"Detected {len(formula_cells)} formula cells to preserve")
+
+    # Create a set of formula columns to avoid
+    formula_columns = set()
+    for formula_col, src_col in settings["formula_map"].get(sheet_name, {}).items():
+        if formula_col in headers:
+            formula_columns.add(headers[formula_col])
+            print(f"Will preserve formula column: {formula_col}")
+
+    # Matched rows in old-sheet order, aligned with their new-sheet rows
+    matches = matches.sorted_by_old_row()
+    old_rows = matches.old_rows
+    new_rows = matches.new_rows
+
+    # Compare named columns except the key columns themselves
+    compare_cols = [col for col in range(1, min(old_sheet_raw.max_column, new_sheet.max_column) + 1)
+                    if col in col_to_name and col_to_name[col] not in key_columns]
+
+    # Rows unchanged since the last run of this workbook need no diff
+    if settings.get("incremental"):
+        signature = ["custom", header_row, key_col_indices, compare_cols, sorted(formula_columns)]
+        fingerprints, unchanged = _unchanged_rows(result, matches, new_sheet, compare_cols,
+                                                  signature, previous, profile, as_text=True)
+        old_rows, new_rows = old_rows[~unchanged], new_rows[~unchanged]
+        checkpoint()
+
+    # Diff the matched rows block by block, comparing values as text
+    for block in diff_matched_rows(old_sheet_raw, new_sheet, old_rows, new_rows, compare_cols,
+                                   formula_cells, skip_cols=formula_columns, as_text=True):
+        checkpoint()
+        result.skipped_formula += block.skipped_formula
+        for change in block.changes():
+            # Debug for first few cell updates
+            if len(result.changes) < 3:
+                old_row, _, col, old_value, new_value = change
+                print(f"Updating cell ({old_row}, {col}) {col_to_name[col]}: '{old_value}' -> '{new_value}'")
+            result.changes.append(change)
+    _record_change_keys(result, matches)
+    profile.lap("diff", sheet_name)
+    if settings.get("incremental"):
+        _record_fingerprints(result, matches, signature, fingerprints)
+    profile.count("cells compared", len(old_rows) * len(compare_cols) - result.skipped_formula, sheet_name)
+    profile.count("formula cells skipped", result.skipped_formula, sheet_name)
+    return result
+
+
+class TransposedSheet(ValueSheet):
+    """A sheet with rows and columns swapped
+
+    Sheets laid out with one column per record read like ordinary
+    one-row-per-record sheets through this view, so the row-based mode
+    runs on the same key store and block diff as the other modes.
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.title = sheet.title
+        self._get = value_getter(sheet)
+
+    @property
+    def max_row(self):
+        return self.sheet.max_column
+
+    @property
+    def max_column(self):
+        return self.sheet.max_row
+
+    def value(self, row, column):
+        return self._get(column, row)
+
+    def read_block(self, rows, cols):
+        return read_block(self.sheet, cols, rows).T
+
+
+class _TransposedCells:
+    """A FormulaIndex seen through TransposedSheet"""
+
+    def __init__(self, cells):
+        self.cells = cells
+
+    def __len__(self):
+        return len(self.cells)
+
+    def mask(self, rows, cols):
+        return self.cells.mask(cols, rows).T
+
+
+def _merged_followers(sheet):
+    """FormulaIndex-style bitmap of the merged cells other than each range's top-left cell"""
+    rows, cols = [], []
+    for merged_range in getattr(getattr(sheet, "merged_cells", None), "ranges", ()):
+        for row in range(merged_range.min_row, merged_range.max_row + 1):
+            for col in range(merged_range.min_col, merged_range.max_col + 1):
+                if (row, col) != (merged_range.min_row, merged_range.min_col):
+                    rows.append(row)
+                    cols.append(col)
+    return FormulaIndex(rows, cols)
+
+
+def compare_transposed_sheet(old_sheet_raw, old_sheet_eval, new_sheet, formula_cells, settings,
+                             checkpoint=_no_checkpoint, profile=None, previous=None):
+    """Compare one sheet in row-based mode (one column per record) and list the changes
+
+    settings is a plain dict: key_rows (the team, app name and category
+    rows) and filters [(label, ValueFilter)]. Columns are matched on the
+    values in the key rows with a hash join over the transposed sheets,
+    then every other row shared by both sheets is compared. Only
+    non-empty new values are copied, and cells inside a merged range
+    other than its top-left cell are left alone. result.changes are in
+    sheet coordinates, in row order. previous is accepted so the modes
+    can be called alike; row-based runs keep no fingerprints.
+    """
+    result = SheetResult(old_sheet_raw.title)
+    result.transposed = True
+    result.profile = profile = profile if profile is not None else RunProfile()
+    sheet_name = result.sheet_name
+    key_rows = settings["key_rows"]
+    old_view = TransposedSheet(old_sheet_raw)
+    new_view = TransposedSheet(new_sheet)
+
+    # Build the key index of each sheet from whole key rows
+    # Old file uses evaluated values (formula results)
+    print(f"Processing {old_sheet_eval.max_column} columns in old sheet")
+    old_keys = KeyStore(TransposedSheet(old_sheet_eval), key_rows, 1, old_sheet_eval.max_column)
+    checkpoint()
+    print(f"Processing {new_sheet.max_column} columns in new sheet")
+    new_keys = KeyStore(new_view, key_rows, 1, new_sheet.max_column)
+    checkpoint()
+
+    # Hash join the two indexes into aligned (old column, new column) pairs
+    matches = old_keys.intersect(new_keys)
+    print(f"Found {len(old_keys)} keys in old file, {len(new_keys)} keys in new file")
+    print(f"Common keys before filtering: {len(matches)}")
+    profile.lap("key build", sheet_name)
+    profile.count("rows scanned", old_sheet_eval.max_column + new_sheet.max_column, sheet_name)
+
+    part_for_label = {"Team": 0, "App Name": 1, "Category": 2}
+    key_filter = KeyFilter((part_for_label[label], value_filter)
+                           for label, value_filter in settings["filters"]
+                           if label in part_for_label)
+    if key_filter:
+        matches = matches[key_filter.mask(matches)]
+
+    print(f"Keys after filtering: {len(matches)}")
+    result.matched_rows = len(matches)
+    profile.lap("filter", sheet_name)
+    profile.count("keys matched", len(matches), sheet_name)
+    checkpoint()
+
+    # Every row present in both sheets except the key rows themselves
+    matches = matches.sorted_by_old_row()
+    compare_rows = [row for row in range(1, min(old_sheet_raw.max_row, new_sheet.max_row) + 1)
+                    if row not in key_rows]
+    merged = _merged_followers(old_sheet_raw)
+
+    # One changed-cell mask per block of records, over every compared row at once
+    changes = []
+    for block in diff_matched_rows(old_view, new_view, matches.old_rows, matches.new_rows, compare_rows,
+                                   _TransposedCells(formula_cells)):
+        checkpoint()
+        result.skipped_formula += block.skipped_formula
+        if block.changed.any():
+            block.changed &= _is_present(block.new_values).astype(bool)
+            block.changed &= ~merged.mask(block.cols, block.old_rows).T
+        changes.extend(block.changes())
+    result.changes = changes
+    _record_change_keys(result, matches)
+
+    # Back to sheet coordinates, in row order for writing
+    order = sorted(range(len(changes)), key=lambda i: (changes[i][2], changes[i][0]))
+    result.changes = [(changes[i][2], changes[i][2], changes[i][0], changes[i][3], changes[i][4]) for i in order]
+    result.change_keys = [result.change_keys[i] for i in order]
+    profile.lap("diff", sheet_name)
+    profile.count("cells compared", len(matches) * len(compare_rows) - result.skipped_formula, sheet_name)
+    profile.count("formula cells skipped", result.skipped_formula, sheet_name)
+    return result
+
+
+def init_worker(cancel_event):
+    """Process-pool initializer: remember the event that cancels the run"""
+    global _worker_cancel_event
+    _worker_cancel_event = cancel_event
+
+
+def _worker_checkpoint():
+    if _worker_cancel_event is not None and _worker_cancel_event.is_set():
+        raise JobCancelled("worker")
+
+
+def compare_keyed_sheet_file(old_file, new_file, sheet_name, settings, old_digest=None):
+    """Process-pool entry point: parse one sheet of each file and compare it"""
+    profile = RunProfile()
+    old_sheet_raw, old_sheet_eval = read_sheet_views(old_file, sheet_name)
+    _worker_checkpoint()
+    streamed = settings.get("memory_limit_mb") and not is_delimited(new_file)
+    if is_delimited(new_file):
+        # CSV/TSV columns go under the old sheet's columns of the same name
+        get_old = value_getter(old_sheet_raw)
+        headers = {sheet_name: [get_old(settings["header_row"], col) for col in range(1, old_sheet_raw.max_column + 1)]}
+        new_sheet = read_csv_workbook(new_file, [sheet_name], settings["header_row"], headers,
+                                      _worker_checkpoint)[sheet_name]
+    elif streamed:
+        # Low-memory mode: one read-only pass, spilled to disk past the limit
+        new_sheet = stream_sheet(new_file, sheet_name, settings["memory_limit_mb"], _worker_checkpoint)
+    else:
+        # Evaluated values only, of the columns named in the old sheet
+        new_sheet = read_value_workbook(
+            new_file, [sheet_name], {sheet_name: header_columns(old_sheet_raw, settings["header_row"])})[sheet_name]
+    try:
+        profile.lap("load", sheet_name)
+        _worker_checkpoint()
+        formula_cells = formula_index(old_file, sheet_name, old_digest)
+        profile.lap("formula scan", sheet_name)
+        previous = None
+        if settings.get("incremental"):
+            previous = load_sidecar(old_file, old_digest or file_digest(old_file)).get(sheet_name)
+        result = compare_keyed_sheet(old_sheet_raw, old_sheet_eval, new_sheet, formula_cells, settings,
+                                     checkpoint=_worker_checkpoint, profile=profile, previous=previous)
+        if not streamed:
+            # The main process never loads the new file, so comments to copy over travel with the result
+            comments = getattr(new_sheet, "comments", {})
+            result.comments = {(new_row, col): comments[new_row, col]
+                               for _, new_row, col, _, _ in result.changes if (new_row, col) in comments}
+        return result
+    finally:
+        if streamed:
+            new_sheet.close()
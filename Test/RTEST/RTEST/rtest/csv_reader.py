@@ -0,0 +1,156 @@
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+from xlsx_reader import GridSheet, ValueWorkbook
+
+
+# Delimiter of each delimited text extension the compare accepts
+DELIMITERS = {".csv": ",", ".tsv": "\t"}
+
+# Lines parsed per chunk
+CSV_CHUNK_ROWS = 100000
+
+# Text Excel turns into a date when it opens a CSV (ISO dates, optionally with a time)
+_ISO_DATE = r"^\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$"
+_BOOLEANS = {"TRUE": True, "True": True, "true": True, "FALSE": False, "False": False, "false": False}
+
+# Whole numbers up to this size are read as int, as openpyxl reads them from an xlsx
+_MAX_EXACT = 2 ** 53
+
+
+def is_delimited(filename):
+    """Whether a file is read as delimited text (CSV/TSV) rather than as a workbook"""
+    return os.path.splitext(filename)[1].lower() in DELIMITERS
+
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _numbers(numbers):
+    """Object array of floats, with whole numbers as int and NaN as None"""
+    values = np.full(len(numbers), None, dtype=object)
+    present = ~np.isnan(numbers)
+    whole = present & (np.abs(numbers) < _MAX_EXACT)
+    whole[whole] = numbers[whole] == np.trunc(numbers[whole])
+    values[whole] = _object_array(numbers[whole].astype(np.int64).tolist())
+    fraction = present & ~whole
+    values[fraction] = _object_array(numbers[fraction].tolist())
+    return values
+
+
+def cell_values(column):
+    """Object array of cell values for one parsed column of a CSV chunk, typed the way Excel reads it
+
+    Empty fields are None, numbers are int (whole) or float, TRUE/FALSE
+    are bools and ISO dates are datetimes; everything else stays text.
+    Columns the parser already read as numbers or bools need no per-cell
+    work.
+    """
+    kind = column.dtype.kind
+    if kind == "b":
+        return _object_array(column.tolist())
+    if kind in "iu":
+        return _numbers(column.to_numpy(dtype=float)) if kind == "u" else _object_array(column.tolist())
+    if kind == "f":
+        return _numbers(column.to_numpy(dtype=float))
+
+    text = pd.Series(column.to_numpy(dtype=object), dtype=object)
+    present = text.notna().to_numpy()
+    values = np.full(len(text), None, dtype=object)
+    values[present] = text[present].to_numpy()
+    numbers = pd.to_numeric(text, errors="coerce").to_numpy(dtype=float)
+    is_number = np.isfinite(numbers)
+    values[is_number] = _numbers(numbers[is_number])
+
+    rest = present & ~is_number
+    if rest.any():
+        flags = text.map(_BOOLEANS).to_numpy()
+        is_flag = rest & pd.notna(flags)
+        values[is_flag] = flags[is_flag]
+        is_date = rest & ~is_flag & text.where(rest, "").str.match(_ISO_DATE).to_numpy()
+        if is_date.any():
+            dates = pd.to_datetime(text[is_date], format="ISO8601", errors="coerce")
+            parsed = dates.notna().to_numpy()
+            positions = np.flatnonzero(is_date)[parsed]
+            values[positions] = _object_array(dates[parsed].dt.to_pydatetime().tolist())
+    return values
+
+
+def _header_line(filename, delimiter):
+    with open(filename, newline="", encoding="utf-8-sig") as fh:
+        return next(csv.reader(fh, delimiter=delimiter), [])
+
+
+def read_csv_columns(filename, checkpoint=None):
+    """(header names, typed column arrays) of a CSV/TSV file, parsed in chunks of CSV_CHUNK_ROWS lines
+
+    The first line holds the headers. Lines longer than it are an error.
+    checkpoint() is called after every chunk.
+    """
+    delimiter = DELIMITERS[os.path.splitext(filename)[1].lower()]
+    headers = _header_line(filename, delimiter)
+    chunks = [[] for _ in headers]
+    if headers:
+        # Only empty fields are missing; the parser types whole numeric and boolean columns itself
+        reader = pd.read_csv(filename, sep=delimiter, header=None, names=range(len(headers)), index_col=False,
+                             skiprows=1, keep_default_na=False, na_values=[""], true_values=["TRUE", "True", "true"],
+                             false_values=["FALSE", "False", "false"], encoding="utf-8-sig",
+                             chunksize=CSV_CHUNK_ROWS)
+        with reader:
+            for chunk in reader:
+                for values, (_, column) in zip(chunks, chunk.items()):
+                    values.append(cell_values(column))
+                if checkpoint is not None:
+                    checkpoint()
+    columns = [np.concatenate(column) if column else np.empty(0, dtype=object) for column in chunks]
+    return [header.strip() for header in headers], columns
+
+
+def _grid_sheet(title, headers, columns, header_row, names):
+    """GridSheet with the CSV header line at header_row and its lines below
+
+    names lists the header of each sheet column (None where empty). CSV
+    columns go under the sheet columns of the same name; when no name
+    matches they are laid out from column A.
+    """
+    targets = {}
+    for position, name in enumerate(names or (), start=1):
+        if name not in (None, ""):
+            targets.setdefault(str(name).strip(), []).append(position)
+    placed = [(col, i) for i, header in enumerate(headers) for col in targets.get(header, ())]
+    if not placed:
+        if names:
+            print(f"No CSV header matches a column of sheet {title}, laying the CSV out from column A")
+        placed = [(i + 1, i) for i in range(len(headers))]
+    placed = sorted(dict(placed).items())  # One CSV column per sheet column; the first match wins
+
+    line_count = len(columns[0]) if columns else 0
+    stored = np.array([col for col, _ in placed], dtype=np.int64)
+    grid = np.full((header_row + line_count, len(placed)), None, dtype=object)
+    for position, (_, i) in enumerate(placed):
+        grid[header_row - 1, position] = headers[i] or None
+        grid[header_row:, position] = columns[i]
+    max_column = int(stored.max()) if len(stored) else 1
+    return GridSheet(title, grid, stored, len(grid), max_column)
+
+
+def read_csv_workbook(filename, sheet_names, header_row=None, sheet_headers=None, checkpoint=None):
+    """ValueWorkbook that gives the rows of a CSV/TSV file as each of sheet_names
+
+    The file is parsed once. With a header_row, its header line lands on
+    that row of every sheet, and sheet_headers ({sheet: header of each
+    column}, as probe_header_row() reads them from the old workbook) puts
+    every CSV column under the sheet column of the same name. Without one
+    (row-based runs) the lines start at row 1, columns from A.
+    """
+    headers, columns = read_csv_columns(filename, checkpoint)
+    sheet_headers = sheet_headers or {}
+    return ValueWorkbook([_grid_sheet(sheet_name, headers, columns, header_row or 1,
+                                      sheet_headers.get(sheet_name) if header_row else None)
+                          for sheet_name in sheet_names])
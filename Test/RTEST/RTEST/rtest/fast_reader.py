@@ -0,0 +1,151 @@
+import posixpath
+from collections import namedtuple
+from xml.etree.ElementTree import iterparse
+
+from openpyxl.cell.text import Text
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+from openpyxl.xml.constants import SHEET_MAIN_NS, PKG_REL_NS
+from openpyxl.xml.functions import fromstring
+
+
+_ROW_TAG = '{%s}row' % SHEET_MAIN_NS
+_VALUE_TAG = '{%s}v' % SHEET_MAIN_NS
+_INLINE_TAG = '{%s}is' % SHEET_MAIN_NS
+_MERGE_TAG = '{%s}mergeCell' % SHEET_MAIN_NS
+_WORKBOOK_PR_TAG = '{%s}workbookPr' % SHEET_MAIN_NS
+_REL_TAG = '{%s}Relationship' % PKG_REL_NS
+
+_DIGITS = '0123456789'
+
+# Workbook-wide tables every cell value is decoded with
+ValueContext = namedtuple("ValueContext", ["shared_strings", "date_formats", "timedelta_formats", "epoch"])
+
+
+def _workbook_part(archive, rel_type):
+    """Name of the workbook part related with rel_type (e.g. "/sharedStrings"), or None"""
+    with archive.open('xl/_rels/workbook.xml.rels') as fh:
+        for _, element in iterparse(fh):
+            if element.tag == _REL_TAG and element.get('Type', '').endswith(rel_type):
+                target = element.get('Target')
+                if target.startswith('/'):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join('xl', target))
+                return target if target in archive.NameToInfo else None
+    return None
+
+
+def value_context(archive):
+    """ValueContext of an open xlsx zip: shared strings decoded once, date styles and epoch"""
+    part = _workbook_part(archive, '/sharedStrings')
+    shared_strings = []
+    if part is not None:
+        with archive.open(part) as fh:
+            shared_strings = read_string_table(fh)
+
+    date_formats = timedelta_formats = frozenset()
+    part = _workbook_part(archive, '/styles')
+    if part is not None:
+        # Small next to the sheets; openpyxl works out which styles are dates
+        stylesheet = Stylesheet.from_tree(fromstring(archive.read(part)))
+        date_formats = frozenset(stylesheet.date_formats)
+        timedelta_formats = frozenset(stylesheet.timedelta_formats)
+
+    epoch = CALENDAR_WINDOWS_1900
+    with archive.open('xl/workbook.xml') as fh:
+        for _, element in iterparse(fh):
+            if element.tag == _WORKBOOK_PR_TAG:
+                if element.get('date1904') in ('1', 'true'):
+                    epoch = CALENDAR_MAC_1904
+                break
+    return ValueContext(shared_strings, date_formats, timedelta_formats, epoch)
+
+
+class FastSheetReader:
+    """Values-only reader for one worksheet part, without any cell objects
+
+    rows() walks the XML once with iterparse and yields (row number,
+    tuple of values from column A on) for every row holding cells. Values
+    are decoded as load_workbook(data_only=True) decodes them. With
+    columns (a set of column indices) the other cells are left as None
+    without being decoded. Once rows() is exhausted, merged lists the
+    merged ranges as (min_row, min_col, max_row, max_col) and max_column
+    is the widest row, skipped cells included.
+    """
+
+    def __init__(self, source, context, columns=None):
+        self.source = source
+        self.context = context
+        self.columns = columns
+        self.merged = []
+        self.max_column = 0
+        self._column_cache = {}
+
+    def _column(self, ref):
+        letters = ref.rstrip(_DIGITS)
+        col = self._column_cache.get(letters)
+        if col is None:
+            col = self._column_cache[letters] = column_index_from_string(letters)
+        return col
+
+    def _decode(self, cell, data_type):
+        value = None
+        inline = None
+        for child in cell:
+            if child.tag == _VALUE_TAG:
+                value = child.text or None
+            elif child.tag == _INLINE_TAG:
+                inline = child
+        if data_type == 'inlineStr':
+            return Text.from_tree(inline).content if inline is not None else None
+        if value is None:
+            return None
+        if data_type == 'n':
+            value = float(value) if '.' in value or 'E' in value or 'e' in value else int(value)
+            style_id = cell.get('s')
+            if style_id and int(style_id) in self.context.date_formats:
+                try:
+                    return from_excel(value, self.context.epoch,
+                                      timedelta=int(style_id) in self.context.timedelta_formats)
+                except (OverflowError, ValueError):
+                    return "#VALUE!"
+            return value
+        if data_type == 's':
+            return self.context.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        return value  # str (cached formula text) and e (error codes)
+
+    def rows(self):
+        columns = self.columns
+        row_counter = 0
+        for _, element in iterparse(self.source):
+            tag = element.tag
+            if tag == _ROW_TAG:
+                r = element.get('r')
+                row_counter = int(r) if r else row_counter + 1
+                values = {}
+                col = 0
+                for cell in element:
+                    ref = cell.get('r')
+                    col = self._column(ref) if ref else col + 1
+                    if columns is None or col in columns:
+                        values[col] = self._decode(cell, cell.get('t', 'n'))
+                    else:
+                        values.setdefault(col, None)  # Still counts towards the width
+                element.clear()
+                if values:
+                    width = max(values)
+                    self.max_column = max(self.max_column, width)
+                    row = [None] * width
+                    for col, value in values.items():
+                        row[col - 1] = value
+                    yield row_counter, tuple(row)
+            elif tag == _MERGE_TAG:
+                min_col, min_row, max_col, max_row = range_boundaries(element.get('ref'))
+                self.merged.append((min_row, min_col, max_row, max_col))
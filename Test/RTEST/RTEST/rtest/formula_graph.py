@@ -0,0 +1,272 @@
+import re
+import threading
+import zipfile
+from collections import Counter, OrderedDict
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+import pandas as pd
+from openpyxl.formula import Tokenizer
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple
+from openpyxl.xml.constants import SHEET_MAIN_NS
+
+from xlsx_reader import file_digest, sheet_parts
+
+
+_CELL_TAG = '{%s}c' % SHEET_MAIN_NS
+_ROW_TAG = '{%s}row' % SHEET_MAIN_NS
+_FORMULA_TAG = '{%s}f' % SHEET_MAIN_NS
+
+# One side of a range: optional $ and column letters, optional $ and row number
+_REF_PART = re.compile(r"^(\$?)([A-Za-z]{1,3})?(\$?)(\d+)?$")
+
+# Graphs already built, keyed by (file digest, sheet name)
+_GRAPH_CACHE_SIZE = 32
+_graph_cache = OrderedDict()
+_graph_lock = threading.Lock()
+
+
+def _parse_part(text):
+    """(col, col absolute, row, row absolute) of one side of a range; 0 for a missing col or row"""
+    match = _REF_PART.match(text)
+    if not match or not (match.group(2) or match.group(4)):
+        return None
+    col_abs, letters, row_abs, digits = match.groups()
+    col = column_index_from_string(letters.upper()) if letters else 0
+    return col, bool(col_abs), int(digits) if digits else 0, bool(row_abs)
+
+
+def parse_reference(text):
+    """Split a RANGE operand into (sheet or None, first part, last part)
+
+    Parts are (col, col absolute, row, row absolute); whole columns have
+    row 0 and whole rows have col 0. Returns None for defined names,
+    table references and links to other workbooks.
+    """
+    sheet = None
+    if "!" in text:
+        sheet, _, text = text.rpartition("!")
+        if sheet.startswith("'") and sheet.endswith("'"):
+            sheet = sheet[1:-1].replace("''", "'")
+        if sheet.startswith("["):
+            return None
+    first_text, colon, last_text = text.partition(":")
+    first = _parse_part(first_text)
+    last = _parse_part(last_text) if colon else first
+    if first is None or last is None:
+        return None
+    if not colon and not (first[0] and first[2]):
+        return None  # A lone name such as Rate, not a column
+    if colon and (bool(first[0]) != bool(last[0]) or bool(first[2]) != bool(last[2])):
+        return None
+    return sheet, first, last
+
+
+def formula_references(formula):
+    """Every cell or range reference in a formula, as parse_reference() tuples"""
+    if not formula.startswith("="):
+        formula = "=" + formula
+    references = []
+    try:
+        items = Tokenizer(formula).items
+    except Exception:
+        return references
+    for item in items:
+        if item.type == "OPERAND" and item.subtype == "RANGE":
+            reference = parse_reference(item.value)
+            if reference is not None:
+                references.append(reference)
+    return references
+
+
+def _shift(part, rows, cols):
+    col, col_abs, row, row_abs = part
+    if col and not col_abs:
+        col += cols
+    if row and not row_abs:
+        row += rows
+    return col, col_abs, row, row_abs
+
+
+class SheetFormulaGraph:
+    """Cell-level dependency graph of the formulas in one sheet
+
+    Stored as parallel int32 edge arrays: the formula cell (row, col) and
+    the range it reads, in ref_sheet (an index into sheet_names) with
+    bounds ref_min_row..ref_max_row and ref_min_col..ref_max_col, where 0
+    means unbounded (whole columns or whole rows).
+    """
+
+    def __init__(self, sheet_name, sheet_names, edges):
+        self.sheet_name = sheet_name
+        self.sheet_names = list(sheet_names)
+        columns = list(zip(*edges)) if edges else [()] * 7
+        (self.rows, self.cols, self.ref_sheet, self.ref_min_row, self.ref_min_col,
+         self.ref_max_row, self.ref_max_col) = (np.asarray(column, dtype=np.int32) for column in columns)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def precedents(self, row, col):
+        """(sheet name, min_row, min_col, max_row, max_col) of every range a formula cell reads"""
+        hits = np.flatnonzero((self.rows == row) & (self.cols == col))
+        return [(self.sheet_names[self.ref_sheet[i]], int(self.ref_min_row[i]), int(self.ref_min_col[i]),
+                 int(self.ref_max_row[i]), int(self.ref_max_col[i])) for i in hits]
+
+    def dependents(self, sheet_name, row, col):
+        """Formula cells of this sheet that read the given cell"""
+        if sheet_name not in self.sheet_names:
+            return []
+        hit = ((self.ref_sheet == self.sheet_names.index(sheet_name))
+               & ((self.ref_min_row == 0) | ((self.ref_min_row <= row) & (row <= self.ref_max_row)))
+               & ((self.ref_min_col == 0) | ((self.ref_min_col <= col) & (col <= self.ref_max_col))))
+        return sorted(set(zip(self.rows[hit].tolist(), self.cols[hit].tolist())))
+
+    def column_precedents(self, first_row=1):
+        """Column-level graph: formula column -> Counter of (sheet name, column) it reads
+
+        Only formula cells from first_row down are counted, and each cell
+        counts a column once however often it refers to it.
+        """
+        # Whole-row references do not point at a column
+        edges = np.flatnonzero((self.rows >= first_row) & (self.ref_min_col > 0))
+        graph = {}
+        if not len(edges):
+            return graph
+        # One entry per column a range covers
+        widths = (self.ref_max_col[edges] - self.ref_min_col[edges] + 1).astype(np.int64)
+        spread = np.repeat(edges, widths)
+        offsets = np.arange(len(spread)) - np.repeat(np.cumsum(widths) - widths, widths)
+        pairs = np.unique(np.stack([self.rows[spread], self.cols[spread], self.ref_sheet[spread],
+                                    self.ref_min_col[spread] + offsets], axis=1), axis=0)
+        links, counts = np.unique(pairs[:, 1:], axis=0, return_counts=True)
+        for (col, ref_sheet, ref_col), count in zip(links.tolist(), counts.tolist()):
+            graph.setdefault(col, Counter())[(self.sheet_names[ref_sheet], ref_col)] = count
+        return graph
+
+    def column_relationships(self, headers, header_row, min_count=2):
+        """{formula column header: source column header} for columns that copy or transform another column
+
+        headers maps column index -> header name. Only formula cells that
+        read single cells of one other column of this sheet, and nothing
+        else, count (=B5, =UPPER(B5), =TRIM(B5)&""); a column maps to the
+        source most of its cells read, once at least min_count cells do.
+        """
+        frame = pd.DataFrame({"row": self.rows, "col": self.cols, "ref_col": self.ref_min_col,
+                              "simple": ((self.ref_sheet == self.sheet_names.index(self.sheet_name))
+                                         & (self.ref_min_row == self.ref_max_row) & (self.ref_min_row > 0)
+                                         & (self.ref_min_col == self.ref_max_col) & (self.ref_min_col > 0)
+                                         & (self.ref_min_col != self.cols))})
+        frame = frame[frame["row"] > header_row]
+        cells = frame.groupby(["row", "col"]).agg(simple=("simple", "all"), sources=("ref_col", "nunique"),
+                                                  ref_col=("ref_col", "first"))
+        cells = cells[cells["simple"] & (cells["sources"] == 1)].reset_index()
+        relationships = {}
+        for (col, ref_col), count in cells.groupby(["col", "ref_col"]).size().items():
+            if col in headers and ref_col in headers and count >= min_count:
+                best = relationships.get(headers[col])
+                if best is None or count > best[1]:
+                    relationships[headers[col]] = (headers[ref_col], count)
+        return {header: source for header, (source, _) in relationships.items()}
+
+
+def scan_formula_graph(source, sheet_name, sheet_names):
+    """Stream a worksheet XML part once and build its SheetFormulaGraph
+
+    Shared formulas are tokenized once at their anchor cell; the other
+    cells of the group reuse the parsed references, shifted the way Excel
+    shifts relative references.
+    """
+    edges = []
+    shared = {}  # si -> (anchor row, anchor col, references)
+    parsed = {}  # Formula text -> references, for formulas repeated verbatim
+    # Excel matches sheet names in formulas without regard to case
+    sheet_ids = {name.lower(): i for i, name in enumerate(sheet_names)}
+    row_counter = col_counter = 0
+    current = None
+    for event, element in iterparse(source, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if tag == _ROW_TAG:
+                r = element.get('r')
+                row_counter = int(r) if r else row_counter + 1
+                col_counter = 0
+            elif tag == _CELL_TAG:
+                ref = element.get('r')
+                if ref:
+                    current = coordinate_to_tuple(ref)
+                    col_counter = current[1]
+                else:
+                    col_counter += 1
+                    current = (row_counter, col_counter)
+            continue
+        if tag == _FORMULA_TAG:
+            row, col = current
+            text = element.text
+            if element.get('t') == 'shared':
+                si = element.get('si')
+                if text:
+                    references = parsed.get(text)
+                    if references is None:
+                        references = parsed[text] = formula_references(text)
+                    shared[si] = (row, col, references)
+                elif si in shared:
+                    anchor_row, anchor_col, anchor_refs = shared[si]
+                    rows, cols = row - anchor_row, col - anchor_col
+                    references = [(sheet, _shift(first, rows, cols), _shift(last, rows, cols))
+                                  for sheet, first, last in anchor_refs]
+                else:
+                    references = []
+            elif text:
+                references = parsed.get(text)
+                if references is None:
+                    references = parsed[text] = formula_references(text)
+            else:
+                references = []
+            for sheet, first, last in references:
+                ref_sheet = sheet_ids.get((sheet_name if sheet is None else sheet).lower())
+                if ref_sheet is None:
+                    continue
+                edges.append((row, col, ref_sheet, min(first[2], last[2]), min(first[0], last[0]),
+                              max(first[2], last[2]), max(first[0], last[0])))
+        elif tag == _ROW_TAG:
+            element.clear()
+    return SheetFormulaGraph(sheet_name, sheet_names, edges)
+
+
+def formula_graph(filename, sheet_names, digest=None):
+    """{sheet name: SheetFormulaGraph} for sheets of an xlsx file, cached by file content
+
+    Each sheet is read in one streaming pass over its XML. Graphs are
+    keyed by the content hash, so a rerun on the same file costs nothing
+    and a file saved since is always scanned again.
+    """
+    digest = digest or file_digest(filename)
+    graphs = {}
+    missing = []
+    with _graph_lock:
+        for sheet_name in sheet_names:
+            key = (digest, sheet_name)
+            if key in _graph_cache:
+                _graph_cache.move_to_end(key)
+                graphs[sheet_name] = _graph_cache[key]
+            else:
+                missing.append(sheet_name)
+    if not missing:
+        return graphs
+
+    with zipfile.ZipFile(filename) as archive:
+        parts = sheet_parts(archive)
+        for sheet_name in missing:
+            part = parts.get(sheet_name)
+            if part is None:
+                raise KeyError(f"Worksheet {sheet_name} does not exist.")
+            with archive.open(part) as fh:
+                graphs[sheet_name] = scan_formula_graph(fh, sheet_name, list(parts))
+
+    with _graph_lock:
+        for sheet_name in missing:
+            _graph_cache[(digest, sheet_name)] = graphs[sheet_name]
+        while len(_graph_cache) > _GRAPH_CACHE_SIZE:
+            _graph_cache.popitem(last=False)
+    return graphs
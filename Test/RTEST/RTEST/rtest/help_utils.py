@@ -182,6 +182,11 @@ FILTER LOGIC:
 • Multiple filters of the same type work as OR (any match passes)
 • Different filter types work as AND (all must match)
 • Empty filters are ignored (no filtering applied)
+• Matching ignores upper/lower case
+
+PATTERNS:
+• * matches any text and ? matches one character (e.g. "Dev*", "T?")
+• Start a value with re: to use a regular expression (e.g. "re:^web")
 
 Example: If you set Team filter to "Development" and App filter to "WebApp", 
 only rows with Team="Development" AND App="WebApp" will be processed.
@@ -275,6 +280,7 @@ Filter Logic:
 • Multiple values for the same column work as OR
 • Multiple column filters work as AND
 • Empty filters are ignored
+• Values may use * and ? wildcards, or re: for a regular expression
 
 Example:
 If you have key columns "Department" and "Status", you can:
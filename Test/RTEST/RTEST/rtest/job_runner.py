@@ -0,0 +1,138 @@
+import queue
+import threading
+import traceback
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint once the running job has been cancelled"""
+
+
+class Job:
+    """One queued unit of work with its own cancellation flag"""
+
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def checkpoint(self):
+        """Stop the job here if it has been cancelled"""
+        if self._cancelled.is_set():
+            raise JobCancelled(self.name)
+
+
+class JobRunner:
+    """Runs queued jobs one at a time on a background thread
+
+    Jobs never touch Tk directly. Variable updates are coalesced (only the
+    latest value per variable is kept) and applied on the Tk thread by an
+    after() poll at a fixed rate, and call_in_ui() runs dialogs there too.
+    """
+
+    def __init__(self, root, interval_ms=100):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.current = None
+        self._jobs = queue.Queue()
+        self._pending_vars = {}  # Tk variable name -> (variable, latest value), applied on the next poll
+        self._ui_calls = queue.Queue()
+        self._lock = threading.Lock()
+        self._ui_thread = threading.current_thread()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        self.root.after(self.interval_ms, self._poll)
+
+    def submit(self, name, target):
+        """Queue target(job) to run after the jobs already waiting"""
+        job = Job(name, target)
+        self._jobs.put(job)
+        return job
+
+    def cancel(self):
+        """Cancel the running job and drop everything still waiting"""
+        while True:
+            try:
+                self._jobs.get_nowait().cancel()
+            except queue.Empty:
+                break
+        job = self.current
+        if job is not None:
+            job.cancel()
+
+    @property
+    def busy(self):
+        return self.current is not None or not self._jobs.empty()
+
+    def checkpoint(self):
+        """Checkpoint of the job running on this thread, a no-op elsewhere"""
+        job = self.current
+        if job is not None and threading.current_thread() is self._worker:
+            job.checkpoint()
+
+    def set_var(self, var, value):
+        """Set a Tk variable from any thread; repeated updates are coalesced"""
+        if threading.current_thread() is self._ui_thread:
+            var.set(value)
+            return
+        with self._lock:
+            # Tk variables are unhashable, so they are keyed by their Tcl name
+            self._pending_vars[str(var)] = (var, value)
+
+    def call_in_ui(self, func, *args, **kwargs):
+        """Run func on the Tk thread and return its result (blocks the job meanwhile)"""
+        if threading.current_thread() is self._ui_thread:
+            return func(*args, **kwargs)
+        done = threading.Event()
+        outcome = {}
+
+        def call():
+            try:
+                outcome["result"] = func(*args, **kwargs)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        self._ui_calls.put(call)
+        done.wait()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job.cancelled:
+                continue
+            self.current = job
+            try:
+                job.target(job)
+            except JobCancelled:
+                print(f"Job cancelled: {job.name}")
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.current = None
+
+    def _poll(self):
+        """Apply coalesced variable updates and pending UI calls on the Tk thread"""
+        with self._lock:
+            pending, self._pending_vars = self._pending_vars, {}
+        try:
+            for var, value in pending.values():
+                var.set(value)
+            while True:
+                try:
+                    call = self._ui_calls.get_nowait()
+                except queue.Empty:
+                    break
+                call()
+        finally:
+            self.root.after(self.interval_ms, self._poll)
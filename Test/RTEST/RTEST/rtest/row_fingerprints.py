@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+# Sidecar next to a workbook: <workbook>.fingerprints.npz
+SIDECAR_SUFFIX = ".fingerprints.npz"
+
+_HASH_PRIME = np.uint64(0x100000001B3)
+
+# Type-tagged text, so 1 and "1" get different fingerprints when values are compared raw
+_typed_text = np.frompyfunc(lambda v: "" if v is None else f"{type(v).__name__}:{v}", 1, 1)
+_plain_text = np.frompyfunc(lambda v: "" if v is None else str(v), 1, 1)
+
+
+def block_fingerprints(values, as_text=False):
+    """64-bit fingerprint of each row of a 2-D object matrix of cell values"""
+    fingerprints = np.zeros(values.shape[0], dtype=np.uint64)
+    if not values.size:
+        return fingerprints
+    text = (_plain_text if as_text else _typed_text)(values)
+    for j in range(values.shape[1]):
+        column = pd.util.hash_array(text[:, j].astype(object), categorize=True)
+        fingerprints = fingerprints * _HASH_PRIME ^ column
+    return fingerprints
+
+
+class SheetFingerprints:
+    """Row fingerprints of one sheet, keyed by the 64-bit hash of each row's key
+
+    signature describes how they were taken (mode, header row, key and
+    compared columns); fingerprints only compare equal between runs with
+    the same signature. Key hashes that occur more than once are dropped,
+    so an ambiguous key is always treated as changed.
+    """
+
+    def __init__(self, signature, key_hashes, fingerprints):
+        key_hashes = np.asarray(key_hashes, dtype=np.uint64)
+        fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+        order = np.argsort(key_hashes, kind="stable")
+        key_hashes, fingerprints = key_hashes[order], fingerprints[order]
+        if len(key_hashes) > 1:
+            repeated = np.zeros(len(key_hashes), dtype=bool)
+            same = key_hashes[1:] == key_hashes[:-1]
+            repeated[1:] |= same
+            repeated[:-1] |= same
+            key_hashes, fingerprints = key_hashes[~repeated], fingerprints[~repeated]
+        self.signature = signature
+        self.key_hashes = key_hashes
+        self.fingerprints = fingerprints
+
+    def __len__(self):
+        return len(self.key_hashes)
+
+    def unchanged(self, key_hashes, fingerprints):
+        """Boolean array: the key is known and its fingerprint is the same as recorded"""
+        key_hashes = np.asarray(key_hashes, dtype=np.uint64)
+        if not len(self.key_hashes):
+            return np.zeros(len(key_hashes), dtype=bool)
+        positions = np.searchsorted(self.key_hashes, key_hashes)
+        positions[positions == len(self.key_hashes)] = 0
+        known = self.key_hashes[positions] == key_hashes
+        return known & (self.fingerprints[positions] == fingerprints)
+
+    def subset(self, keep):
+        """Fingerprints of the entries selected by a boolean mask over key_hashes"""
+        return SheetFingerprints(self.signature, self.key_hashes[keep], self.fingerprints[keep])
+
+
+def sidecar_path(workbook_file):
+    return workbook_file + SIDECAR_SUFFIX
+
+
+def load_sidecar(workbook_file, digest):
+    """Sheet name -> SheetFingerprints recorded for this exact file content
+
+    Returns {} when there is no sidecar, it cannot be read, or it was
+    written for a different version of the workbook.
+    """
+    path = sidecar_path(workbook_file)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("digest") != digest:
+                return {}
+            return {sheet["name"]: SheetFingerprints(sheet["signature"], data[f"keys_{i}"], data[f"fingerprints_{i}"])
+                    for i, sheet in enumerate(meta["sheets"])}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable fingerprint sidecar {path}: {e}")
+        return {}
+
+
+def save_sidecar(workbook_file, digest, sheets):
+    """Record the SheetFingerprints of a workbook whose content has the given digest"""
+    meta = {"digest": digest, "sheets": []}
+    arrays = {}
+    for i, (name, fingerprints) in enumerate(sheets.items()):
+        meta["sheets"].append({"name": name, "signature": fingerprints.signature})
+        arrays[f"keys_{i}"] = fingerprints.key_hashes
+        arrays[f"fingerprints_{i}"] = fingerprints.fingerprints
+
+    # Written to a temp file first so a crash never leaves a truncated sidecar
+    path = sidecar_path(workbook_file)
+    fd, temp_file = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            np.savez_compressed(fh, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
@@ -3,17 +3,280 @@ from tkinter import ttk, filedialog, messagebox
 import pandas as pd
 import openpyxl
 import os
+import sys
 import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
 from urllib.parse import urlparse, quote
 
+from job_runner import JobRunner, JobCancelled
+from row_fingerprints import load_sidecar, save_sidecar
+from csv_reader import is_delimited, read_csv_workbook
+from change_log import ChangeLog, FORMATS as CHANGE_LOG_FORMATS, change_log_file, open_change_log
+from run_profile import RunProfile
+from streamed_sheet import StreamedWorkbook
+from xlsx_reader import (
+    DualViewWorkbook, GridSheet, ValueCell, ValueWorkbook, dimension_size, file_digest, formula_index, probe_header_row,
+    probe_workbook, read_value_workbook
+)
+from xlsx_writer import patch_workbook, PatchUnsupported
+from formula_graph import formula_graph
+from compare_engine import (
+    ColumnStats, KeyFilter, ValueFilter,
+    compare_keyed_sheet, compare_keyed_sheet_file, compare_custom_sheet, compare_transposed_sheet, init_worker
+)
+
+
+# Memory budget for workbooks kept loaded between runs (estimated, in MB)
+WORKBOOK_CACHE_BUDGET_MB = 1024
+
+# Rough memory cost of one loaded openpyxl cell, used for the budget estimate
+_CELL_BYTES = 400
+
+# On machines with more than one core, new workbooks at least this big are
+# parsed in a worker process while the old one is parsed here; smaller ones
+# are not worth starting a process for
+PARALLEL_LOAD_MIN_BYTES = 1 << 20
+
+
+def _estimated_size(value):
+    """Approximate memory held by a cached object"""
+    if isinstance(value, DualViewWorkbook):
+        cached = sum(len(values) for values in value._cached.values())
+        return _estimated_size(value.workbook) + cached * _CELL_BYTES // 4
+    if isinstance(value, ValueWorkbook):
+        return sum(sheet.grid.size if isinstance(sheet, GridSheet) else len(sheet.values)
+                   for sheet in value.worksheets) * _CELL_BYTES // 4
+    if isinstance(value, openpyxl.Workbook):
+        return sum(len(getattr(ws, '_cells', ())) for ws in value.worksheets) * _CELL_BYTES
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, ColumnStats):
+        return sum(len(counts) for counts in value.counts.values()) * _CELL_BYTES // 4
+    return sys.getsizeof(value)
+
+
+class WorkbookCache:
+    """Process-wide LRU cache of parsed workbooks and data derived from them
+
+    Entries are keyed by (path, mtime, size, load mode), so a file that
+    changes on disk is parsed again. The least recently used entries are
+    dropped once the estimated size goes over the memory budget. A load
+    in progress is registered before it starts, so concurrent lookups of
+    the same key wait for it instead of parsing the file again.
+    """
+
+    def __init__(self, budget_mb=WORKBOOK_CACHE_BUDGET_MB):
+        self.budget = budget_mb * 1024 * 1024
+        self._entries = OrderedDict()  # key -> (value, estimated size)
+        self._pending = {}  # key -> Future of a load in progress
+        self._size = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(path, mode):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size, mode)
+
+    def get(self, path, mode, loader):
+        """Return the cached object for (path, mode), calling loader() on a miss"""
+        key = self._key(path, mode)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses += 1
+                future = self._pending[key] = Future()
+        if pending is not None:
+            # Someone else is loading it already
+            self.hits += 1
+            return pending.result()
+        error = None
+        try:
+            value = loader()
+            with self._lock:
+                self._store(key, value)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # Waiters must never be left blocked, whatever failed
+            with self._lock:
+                self._pending.pop(key, None)
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+        return value
+
+    def take(self, path, mode, loader):
+        """Like get(), but hands the object over and removes it from the cache
+
+        For callers that modify what they load, so later lookups never see
+        their edits. A load of the same key in progress is waited for and
+        taken over.
+        """
+        key = self._key(path, mode)
+        while True:
+            with self._lock:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._size -= entry[1]
+                    self.hits += 1
+                    return entry[0]
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    break
+            try:
+                pending.result()
+            except Exception:
+                pass  # That load failed; this one tries again
+        return loader()
+
+    def dual_view(self, path, take=False):
+        """DualViewWorkbook (formulas plus cached values) for a file"""
+        lookup = self.take if take else self.get
+        return lookup(path, "dual", lambda: DualViewWorkbook(path))
+
+    def contains(self, path, mode):
+        """Whether (path, mode) is cached, or being loaded, for the file as it is on disk now"""
+        key = self._key(path, mode)
+        with self._lock:
+            return key in self._entries or key in self._pending
+
+    @staticmethod
+    def values_mode(sheet_names, columns=None):
+        return ("values", tuple(sorted(sheet_names)),
+                tuple(sorted((sheet, tuple(sorted(cols))) for sheet, cols in columns.items())) if columns else None)
+
+    def values(self, path, sheet_names, columns=None, loader=None):
+        """ValueWorkbook of the evaluated values of some sheets; callers must not modify it
+
+        columns ({sheet: column indices}) limits the parse to what a job
+        reads, see read_value_workbook(). loader replaces the in-process
+        parse on a miss (e.g. to wait for a worker process doing it).
+        """
+        return self.get(path, self.values_mode(sheet_names, columns),
+                        loader or (lambda: read_value_workbook(path, sheet_names, columns)))
+
+    def _store(self, key, value):
+        size = _estimated_size(value)
+        with self._lock:
+            # Older versions of the same file can never be hit again
+            for stale in [k for k in self._entries if k[0] == key[0] and k[3] == key[3]]:
+                self._size -= self._entries.pop(stale)[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.budget and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        """Drop every entry; loads in progress still finish for those waiting on them"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+# Shared by every window of the tool so setup dialogs and compare runs reuse parses
+_workbook_cache = WorkbookCache()
+
+
+def stop_worker_processes(pool):
+    """Shut a process pool down without waiting, terminating workers still busy with abandoned work"""
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def _wait_for(future, checkpoint):
+    """Result of a worker process future, checking for cancellation while waiting"""
+    while not future.done():
+        checkpoint()
+        wait([future], timeout=0.2)
+    return future.result()
+
+
+def load_compare_workbooks(old_file, new_file, sheet_names, header_row=None, checkpoint=None, memory_limit_mb=None):
+    """Old workbook (taken from the cache, since the run edits it) and new workbook
+
+    Only sheet_names are parsed in the new workbook and, given a
+    header_row, only the columns named in the old sheet. A big new
+    workbook is parsed in a worker process at the same time as the old
+    one is parsed here. The old workbook is saved back whole, so it is
+    always read whole, in this process. A CSV/TSV new file is parsed
+    in chunks and stands in for every sheet, its columns put under the
+    old sheet's columns of the same name. With a memory_limit_mb (low
+    memory mode) the new sheets are streamed instead. checkpoint() is
+    called while loading, to stop a cancelled run.
+    """
+    checkpoint = checkpoint or (lambda: None)
+    if is_delimited(new_file):
+        sheet_headers = {sheet_name: tuple(probe_header_row(old_file, sheet_name, header_row, formulas=True))
+                         for sheet_name in sheet_names} if header_row is not None else {}
+        old_book = _workbook_cache.dual_view(old_file, take=True)
+        new_wb = _workbook_cache.get(
+            new_file, ("csv", tuple(sheet_names), header_row, tuple(sorted(sheet_headers.items()))),
+            lambda: read_csv_workbook(new_file, sheet_names, header_row, sheet_headers, checkpoint))
+        return old_book, new_wb
+
+    if memory_limit_mb:
+        # Sheets are streamed one at a time when first used, never loaded whole
+        old_book = _workbook_cache.dual_view(old_file, take=True)
+        return old_book, StreamedWorkbook(new_file, memory_limit_mb, checkpoint)
+
+    columns = None
+    if header_row is not None:
+        # Named columns of the old header row, as the compare reads them from the formula view
+        columns = {sheet_name: {col for col, value in enumerate(
+                       probe_header_row(old_file, sheet_name, header_row, formulas=True), start=1) if value}
+                   for sheet_name in sheet_names}
+    pool = future = None
+    if ((os.cpu_count() or 1) > 1 and os.path.getsize(new_file) >= PARALLEL_LOAD_MIN_BYTES
+            and not _workbook_cache.contains(new_file, WorkbookCache.values_mode(sheet_names, columns))):
+        pool = ProcessPoolExecutor(max_workers=1)
+        future = pool.submit(read_value_workbook, new_file, sheet_names, columns)
+    try:
+        # Reuse the parse made while setting up
+        old_book = _workbook_cache.dual_view(old_file, take=True)  # One parse for both formulas and cached values
+        # Always use evaluated values
+        new_wb = _workbook_cache.values(new_file, sheet_names, columns,
+                                        loader=None if future is None else lambda: _wait_for(future, checkpoint))
+    except BaseException:
+        if pool is not None:
+            # A cancelled or failed run must not leave the worker parsing
+            stop_worker_processes(pool)
+        raise
+    if pool is not None:
+        pool.shutdown(wait=False)
+    return old_book, new_wb
+
 
 class ExcelComparisonApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Excel Compare and Replace Tool")
         
+        # Compare runs execute here, off the Tk thread
+        self.job_runner = JobRunner(root)
+        
+        # Column value indexes of ticked sheets are built one at a time here
+        self._stats_pool = ThreadPoolExecutor(max_workers=1)
+        self._stats_jobs = {}  # (old file, sheet, header row) -> Future of its ColumnStats
+        
         # Get screen dimensions and set window to 80% of screen size
         screen_width = root.winfo_screenwidth()
         screen_height = root.winfo_screenheight()
@@ -62,6 +325,15 @@ class ExcelComparisonApp:
         # Add these save option variables (before filter initialization)
         self.save_mode = tk.StringVar(value="new")  # Default to creating new file
         self.create_highlighted_file = tk.BooleanVar(value=False)
+        self.fast_save = tk.BooleanVar(value=True)  # Rewrite only changed cells when saving
+        self.parallel_sheets = tk.BooleanVar(value=False)  # Compare sheets in worker processes
+        self.worker_count = tk.IntVar(value=max(1, min(4, (os.cpu_count() or 2) - 1)))
+        self.write_timing_report = tk.BooleanVar(value=True)  # Phase timings JSON next to the output
+        self.incremental_compare = tk.BooleanVar(value=True)  # Skip rows unchanged since the last run
+        self.pattern_filters = tk.BooleanVar(value=False)  # Filter values may be wildcards or re: expressions
+        self.low_memory_mode = tk.BooleanVar(value=False)  # Stream the new file instead of loading it
+        self.memory_limit_mb = tk.IntVar(value=512)  # Streamed rows past this go to a temp SQLite file
+        self.change_log_format = tk.StringVar(value="none")  # none, csv, jsonl or parquet
         self.show_update_popup = tk.BooleanVar(value=True)
         self.clear_after_update = tk.BooleanVar(value=True)
 
@@ -75,9 +347,6 @@ class ExcelComparisonApp:
             self.app_name_filters.append(tk.StringVar())
             self.category_filters.append(tk.StringVar())
         
-        # Add variables to track formula relationships
-        self.formula_relationships = {}
-        
         # Add checkbox to enable formula awareness
         self.formula_aware = tk.BooleanVar(value=True)
         
@@ -615,7 +884,7 @@ class ExcelComparisonApp:
         
         new_desc = ttk.Label(
             new_file_section,
-            text="Data will be copied from this file to the source file",
+            text="Data will be copied from this file to the source file (Excel, CSV or TSV)",
             font=("Segoe UI", 8),
             foreground="#605E5C"
         )
@@ -924,10 +1193,43 @@ class ExcelComparisonApp:
         )
         instruction_label.pack(anchor=tk.W, pady=(0, 15))
         
+        # Toggle for sheets laid out with one column per record
+        self.use_row_mode = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            columns_frame,
+            text="↔️ Row-based comparison (one column per record, matched by key rows)",
+            variable=self.use_row_mode,
+            style="Modern.TCheckbutton",
+            command=self._toggle_comparison_mode
+        ).pack(anchor=tk.W, pady=(0, 10))
+        
         # Column selection grid
         self.column_frame = ttk.Frame(columns_frame)
         self.column_frame.pack(fill=tk.X)
         
+        # Row mode widgets (hidden until row-based comparison is on)
+        self.row_frame = ttk.Frame(columns_frame)
+        self.team_row = tk.StringVar(value="1")
+        self.app_name_row = tk.StringVar(value="2")
+        self.category_row = tk.StringVar(value="3")
+        for grid_row, (label, row_var) in enumerate((("👥 Team Row:", self.team_row),
+                                                     ("📱 App Name Row:", self.app_name_row),
+                                                     ("📂 Category Row:", self.category_row))):
+            ttk.Label(
+                self.row_frame,
+                text=label,
+                font=("Segoe UI", 9, "bold"),
+                foreground="#323130"
+            ).grid(row=grid_row, column=0, sticky=tk.W, pady=5)
+            ttk.Spinbox(
+                self.row_frame,
+                from_=1,
+                to=1000,
+                textvariable=row_var,
+                width=6,
+                font=("Segoe UI", 9)
+            ).grid(row=grid_row, column=1, sticky=tk.W, padx=(10, 0), pady=5)
+        
         # Team column
         team_frame = ttk.Frame(self.column_frame)
         team_frame.grid(row=0, column=0, columnspan=3, sticky=tk.W+tk.E, pady=5)
@@ -1077,59 +1379,13 @@ class ExcelComparisonApp:
     
     def _toggle_comparison_mode(self):
         if self.use_row_mode.get():
-            # Switch to row-based comparison
-            self.column_frame.grid_remove()
-            self.row_frame.grid(row=1, column=0, columnspan=3, sticky=tk.W+tk.E)
-            # Load columns for key selection
-            self._load_key_columns()
+            # Switch to row-based comparison: records are columns, keys come from rows
+            self.column_frame.pack_forget()
+            self.row_frame.pack(fill=tk.X)
         else:
             # Switch to column-based comparison
-            self.row_frame.grid_remove()
-            self.column_frame.grid(row=1, column=0, columnspan=3, sticky=tk.W+tk.E)
-    
-    def _load_key_columns(self):
-        # Find the first selected sheet
-        selected_sheet = None
-        for sheet, var in self.sheet_vars.items():
-            if var.get():
-                selected_sheet = sheet
-                break
-        
-        if not selected_sheet:
-            messagebox.showerror("Error", "Please select at least one sheet.")
-            return
-        
-        old_file = self.old_file_path.get()
-        
-        if not old_file:
-            messagebox.showerror("Error", "Please select the old Excel file first.")
-            return
-        
-        try:
-            # Read the Excel file to get column count
-            df = pd.read_excel(old_file, sheet_name=selected_sheet, nrows=1)
-            columns = list(df.columns)
-            
-            # Create letter-based column references (A, B, C, etc.)
-            column_refs = [get_column_letter(i+1) for i in range(len(columns))]
-            
-            # Update key column combobox with both letter and name
-            column_options = [f"{ref} - {name}" for ref, name in zip(column_refs, columns)]
-            self.key_column_combobox['values'] = column_options
-            
-            if column_options:
-                self.key_column_combobox.current(0)
-            
-            # Set default row values if empty
-            if not self.team_row.get():
-                self.team_row.set("1")  # Default to row 1
-            if not self.app_name_row.get():
-                self.app_name_row.set("2")  # Default to row 2
-            if not self.category_row.get():
-                self.category_row.set("3")  # Default to row 3
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load key columns: {str(e)}")
+            self.row_frame.pack_forget()
+            self.column_frame.pack(fill=tk.X)
         
     def _create_filter_widgets(self, parent):
         # Main container
@@ -1507,6 +1763,91 @@ class ExcelComparisonApp:
             style="Modern.TCheckbutton"
         ).pack(anchor=tk.W, pady=2)
         
+        ttk.Checkbutton(
+            options_frame,
+            text="⚡ Fast save (rewrite only changed cells)",
+            variable=self.fast_save,
+            style="Modern.TCheckbutton"
+        ).pack(anchor=tk.W, pady=2)
+        
+        parallel_frame = ttk.Frame(options_frame)
+        parallel_frame.pack(anchor=tk.W, pady=2)
+        
+        ttk.Checkbutton(
+            parallel_frame,
+            text="🚀 Process sheets in parallel, workers:",
+            variable=self.parallel_sheets,
+            style="Modern.TCheckbutton"
+        ).pack(side=tk.LEFT)
+        
+        ttk.Spinbox(
+            parallel_frame,
+            from_=1,
+            to=max(1, os.cpu_count() or 1),
+            textvariable=self.worker_count,
+            width=4,
+            font=("Segoe UI", 9)
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        
+        ttk.Checkbutton(
+            options_frame,
+            text="♻️ Incremental re-compare (skip rows unchanged since the last run)",
+            variable=self.incremental_compare,
+            style="Modern.TCheckbutton"
+        ).pack(anchor=tk.W, pady=2)
+        
+        ttk.Checkbutton(
+            options_frame,
+            text="🔍 Pattern filters (* and ? are wildcards, re: starts a regular expression)",
+            variable=self.pattern_filters,
+            style="Modern.TCheckbutton"
+        ).pack(anchor=tk.W, pady=2)
+        
+        low_memory_frame = ttk.Frame(options_frame)
+        low_memory_frame.pack(anchor=tk.W, pady=2)
+        
+        ttk.Checkbutton(
+            low_memory_frame,
+            text="💾 Low-memory mode (stream the new file, no comments), spill to disk above MB:",
+            variable=self.low_memory_mode,
+            style="Modern.TCheckbutton"
+        ).pack(side=tk.LEFT)
+        
+        ttk.Spinbox(
+            low_memory_frame,
+            from_=16,
+            to=65536,
+            increment=128,
+            textvariable=self.memory_limit_mb,
+            width=6,
+            font=("Segoe UI", 9)
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        
+        change_log_frame = ttk.Frame(options_frame)
+        change_log_frame.pack(anchor=tk.W, pady=2)
+        
+        ttk.Label(
+            change_log_frame,
+            text="📝 Change log file:",
+            font=("Segoe UI", 9)
+        ).pack(side=tk.LEFT)
+        
+        ttk.Combobox(
+            change_log_frame,
+            textvariable=self.change_log_format,
+            values=("none",) + CHANGE_LOG_FORMATS,
+            state="readonly",
+            width=8,
+            font=("Segoe UI", 9)
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        
+        ttk.Checkbutton(
+            options_frame,
+            text="⏱ Save timing report (JSON)",
+            variable=self.write_timing_report,
+            style="Modern.TCheckbutton"
+        ).pack(anchor=tk.W, pady=2)
+        
         ttk.Checkbutton(
             options_frame,
             text="📊 Show update summary popup",
@@ -1551,6 +1892,14 @@ class ExcelComparisonApp:
             width=20
         ).pack(side=tk.RIGHT)
         
+        ttk.Button(
+            right_actions,
+            text="⏹ Cancel",
+            style="Secondary.TButton",
+            command=self._cancel_compare_update,
+            width=12
+        ).pack(side=tk.RIGHT, padx=(0, 10))
+        
     def _browse_old_file(self):
         file_path = filedialog.askopenfilename(
             title="Select Old Excel File",
@@ -1561,9 +1910,6 @@ class ExcelComparisonApp:
             import gc
             gc.collect()
             
-            # Reset the formula relationships
-            self.formula_relationships = {}
-            
             # Clear sheet variables from previous selections
             self.sheet_vars.clear()
             
@@ -1573,7 +1919,7 @@ class ExcelComparisonApp:
     def _browse_new_file(self):
         file_path = filedialog.askopenfilename(
             title="Select New Excel File",
-            filetypes=[("Excel files", "*.xlsx;*.xls")]
+            filetypes=[("Excel files", "*.xlsx;*.xls"), ("CSV/TSV files", "*.csv;*.tsv")]
         )
         if file_path:
             self.new_file_path.set(file_path)
@@ -1586,15 +1932,18 @@ class ExcelComparisonApp:
             messagebox.showerror("Error", "Please select both old and new Excel files.")
             return
         
+        if is_delimited(old_file):
+            messagebox.showerror("Error", "The old file must be an Excel workbook, since the updates are written into it.")
+            return
+        
         try:
-            # Load old workbook without read-only to allow editing
-            old_wb = openpyxl.load_workbook(old_file, read_only=False, data_only=False)
-            
-            # Load new workbook in read-only mode initially for efficiency
-            new_wb_readonly = openpyxl.load_workbook(new_file, read_only=True, data_only=True)
+            # Sheet names and sizes straight from the zips; the old file is
+            # parsed in the background once a sheet is ticked, the new one by the run
+            old_dimensions = probe_workbook(old_file)
             
-            old_sheets = set(old_wb.sheetnames)
-            new_sheets = set(new_wb_readonly.sheetnames)
+            old_sheets = set(old_dimensions)
+            # A CSV/TSV file has no sheets: it supplies the rows of whichever sheets are ticked
+            new_sheets = old_sheets if is_delimited(new_file) else set(probe_workbook(new_file))
             
             # Find common sheets in both files
             common_sheets = list(old_sheets.intersection(new_sheets))
@@ -1620,14 +1969,18 @@ class ExcelComparisonApp:
             
             # Create checkbox for each common sheet
             for i, sheet in enumerate(common_sheets):
+                size = dimension_size(old_dimensions[sheet])
+                label = f"{sheet} ({size[0]} rows x {size[1]} columns)" if size else sheet
                 var = tk.BooleanVar(value=False)
                 self.sheet_vars[sheet] = var
+                # Index the sheet's column values in the background once it is ticked
+                var.trace_add("write", lambda *args, sheet=sheet: self._prepare_column_stats(sheet))
                 
                 # Create checkbox in standard mode frame if it exists
                 if hasattr(self, 'standard_sheet_checkbox_frame'):
                     checkbox = ttk.Checkbutton(
                         self.standard_sheet_checkbox_frame, 
-                        text=sheet, 
+                        text=label, 
                         variable=var
                     )
                     checkbox.grid(row=i, column=0, sticky=tk.W, padx=5, pady=2)
@@ -1636,32 +1989,11 @@ class ExcelComparisonApp:
                 if hasattr(self, 'custom_sheet_checkbox_frame'):
                     checkbox = ttk.Checkbutton(
                         self.custom_sheet_checkbox_frame, 
-                        text=sheet, 
+                        text=label, 
                         variable=var
                     )
                     checkbox.grid(row=i, column=0, sticky=tk.W, padx=5, pady=2)
             
-            # Detect formula relationships if enabled
-            if self.formula_aware.get():
-                header_row = self.header_row.get()
-                
-                # Clear existing relationships
-                self.formula_relationships = {}
-                
-                try:
-                    # Load first sheet to detect relationships
-                    if old_wb.sheetnames:
-                        first_sheet = old_wb[old_wb.sheetnames[0]]
-                        self.formula_relationships = self._detect_formula_relationships(first_sheet, header_row)
-                except Exception as formula_error:
-                    print(f"Warning: Could not detect formula relationships: {formula_error}")
-                    # Don't fail the whole process if formula detection fails
-                    self.formula_relationships = {}
-                    
-            # Always close the workbooks properly
-            old_wb.close()
-            new_wb_readonly.close()
-            
             messagebox.showinfo("Success", f"Found {len(common_sheets)} common sheets.")
         
         except Exception as e:
@@ -1669,6 +2001,69 @@ class ExcelComparisonApp:
             import traceback
             traceback.print_exc()
 
+    def _header_names(self, old_file, sheet_name, header_row):
+        """Distinct non-empty header values of a sheet, in column order (cached per file version)"""
+        def read():
+            names = []
+            for value in probe_header_row(old_file, sheet_name, header_row):
+                if value not in (None, "") and value not in names:
+                    names.append(value)
+            return names
+
+        return _workbook_cache.get(old_file, ("columns", sheet_name, header_row), read)
+
+    def _column_stats(self, old_file, sheet_name, header_row=None):
+        """Column value index of a sheet in the old file, built once per file version
+
+        Waits for the background build of the same index when one is
+        running (the cache makes both share a single parse either way).
+        """
+        if header_row is None:
+            header_row = self.header_row.get()
+        future = self._stats_jobs.get((os.path.abspath(old_file), sheet_name, header_row))
+        if future is not None and not future.done():
+            try:
+                return future.result()
+            except Exception:
+                pass  # Try again here, reporting the error to this caller
+        return self._build_column_stats(old_file, sheet_name, header_row)
+
+    def _build_column_stats(self, old_file, sheet_name, header_row):
+        return _workbook_cache.get(
+            old_file, ("stats", sheet_name, header_row),
+            lambda: ColumnStats(_workbook_cache.dual_view(old_file).value_sheet(sheet_name), header_row))
+
+    def _prepare_column_stats(self, sheet_name):
+        """Build the column value index of a newly ticked sheet in the background
+
+        Builds run one at a time, and a sheet whose index is already
+        queued or being built is not queued again, however often it is
+        ticked.
+        """
+        var = self.sheet_vars.get(sheet_name)
+        old_file = self.old_file_path.get()
+        if var is None or not var.get() or not old_file:
+            return
+        header_row = self.header_row.get()
+        key = (os.path.abspath(old_file), sheet_name, header_row)
+        future = self._stats_jobs.get(key)
+        if future is not None and not future.done():
+            return
+
+        def build():
+            try:
+                return self._build_column_stats(old_file, sheet_name, header_row)
+            except Exception as e:
+                print(f"Warning: Could not index values of sheet {sheet_name}: {e}")
+                raise
+
+        def forget(done):
+            if self._stats_jobs.get(key) is done:
+                del self._stats_jobs[key]
+
+        future = self._stats_jobs[key] = self._stats_pool.submit(build)
+        future.add_done_callback(forget)
+
     def _get_unique_values(self, field_type, index=0):
         # Find the first selected sheet from checkboxes
         selected_sheet = None
@@ -1688,11 +2083,15 @@ class ExcelComparisonApp:
             return
         
         try:
-            # Use the configured header row
-            header_row = self.header_row.get() - 1  # Convert to 0-based for pandas
-            
-            # Get formula relationships map if enabled
-            formula_map = self.formula_relationships if self.formula_aware.get() else {}
+            # Get formula relationships map of the sheet if enabled
+            formula_map = {}
+            if self.formula_aware.get():
+                try:
+                    formula_map = self._detect_formula_relationships(
+                        old_file, [selected_sheet], self.header_row.get())[selected_sheet]
+                except Exception as formula_error:
+                    # Don't fail the value picker if formula detection fails
+                    print(f"Warning: Could not detect formula relationships: {formula_error}")
             
             # Determine which column to get unique values from and its source
             if field_type == 'team':
@@ -1717,31 +2116,18 @@ class ExcelComparisonApp:
                 source_column = formula_map.get(column, column)
                 target_var = self.category_filters[index]
                 
-            # Use openpyxl to read both raw values AND formula results
-            wb = openpyxl.load_workbook(old_file, data_only=True)  # data_only=True gets formula results
-            sheet = wb[selected_sheet]
+            # Distinct values come from the sheet's column index (formula results)
+            stats = self._column_stats(old_file, selected_sheet)
             
             # Find the column index for the source column
-            source_col_idx = None
-            for col in range(1, sheet.max_column + 1):
-                cell_value = sheet.cell(row=header_row+1, column=col).value
-                if cell_value == source_column:
-                    source_col_idx = col
-                    break
+            source_col_idx = stats.column_index(source_column)
                     
             if source_col_idx is None:
                 messagebox.showerror("Error", f"Could not find column {source_column} in sheet.")
                 return
                 
-            # Collect unique non-empty values from this column
-            unique_values = set()
-            for row in range(header_row+2, sheet.max_row + 1):
-                cell_value = sheet.cell(row=row, column=source_col_idx).value
-                if cell_value:  # Only add non-empty values
-                    unique_values.add(str(cell_value))
-                    
-            # Sort the unique values
-            unique_values = sorted(list(unique_values))
+            # Sorted unique non-empty values from this column
+            unique_values = stats.distinct(source_col_idx)
             
             # Create a selection dialog
             value_dialog = tk.Toplevel(self.root)
@@ -1813,10 +2199,24 @@ class ExcelComparisonApp:
             traceback.print_exc()
     
     def _update_status(self, message, progress=None):
-        self.status_var.set(message)
+        """Queue a status update; safe to call from the compare thread"""
+        self.job_runner.set_var(self.status_var, message)
+        if progress is not None:
+            self.job_runner.set_var(self.progress_var, progress)
+    
+    def _update_custom_status(self, message, progress=None):
+        """Queue a custom mode status update; safe to call from the compare thread"""
+        self.job_runner.set_var(self.custom_status_var, message)
         if progress is not None:
-            self.progress_var.set(progress)
-        self.root.update_idletasks()
+            self.job_runner.set_var(self.custom_progress_var, progress)
+    
+    def _ui_call(self, func, *args, **kwargs):
+        """Run a dialog or other Tk call on the Tk thread and return its result"""
+        return self.job_runner.call_in_ui(func, *args, **kwargs)
+    
+    def _checkpoint(self):
+        """Stop the running compare job here if it has been cancelled"""
+        self.job_runner.checkpoint()
     
     def _start_compare_update(self):
         """Start comparison and update process based on current mode"""
@@ -1824,11 +2224,20 @@ class ExcelComparisonApp:
         if not self._validate_inputs():
             return
         
-        # Start in a thread based on mode
+        # Queue the job based on mode; it starts once any running job is done
+        if self.job_runner.busy:
+            self._update_status("Queued behind the running comparison...")
         if self.current_mode.get() == "standard":
-            threading.Thread(target=self._compare_and_update, daemon=True).start()
+            self.job_runner.submit("standard compare", lambda job: self._compare_and_update())
         else:  # custom mode
-            threading.Thread(target=self._custom_compare_and_update, daemon=True).start()
+            self.job_runner.submit("custom compare", lambda job: self._custom_compare_and_update())
+    
+    def _cancel_compare_update(self):
+        """Cancel the running comparison and any queued ones"""
+        if not self.job_runner.busy:
+            return
+        self.job_runner.cancel()
+        self._update_status("Cancelling...")
     
     def _validate_inputs(self):
         # Check if all required files are selected
@@ -1846,11 +2255,24 @@ class ExcelComparisonApp:
             messagebox.showerror("Error", "Please select at least one sheet to compare.")
             return False
         
+        if self.current_mode.get() == "standard" and self.use_row_mode.get():
+            # Validate row-based inputs
+            try:
+                key_rows = [int(var.get()) for var in (self.team_row, self.app_name_row, self.category_row)]
+            except ValueError:
+                messagebox.showerror("Error", "Row numbers must be integers.")
+                return False
+            if min(key_rows) < 1:
+                messagebox.showerror("Error", "Row numbers must be 1 or higher.")
+                return False
+        
         return True
     
     def _compare_and_update(self):
+        change_log = None
         try:
             self._update_status("Starting comparison...", 0)
+            profile = RunProfile()
             
             # Get input values
             old_file = self.old_file_path.get()
@@ -1864,300 +2286,156 @@ class ExcelComparisonApp:
             # Get selected sheets from checkbox variables
             selected_sheets = [sheet for sheet, var in self.sheet_vars.items() if var.get()]
             if not selected_sheets:
-                messagebox.showerror("Error", "No sheets selected for processing.")
+                self._ui_call(messagebox.showerror, "Error", "No sheets selected for processing.")
                 self._update_status("Ready", 0)
                 return
             
-            # We only use column mode now (removed row mode toggle)
-            is_row_mode = False
+            # Row-based mode matches columns (records) by the values in the key rows
+            is_row_mode = self.use_row_mode.get()
             
             # Get filter values
             team_filters = [f.get().strip() for f in self.team_filters if f.get().strip()]
             app_filters = [f.get().strip() for f in self.app_name_filters if f.get().strip()]
             category_filters = [f.get().strip() for f in self.category_filters if f.get().strip()]
             
+            # Compile every filter once per job: (key label, ValueFilter) pairs
+            patterns = self.pattern_filters.get()
+            try:
+                compiled_filters = [("Team", ValueFilter(team_filters, patterns)),
+                                    ("App Name", ValueFilter(app_filters, patterns)),
+                                    ("Category", ValueFilter(category_filters, patterns))]
+                for label, filter_vars in self.additional_filters.items():
+                    values = [f.get().strip() for f in filter_vars if f.get().strip()]
+                    compiled_filters.append((label, ValueFilter(values, patterns)))
+            except ValueError as e:
+                self._ui_call(messagebox.showerror, "Filter Error", str(e))
+                self._update_status("Ready", 0)
+                return
+            
             # Force close any previously open workbooks
             self._ensure_workbooks_closed()
             
-            # Load workbooks with appropriate data_only settings
-            self._update_status("Loading workbooks...", 10)
-            old_wb_raw = openpyxl.load_workbook(old_file, data_only=False)  # For preserving formulas
-            old_wb_eval = openpyxl.load_workbook(old_file, data_only=True)  # For evaluating formulas
-            new_wb = openpyxl.load_workbook(new_file, data_only=True)  # Always use evaluated values
-            
-            # Get formula relationships map if enabled
-            formula_map = self.formula_relationships if self.formula_aware.get() else {}
+            # Formula relationships of each selected sheet if enabled, read
+            # again from the file as it is now (free when it has not changed)
+            formula_map = (self._detect_formula_relationships(old_file, selected_sheets, header_row)
+                           if self.formula_aware.get() else {})
+            
+            # Everything a sheet comparison needs, read from the UI once
+            settings = {
+                "header_row": header_row,
+                "team_column": self.team_column.get(),
+                "app_name_column": self.app_name_column.get(),
+                "category_column": self.category_column.get(),
+                "additional_criteria": [(label, var.get()) for var, label, _ in self.additional_criteria],
+                "key_rows": [int(var.get()) for var in (self.team_row, self.app_name_row, self.category_row)]
+                            if is_row_mode else [],
+                "filters": compiled_filters,
+                "formula_map": formula_map,
+                "incremental": self.incremental_compare.get() and not is_row_mode,
+                # Worker processes stream the new sheet too when set
+                "memory_limit_mb": self.memory_limit_mb.get() if self.low_memory_mode.get() else None,
+            }
+            old_digest = file_digest(old_file)  # Keys the per-file formula index cache
+            # Row fingerprints from the last run on this exact old file
+            previous_fingerprints = load_sidecar(old_file, old_digest) if settings["incremental"] else {}
+            written_fingerprints = {}
+            in_sync_fingerprints = {}
+            change_log = self._open_change_log(old_file)  # Written sheet by sheet as changes are applied
             
             total_updates = 0
-            sheets_processed = 0
+            comments_copied = False  # Comments live outside the sheet XML, so they need a full save
             
             for sheet_name in selected_sheets:
                 # Initialize tracking for this sheet
                 updated_cells[sheet_name] = []
                 updated_rows[sheet_name] = set()
-                
-                self._update_status(f"Processing sheet: {sheet_name}...", 
-                                20 + (sheets_processed / len(selected_sheets) * 60))
-                
-                # Get sheet objects - both raw and evaluated versions
-                old_sheet_raw = old_wb_raw[sheet_name]  # Contains formulas
-                old_sheet_eval = old_wb_eval[sheet_name]  # Contains formula results
-                new_sheet = new_wb[sheet_name]
-                
-                # COLUMN-BASED MODE
-                # Column-based comparison
-                team_col = self.team_column.get()
-                app_name_col = self.app_name_column.get()
-                category_col = self.category_column.get()
-                
-                # Create a mapping of column names to column indices
-                headers = {}
-                col_to_name = {}  # Reverse mapping
-                
-                for col in range(1, old_sheet_raw.max_column + 1):
-                    cell_value = old_sheet_raw.cell(row=header_row, column=col).value
-                    if cell_value:
-                        headers[cell_value] = col
-                        col_to_name[col] = cell_value
-                
-                # Map formula columns to their source columns for key generation
-                source_team_col = formula_map.get(team_col, team_col)
-                source_app_col = formula_map.get(app_name_col, app_name_col)
-                source_cat_col = formula_map.get(category_col, category_col)
-                
-                # Set up the team/app/cat column indexes
-                if team_col in headers:
-                    team_idx = headers[team_col]
-                else:
-                    messagebox.showerror("Error", f"Team column '{team_col}' not found in headers.")
-                    continue
-                    
-                if app_name_col in headers:
-                    app_idx = headers[app_name_col]
-                else:
-                    messagebox.showerror("Error", f"App name column '{app_name_col}' not found in headers.")
-                    continue
-                    
-                if category_col in headers:
-                    cat_idx = headers[category_col]
-                else:
-                    messagebox.showerror("Error", f"Category column '{category_col}' not found in headers.")
-                    continue
-                
-                # Function to normalize cell value for consistent key generation
-                def normalize_value(value):
-                    if value is None:
-                        return ""
-                    # Convert to string and strip
-                    return str(value).strip()
-                
-                # Create keys and maps based on the pattern in the Excel file
-                old_keys = {}  # Maps key to row number
-                new_keys = {}
-                
-                # Process additional criteria columns
-                additional_col_indices = []
-                for criteria_var, criteria_label, _ in self.additional_criteria:
-                    col_name = criteria_var.get()
-                    if col_name in headers:
-                        additional_col_indices.append((criteria_label, headers[col_name]))
-                    else:
-                        if col_name:  # Only show error if a column was selected
-                            messagebox.showerror("Error", f"Additional criteria column '{col_name}' not found in headers.")
-                
-                # For old file - use evaluated values (formula results)
-                print(f"Processing {old_sheet_eval.max_row} rows in old sheet")
-                for row in range(header_row + 1, old_sheet_eval.max_row + 1):
-                    team_value = normalize_value(old_sheet_eval.cell(row=row, column=team_idx).value)
-                    app_value = normalize_value(old_sheet_eval.cell(row=row, column=app_idx).value)
-                    cat_value = normalize_value(old_sheet_eval.cell(row=row, column=cat_idx).value)
-                    
-                    # Add values for additional criteria
-                    additional_values = []
-                    for _, col_idx in additional_col_indices:
-                        additional_values.append(normalize_value(old_sheet_eval.cell(row=row, column=col_idx).value))
-                    
-                    # Create key with all values even if empty
-                    key_parts = [team_value, app_value, cat_value] + additional_values
-                    key = "|".join(key_parts)
-                    
-                    # Only add non-empty keys (at least one component must be non-empty)
-                    if any(key_parts):
-                        old_keys[key] = row
-                
-                # For new file - use evaluated values
-                print(f"Processing {new_sheet.max_row} rows in new sheet")
-                for row in range(header_row + 1, new_sheet.max_row + 1):
-                    team_value = normalize_value(new_sheet.cell(row=row, column=team_idx).value)
-                    app_value = normalize_value(new_sheet.cell(row=row, column=app_idx).value)
-                    cat_value = normalize_value(new_sheet.cell(row=row, column=cat_idx).value)
-                    
-                    # Add values for additional criteria
-                    additional_values = []
-                    for _, col_idx in additional_col_indices:
-                        additional_values.append(normalize_value(new_sheet.cell(row=row, column=col_idx).value))
-                    
-                    # Create key with all values even if empty
-                    key_parts = [team_value, app_value, cat_value] + additional_values
-                    key = "|".join(key_parts)
+            
+            # Row-based runs stay in this process: skipping merged cells needs the full old sheet
+            parallel = self.parallel_sheets.get() and not is_row_mode
+            workers = min(self.worker_count.get(), len(selected_sheets)) if parallel else 1
+            if workers > 1:
+                # Each worker parses and compares one sheet; the main process
+                # loads the workbooks it has to edit in the meantime
+                # Setting cancel_event makes the workers drop their sheet at the next checkpoint
+                cancel_event = multiprocessing.Event()
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cancel_event,))
+                try:
+                    pending = [pool.submit(compare_keyed_sheet_file, old_file, new_file, sheet_name,
+                                           settings, old_digest)
+                               for sheet_name in selected_sheets]
+                    self._update_status(f"Comparing {len(selected_sheets)} sheets on {workers} workers...", 10)
+                    profile.mark()
+                    # Only the old workbook is edited here; the workers read the new file themselves
+                    old_book = _workbook_cache.dual_view(old_file, take=True)
+                    new_wb = None
+                    profile.lap("load")
                     
-                    # Only add non-empty keys (at least one component must be non-empty)
-                    if any(key_parts):
-                        new_keys[key] = row
-                
-                # Find common keys
-                all_common_keys = set(old_keys.keys()).intersection(set(new_keys.keys()))
-                print(f"Found {len(old_keys)} keys in old file, {len(new_keys)} keys in new file")
-                print(f"Common keys before filtering: {len(all_common_keys)}")
-                
-                # Apply filters if specified - use the EVALUATED values for filtering
-                filtered_keys = set()
-
-                # Check if we have any filters at all
-                has_filters = (team_filters or app_filters or category_filters or 
-                            any(filters for filters in self.additional_filters.values() if any(f.get().strip() for f in filters)))
-
-                if has_filters:
-                    for key in all_common_keys:
-                        parts = key.split('|')
-                        if len(parts) >= 3:  # We always have at least team, app, category
-                            team, app, category = parts[0], parts[1], parts[2]
-                            
-                            # Additional parts correspond to additional criteria
-                            additional_parts = parts[3:] if len(parts) > 3 else []
-                            
-                            # Check default filters
-                            passes_team = True
-                            passes_app = True
-                            passes_category = True
-                            
-                            if team_filters:
-                                passes_team = any(team.lower() == filter_val.lower() for filter_val in team_filters)
-                            
-                            if app_filters and passes_team:
-                                passes_app = any(app.lower() == filter_val.lower() for filter_val in app_filters)
-                            
-                            if category_filters and passes_team and passes_app:
-                                passes_category = any(category.lower() == filter_val.lower() for filter_val in category_filters)
-                            
-                            # Check additional filters if we have any
-                            passes_additional = True
-                            
-                            # First check Team, App Name, Category additional filters
-                            if "Team" in self.additional_filters and passes_team and passes_app and passes_category:
-                                team_add_filters = [f.get().strip() for f in self.additional_filters["Team"] if f.get().strip()]
-                                if team_add_filters:
-                                    passes_additional = passes_additional and any(team.lower() == filter_val.lower() for filter_val in team_add_filters)
-                            
-                            if "App Name" in self.additional_filters and passes_team and passes_app and passes_category and passes_additional:
-                                app_add_filters = [f.get().strip() for f in self.additional_filters["App Name"] if f.get().strip()]
-                                if app_add_filters:
-                                    passes_additional = passes_additional and any(app.lower() == filter_val.lower() for filter_val in app_add_filters)
-                            
-                            if "Category" in self.additional_filters and passes_team and passes_app and passes_category and passes_additional:
-                                cat_add_filters = [f.get().strip() for f in self.additional_filters["Category"] if f.get().strip()]
-                                if cat_add_filters:
-                                    passes_additional = passes_additional and any(category.lower() == filter_val.lower() for filter_val in cat_add_filters)
-                            
-                            # Check other additional criteria filters
-                            idx = 0
-                            for criteria_var, criteria_label, _ in self.additional_criteria:
-                                if (criteria_label in self.additional_filters and 
-                                    passes_team and passes_app and passes_category and passes_additional and 
-                                    idx < len(additional_parts)):
-                                    
-                                    add_filters = [f.get().strip() for f in self.additional_filters[criteria_label] if f.get().strip()]
-                                    if add_filters:
-                                        passes_additional = passes_additional and any(additional_parts[idx].lower() == filter_val.lower() for filter_val in add_filters)
-                                
-                                idx += 1
-                            
-                            # Add key if it passes all active filters
-                            if passes_team and passes_app and passes_category and passes_additional:
-                                filtered_keys.add(key)
-                else:
-                    filtered_keys = all_common_keys
-                
-                print(f"Keys after filtering: {len(filtered_keys)}")
-                
-                # Better detection of formula cells
-                formula_cells = set()
-                
-                # First detect by data_type
-                for row in range(header_row + 1, old_sheet_raw.max_row + 1):
-                    for col in range(1, old_sheet_raw.max_column + 1):
-                        cell = old_sheet_raw.cell(row=row, column=col)
-                        if cell.data_type == 'f' or (isinstance(cell.value, str) and str(cell.value).startswith('=')):
-                            formula_cells.add((row, col))
-                
-                # Create a set of formula columns to avoid
-                formula_columns = set()
-                for formula_col, src_col in formula_map.items():
-                    if formula_col in headers:
-                        formula_columns.add(headers[formula_col])
-                        print(f"Excluding formula column: {formula_col} (column {headers[formula_col]})")
-                
-                # Process updates using the filtered keys
-                updates_made = 0
-                skipped_rows = 0
-                skipped_formula = 0
+                    done_count = 0
+                    while pending:
+                        self._checkpoint()
+                        finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            result = future.result()
+                            profile.merge(result.profile)
+                            profile.mark()
+                            done_count += 1
+                            self._update_status(f"Finished sheet: {result.sheet_name} ({done_count}/{len(selected_sheets)})",
+                                                20 + (done_count / len(selected_sheets) * 60))
+                            updates_made, copied = self._apply_sheet_result(result, old_book, new_wb, change_log,
+                                                                            updated_cells, updated_rows)
+                            profile.lap("write", result.sheet_name)
+                            if result.fingerprints is not None:
+                                written_fingerprints[result.sheet_name] = result.fingerprints
+                                in_sync_fingerprints[result.sheet_name] = result.in_sync_fingerprints
+                            total_updates += updates_made
+                            comments_copied = comments_copied or copied
+                except BaseException:
+                    # Workers busy parsing a sheet would only see the event at their next checkpoint
+                    cancel_event.set()
+                    stop_worker_processes(pool)
+                    raise
+                pool.shutdown()
+            else:
+                self._update_status("Loading workbooks...", 10)
+                profile.mark()
+                # Row-based sheets have their keys in rows, so every column is read
+                old_book, new_wb = self._load_compare_workbooks(old_file, new_file, selected_sheets,
+                                                                None if is_row_mode else header_row)
+                profile.lap("load")
                 
-                # For each matching key, update the cells in old sheet from new sheet
-                for key in filtered_keys:
-                    old_row = old_keys[key]
-                    new_row = new_keys[key]
+                for sheets_processed, sheet_name in enumerate(selected_sheets):
+                    self._update_status(f"Processing sheet: {sheet_name}...", 
+                                    20 + (sheets_processed / len(selected_sheets) * 60))
                     
-                    cells_updated = False
-                    
-                    for col in range(1, min(old_sheet_raw.max_column, new_sheet.max_column) + 1):
-                        # Skip header row
-                        if old_row == header_row:
-                            continue
-                            
-                        # Skip formula columns we identified
-                        if col in formula_columns:
-                            skipped_formula += 1
-                            continue
-                            
-                        # Skip cells with formulas (additional check)
-                        if (old_row, col) in formula_cells:
-                            skipped_formula += 1
-                            continue
-                            
-                        # Check if the source column has a name
-                        if col in col_to_name:
-                            # Double-check this isn't a formula cell
-                            cell = old_sheet_raw.cell(row=old_row, column=col)
-                            if cell.data_type == 'f' or (isinstance(cell.value, str) and str(cell.value).startswith('=')):
-                                skipped_formula += 1
-                                continue
-                                
-                            # Get source and target cells
-                            new_cell = new_sheet.cell(row=new_row, column=col)
-                            old_cell = old_sheet_raw.cell(row=old_row, column=col)
-                            
-                            # Only update if values are different
-                            if old_cell.value != new_cell.value:
-                                # Store old value for reference
-                                old_value = old_cell.value
-                                
-                                # Use helper method to update while preserving comments
-                                self._update_cell_preserve_comments(new_cell, old_cell)
-                                cells_updated = True
-                                
-                                # Track cell for highlighting and popup
-                                updated_cells[sheet_name].append((old_row, col, old_value, new_cell.value))
+                    new_sheet = new_wb[sheet_name]  # Streamed at this point in low-memory mode
+                    profile.lap("load", sheet_name)
                     
-                    if cells_updated:
-                        updates_made += 1
-                        updated_rows[sheet_name].add(old_row)
-                    else:
-                        skipped_rows += 1
-                
-                total_updates += updates_made
-                print(f"Updated {updates_made} rows, skipped {skipped_rows} rows, skipped {skipped_formula} formula cells")
+                    # Formula cells come from one streaming pass over the sheet XML
+                    # (cached by file content, so reruns on the same file are free)
+                    formula_cells = formula_index(old_file, sheet_name, old_digest)
+                    profile.lap("formula scan", sheet_name)
                     
-                sheets_processed += 1
+                    # Get sheet objects - both raw and evaluated versions
+                    compare_sheet = compare_transposed_sheet if is_row_mode else compare_keyed_sheet
+                    result = compare_sheet(
+                        old_book.formula_sheet(sheet_name),  # Contains formulas
+                        old_book.value_sheet(sheet_name),  # Contains formula results
+                        new_sheet,
+                        formula_cells,
+                        settings,
+                        checkpoint=self._checkpoint,
+                        profile=profile,
+                        previous=previous_fingerprints.get(sheet_name))
+                    updates_made, copied = self._apply_sheet_result(result, old_book, new_wb, change_log,
+                                                                    updated_cells, updated_rows)
+                    profile.lap("write", sheet_name)
+                    if result.fingerprints is not None:
+                        written_fingerprints[sheet_name] = result.fingerprints
+                        in_sync_fingerprints[sheet_name] = result.in_sync_fingerprints
+                    total_updates += updates_made
+                    comments_copied = comments_copied or copied
+            
+            old_wb_raw = old_book.workbook  # For preserving formulas
             
             # Generate output filename based on selected save mode
             if self.save_mode.get() == "new":
@@ -2178,32 +2456,45 @@ class ExcelComparisonApp:
                 output_file = f"{base}_updated{filter_info}{mode_info}{ext}"
             else:
                 # Replace original file - but confirm first
-                if not messagebox.askyesno("Confirm Replace", 
+                if not self._ui_call(messagebox.askyesno, "Confirm Replace", 
                     "Are you sure you want to overwrite the original file?\nThis cannot be undone.", 
                     icon="warning"):
                     self._update_status("Operation cancelled", 0)
                     return
                 output_file = old_file
             
+            # Last chance to stop before anything is written
+            self._checkpoint()
+            
             # Save the updated workbook
             self._update_status("Saving updated workbook...", 90)
-            old_wb_raw.save(output_file)
+            profile.mark()
+            self._save_updated_workbook(old_wb_raw, old_file, output_file, updated_cells,
+                                        patchable=not comments_copied)
+            change_log.close()
+            profile.lap("save")
+            if settings["incremental"]:
+                self._save_fingerprints(old_file, old_digest, output_file, previous_fingerprints,
+                                        selected_sheets, written_fingerprints, in_sync_fingerprints)
             
             # Create highlighted file if option is enabled
             if self.create_highlighted_file.get() and updated_cells:
+                self._checkpoint()
                 self._update_status("Creating highlighted changes file...", 95)
-                highlighted_file = self._create_highlighted_file(old_file, output_file, updated_cells)
+                highlighted_file = self._create_highlighted_file(old_wb_raw, output_file, updated_cells)
+                profile.lap("highlight")
                 if highlighted_file:
-                    messagebox.showinfo("Highlighted File Created", f"A file with highlighted changes has been created at:\n{highlighted_file}")
+                    self._ui_call(messagebox.showinfo, "Highlighted File Created", f"A file with highlighted changes has been created at:\n{highlighted_file}")
             
             # Show popup with updated rows if option is enabled
             if self.show_update_popup.get() and any(rows for rows in updated_rows.values()):
-                self._show_update_index_popup(updated_rows, header_row)
+                self._ui_call(self._show_update_index_popup, updated_rows, header_row)
             
-            # Make sure to close all workbooks properly
-            old_wb_raw.close()
-            old_wb_eval.close()
-            new_wb.close()
+            # Make sure to close all workbooks properly (new_wb stays in the cache unless streamed)
+            old_book.close()
+            if isinstance(new_wb, StreamedWorkbook):
+                new_wb.close()
+            run_summary = self._finish_profile(profile, output_file, updated_cells)
             
             # If replacing the original file, ensure the file is properly released
             if self.save_mode.get() == "replace":
@@ -2211,9 +2502,6 @@ class ExcelComparisonApp:
                 import gc
                 gc.collect()
                 
-                # Reset the formula relationships to ensure they're redetected
-                if self.formula_aware.get():
-                    self.formula_relationships = {}
             
             self._update_status("Complete!", 100)
             
@@ -2230,44 +2518,63 @@ class ExcelComparisonApp:
             
             sheet_message = f"\nProcessed sheets: {', '.join(selected_sheets)}"
             mode_message = "\nComparison mode: Row-based" if is_row_mode else "\nComparison mode: Column-based"
-            formula_message = "\nFormula columns preserved" if formula_map else ""
+            formula_message = "\nFormula columns preserved" if any(formula_map.values()) else ""
             
-            messagebox.showinfo("Success", f"Updated {total_updates} {'columns' if is_row_mode else 'rows'} successfully!\nSaved to: {output_file}{sheet_message}{mode_message}{formula_message}{filter_message}")
+            self._ui_call(messagebox.showinfo, "Success", f"Updated {total_updates} {'columns' if is_row_mode else 'rows'} successfully!\nSaved to: {output_file}{sheet_message}{mode_message}{formula_message}{filter_message}")
             
-            # Clear file selections if option is enabled
-            if self.clear_after_update.get():
-                # Reset file paths
-                self.old_file_path.set("")
-                self.new_file_path.set("")
-                
-                # Clear sheet selections
-                for var in self.sheet_vars.values():
-                    var.set(False)
-                
-                # Clear sheet variables
-                self.sheet_vars.clear()
-                
-                # Clear column selections
-                self.team_column.set("")
-                self.app_name_column.set("")
-                self.category_column.set("")
-                
-                # Reset filters
-                for filter_var in self.team_filters:
-                    filter_var.set("")
-                for filter_var in self.app_name_filters:
-                    filter_var.set("")
-                for filter_var in self.category_filters:
-                    filter_var.set("")
+            # Clear file selections if option is enabled (Tk variables, so on the Tk thread)
+            self._ui_call(self._clear_after_update)
             
-            # Reset UI elements
-            self._update_status("Ready", 0)
+            # Reset UI elements, keeping the timing of the run in view
+            self._update_status(f"Ready - last run {run_summary}", 0)
             
+        except JobCancelled:
+            self._update_status("Cancelled", 0)
+            print("Comparison cancelled")
         except Exception as e:
             self._update_status("Error occurred", 0)
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            self._ui_call(messagebox.showerror, "Error", f"An error occurred: {str(e)}")
             import traceback
             traceback.print_exc()
+        finally:
+            # A run that did not get as far as saving leaves no change log behind
+            if change_log is not None:
+                change_log.close(commit=False)
+
+    def _clear_after_update(self):
+        """Reset file, sheet, column and filter selections after a standard run, if enabled"""
+        if not self.clear_after_update.get():
+            return
+        # Reset file paths
+        self.old_file_path.set("")
+        self.new_file_path.set("")
+        
+        # Clear sheet selections
+        for var in self.sheet_vars.values():
+            var.set(False)
+        
+        # Clear sheet variables
+        self.sheet_vars.clear()
+        
+        # Clear column selections
+        self.team_column.set("")
+        self.app_name_column.set("")
+        self.category_column.set("")
+        
+        # Reset filters
+        for filter_var in self.team_filters:
+            filter_var.set("")
+        for filter_var in self.app_name_filters:
+            filter_var.set("")
+        for filter_var in self.category_filters:
+            filter_var.set("")
+
+    def _clear_custom_after_update(self):
+        """Reset file and sheet selections after a custom run, if enabled"""
+        if self.clear_after_update.get():
+            self.old_file_path.set("")
+            self.new_file_path.set("")
+            self.sheet_vars.clear()
 
     def _update_sheet(self, sheet, old_df, new_df, common_keys, team_col, app_name_col, category_col, formula_map=None):
         # Use the configured header row
@@ -2369,12 +2676,8 @@ class ExcelComparisonApp:
             return
         
         try:
-            # Use the configured header row
-            header_row = self.header_row.get() - 1  # Convert to 0-based for pandas
-            
-            # Read the Excel file skipping to the header row
-            df = pd.read_excel(old_file, sheet_name=selected_sheet, header=header_row)
-            columns = list(df.columns)
+            # Column names straight from the header row in the file
+            columns = self._header_names(old_file, selected_sheet, self.header_row.get())
             
             if not columns:
                 messagebox.showerror("Error", "No columns found in the selected sheet.")
@@ -2442,90 +2745,26 @@ class ExcelComparisonApp:
                         elif event.num == 5:
                             self.main_canvas.yview_scroll(1, "units")
 
-    def _detect_formula_relationships(self, sheet, header_row):
-        """Detect formula relationships between columns in the sheet."""
-        import re
-        relationships = {}
-        
-        print("\n--- Starting Formula Relationship Detection ---")
-        
-        # Check if we're working with a read-only worksheet
-        is_readonly = getattr(sheet, 'read_only', False)
-        if is_readonly:
-            print("Warning: Formula detection limited on read-only worksheets")
+    def _detect_formula_relationships(self, old_file, sheet_names, header_row):
+        """{sheet: {formula column header: source column header}} for sheets of the old file
+
+        Every formula of a sheet is read from the file's dependency graph,
+        built in one pass per sheet and cached by file content; the result
+        is cached per file version, so calling this again for an unchanged
+        file is free and a file saved since is always looked at again.
+        """
+        def detect(sheet_name):
+            graph = formula_graph(old_file, [sheet_name])[sheet_name]
+            headers = {col: value for col, value in enumerate(probe_header_row(old_file, sheet_name, header_row),
+                                                              start=1) if value}
+            relationships = graph.column_relationships(headers, header_row)
+            for formula_col, source_col in relationships.items():
+                print(f"Established relationship in {sheet_name}: '{formula_col}' references '{source_col}'")
             return relationships
-        
-        try:
-            # Step 1: Create a mapping from column positions to header names
-            headers = {}  # Column index to header name
-            for col in range(1, sheet.max_column + 1):
-                cell_value = sheet.cell(row=header_row, column=col).value
-                if cell_value:
-                    headers[col] = cell_value
-            
-            # Create reverse mapping from column letter to header name
-            letter_to_header = {}
-            for col_idx, header in headers.items():
-                col_letter = get_column_letter(col_idx)
-                letter_to_header[col_letter] = header
-            
-            # Step 2: Analyze formula patterns in the first few rows
-            formula_patterns = {}  # To track potential formula columns
-            
-            # Look at several rows to establish consistent patterns
-            for row_num in range(header_row + 1, min(header_row + 10, sheet.max_row + 1)):
-                for col_idx, header_name in headers.items():
-                    try:
-                        cell = sheet.cell(row=row_num, column=col_idx)
-                        cell_formula = None
-                        
-                        # Get formula using different methods
-                        if getattr(cell, 'data_type', None) == 'f':
-                            cell_formula = str(cell.value)
-                        elif hasattr(cell, 'value') and isinstance(cell.value, str) and cell.value.startswith('='):
-                            cell_formula = cell.value
-                        
-                        if cell_formula:
-                            # Look for simple cell references like =A5, =$A5, =A$5, or =$A$5
-                            # The regex captures just the column letter part
-                            match = re.search(r'=\$?([A-Za-z]+)\$?\d+', cell_formula)
-                            if match:
-                                ref_col_letter = match.group(1).upper()  # Ensure uppercase
-                                
-                                # If we can map this reference to a header
-                                if ref_col_letter in letter_to_header:
-                                    source_header = letter_to_header[ref_col_letter]
-                                    
-                                    # Add to our tracking dictionary
-                                    if header_name not in formula_patterns:
-                                        formula_patterns[header_name] = {}
-                                    
-                                    if source_header not in formula_patterns[header_name]:
-                                        formula_patterns[header_name][source_header] = 0
-                                    
-                                    formula_patterns[header_name][source_header] += 1
-                    except Exception as cell_error:
-                        print(f"Error analyzing cell at row {row_num, col_idx}: {cell_error}")
-                        continue
-            
-            # Step 3: Confirm relationships (if a column consistently references another column)
-            for formula_col, references in formula_patterns.items():
-                if references:
-                    # Find the most commonly referenced source column
-                    most_common = max(references.items(), key=lambda x: x[1])
-                    source_col, count = most_common
-                    
-                    # If we have at least 2 occurrences, establish a relationship
-                    if count >= 2:
-                        relationships[formula_col] = source_col
-                        print(f"Established relationship: '{formula_col}' references '{source_col}' ({count} occurrences)")
-            
-        except Exception as e:
-            print(f"Error in formula detection: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        return relationships
+
+        return {sheet_name: _workbook_cache.get(old_file, ("formula map", sheet_name, header_row),
+                                                lambda: detect(sheet_name))
+                for sheet_name in sheet_names}
 
     def _ensure_workbooks_closed(self):
         """Force closure of any open workbooks to avoid file locking issues"""
@@ -2540,6 +2779,113 @@ class ExcelComparisonApp:
         except:
             pass
 
+    def _open_change_log(self, old_file):
+        """ChangeLog for a run, streamed to <old file>_changes.<format> when a format is chosen"""
+        log_format = self.change_log_format.get()
+        if log_format not in CHANGE_LOG_FORMATS:
+            return ChangeLog()
+        try:
+            return open_change_log(change_log_file(old_file, log_format), log_format)
+        except (ImportError, OSError) as e:
+            self._ui_call(messagebox.showwarning, "Change Log",
+                          f"The change log cannot be written:\n{e}\n\nThe comparison will run without it.")
+            return ChangeLog()
+
+    def _load_compare_workbooks(self, old_file, new_file, sheet_names, header_row=None):
+        """Old and new workbook of a run; see load_compare_workbooks()"""
+        memory_limit_mb = self.memory_limit_mb.get() if self.low_memory_mode.get() else None
+        return load_compare_workbooks(old_file, new_file, sheet_names, header_row, self._checkpoint, memory_limit_mb)
+
+    def _save_fingerprints(self, old_file, old_digest, output_file, previous, compared, written, in_sync):
+        """Record row fingerprints so the next run on either workbook can skip unchanged rows
+
+        The output gets every compared row (all are in sync once the changes
+        are written); an old file that was not overwritten gets the rows
+        that needed no change. Sheets not compared this run keep what was
+        recorded before, as their rows did not change.
+        """
+        untouched = {sheet: fingerprints for sheet, fingerprints in previous.items() if sheet not in compared}
+        try:
+            save_sidecar(output_file, file_digest(output_file), {**untouched, **written})
+            if os.path.abspath(output_file) != os.path.abspath(old_file):
+                save_sidecar(old_file, old_digest, {**untouched, **in_sync})
+        except OSError as e:
+            print(f"Could not save row fingerprints: {e}")
+
+    def _finish_profile(self, profile, output_file, updated_cells):
+        """Stop the run clock, write the timing report if enabled and return its summary line"""
+        profile.finish()
+        for sheet_name, cells in updated_cells.items():
+            profile.count("cells written", len(cells), sheet_name)
+        if self.write_timing_report.get():
+            report_file = f"{os.path.splitext(output_file)[0]}_timings.json"
+            try:
+                profile.save(report_file)
+                print(f"Timing report saved to {report_file}")
+            except OSError as e:
+                print(f"Could not save timing report: {e}")
+        summary = profile.summary()
+        print(f"Run time: {summary}")
+        return summary
+
+    def _apply_sheet_result(self, result, old_book, new_wb, change_log, updated_cells, updated_rows):
+        """Write one sheet's changes into the old workbook and add them to the change log
+
+        Returns (rows updated, whether any comment was copied over).
+        """
+        sheet_name = result.sheet_name
+        for message in result.errors:
+            self._ui_call(messagebox.showerror, "Error", message)
+        comments_copied = False
+        if result.skipped:
+            return 0, comments_copied
+        
+        old_sheet_raw = old_book.formula_sheet(sheet_name)
+        # Sheets compared in workers (no new_wb) bring the comments of their
+        # changed cells along. A streamed new file has no cells to copy
+        # comments from, and row-based changes do not say which column of
+        # the new sheet they came from: write the values only
+        new_sheet = (None if new_wb is None or isinstance(new_wb, StreamedWorkbook) or result.transposed
+                     else new_wb[sheet_name])
+        # Changes come in old-row order, so the old sheet is written front to back
+        for old_row, new_row, col, old_value, new_value in result.changes:
+            old_cell = old_sheet_raw.cell(row=old_row, column=col)
+            if new_sheet is None:
+                new_cell = ValueCell(new_value, result.comments.get((new_row, col)))
+            else:
+                new_cell = new_sheet.cell(row=new_row, column=col)
+            # Use helper method to update while preserving comments
+            self._update_cell_preserve_comments(new_cell, old_cell)
+            comments_copied = comments_copied or new_cell.comment is not None
+            
+            # Track cell for highlighting and popup
+            updated_cells[sheet_name].append((old_row, col, old_value, new_value))
+            updated_rows[sheet_name].add(old_row)
+        change_log.add(sheet_name, result.changes, result.change_keys)
+        
+        if result.transposed:
+            # Row-based mode updates records, which are columns
+            updates_made = len({col for _, _, col, _, _ in result.changes})
+            print(f"Updated {updates_made} columns, skipped {result.matched_rows - updates_made} columns, "
+                  f"skipped {result.skipped_formula} formula cells")
+            return updates_made, comments_copied
+        updates_made = len(updated_rows[sheet_name])
+        skipped_rows = result.matched_rows - updates_made
+        print(f"Updated {updates_made} rows, skipped {skipped_rows} rows, skipped {result.skipped_formula} formula cells")
+        return updates_made, comments_copied
+
+    def _save_updated_workbook(self, workbook, old_file, output_file, updated_cells, patchable=True):
+        """Save the edited workbook, rewriting only the changed cells when possible"""
+        if patchable and self.fast_save.get():
+            edits = {sheet: {(row, col): new_value for row, col, _, new_value in cells}
+                     for sheet, cells in updated_cells.items() if cells}
+            try:
+                patch_workbook(old_file, output_file, edits)
+                return
+            except PatchUnsupported as e:
+                print(f"Fast save not possible ({e}), saving the whole workbook")
+        workbook.save(output_file)
+
     def _update_cell_preserve_comments(self, source_cell, target_cell):
         """Update a cell's value and handle comments appropriately"""
         # Update the cell value
@@ -2722,35 +3068,19 @@ class ExcelComparisonApp:
         
         # Get unique values from the column
         try:
-            # Use the configured header row
-            header_row = self.header_row.get() - 1  # Convert to 0-based for pandas
-            
-            # Use openpyxl to read values
+            # Distinct values come from the sheet's column index (formula results)
             old_file = self.old_file_path.get()
-            wb = openpyxl.load_workbook(old_file, data_only=True)
-            sheet = wb[selected_sheet]
+            stats = self._column_stats(old_file, selected_sheet)
             
             # Find the column index
-            col_idx = None
-            for col in range(1, sheet.max_column + 1):
-                cell_value = sheet.cell(row=header_row+1, column=col).value
-                if cell_value == column_name:
-                    col_idx = col
-                    break
+            col_idx = stats.column_index(column_name)
             
             if col_idx is None:
                 messagebox.showerror("Error", f"Could not find column {column_name} in sheet.")
                 return
                 
-            # Collect unique values
-            unique_values = set()
-            for row in range(header_row+2, sheet.max_row + 1):
-                cell_value = sheet.cell(row=row, column=col_idx).value
-                if cell_value:  # Only add non-empty values
-                    unique_values.add(str(cell_value))
-                    
-            # Sort the unique values
-            unique_values = sorted(list(unique_values))
+            # Sorted unique non-empty values
+            unique_values = stats.distinct(col_idx)
             
             # Create selection dialog
             value_dialog = tk.Toplevel(self.root)
@@ -2822,41 +3152,42 @@ class ExcelComparisonApp:
             import traceback
             traceback.print_exc()
 
-    def _create_highlighted_file(self, original_file, updated_file, updated_cells):
-        """Create a copy of the updated file with highlighted changes"""
+    def _create_highlighted_file(self, workbook, updated_file, updated_cells):
+        """Create a copy of the updated file with highlighted changes
+
+        Works on the in-memory updated workbook instead of reloading the saved
+        file, so it must run after the main save (the fills and comments are
+        added to workbook itself).
+        """
         try:
             from openpyxl.styles import PatternFill
+            from openpyxl.comments import Comment
             
             # Create a filename for the highlighted file
             base, ext = os.path.splitext(updated_file)
             highlighted_file = f"{base}_highlighted{ext}"
             
-            # Load the updated workbook
-            wb = openpyxl.load_workbook(updated_file)
-            
             # Yellow fill for highlighting changes
             highlight_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
             
             # Apply highlighting to all updated cells
             for sheet_name, cells in updated_cells.items():
-                if sheet_name in wb.sheetnames and cells:
-                    ws = wb[sheet_name]
+                if sheet_name in workbook.sheetnames and cells:
+                    ws = workbook[sheet_name]
                     
                     for row, col, old_val, new_val in cells:
                         cell = ws.cell(row=row, column=col)
                         cell.fill = highlight_fill
                         
-                        # Optionally add a comment with the old value
-                        from openpyxl.comments import Comment
-                        comment = Comment(f"Previous value: {old_val}", "Excel Compare Tool")
-                        cell.comment = comment
+                        # Add a comment with the old value
+                        cell.comment = Comment(f"Previous value: {old_val}", "Excel Compare Tool")
             
             # Save the highlighted workbook
-            wb.save(highlighted_file)
+            workbook.save(highlighted_file)
             return highlighted_file
             
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to create highlighted file: {str(e)}")
+            self._ui_call(messagebox.showerror, "Error", f"Failed to create highlighted file: {str(e)}")
             return None
 
     def _show_update_index_popup(self, updated_rows, header_row):
@@ -3199,12 +3530,8 @@ class ExcelComparisonApp:
             return
         
         try:
-            # Use the configured header row
-            header_row = self.header_row.get() - 1  # Convert to 0-based for pandas
-            
-            # Read the Excel file skipping to the header row
-            df = pd.read_excel(old_file, sheet_name=selected_sheet, header=header_row)
-            columns = list(df.columns)
+            # Column names straight from the header row in the file
+            columns = self._header_names(old_file, selected_sheet, self.header_row.get())
             
             if not columns:
                 messagebox.showerror("Error", "No columns found in the selected sheet.")
@@ -3456,34 +3783,18 @@ class ExcelComparisonApp:
             return
         
         try:
-            # Use the configured header row
-            header_row = self.header_row.get() - 1  # Convert to 0-based for pandas
-            
-            # Use openpyxl to read values
-            wb = openpyxl.load_workbook(old_file, data_only=True)
-            sheet = wb[selected_sheet]
+            # Distinct values come from the sheet's column index (formula results)
+            stats = self._column_stats(old_file, selected_sheet)
             
             # Find the column index
-            col_idx = None
-            for col in range(1, sheet.max_column + 1):
-                cell_value = sheet.cell(row=header_row+1, column=col).value
-                if str(cell_value) == column_name:
-                    col_idx = col
-                    break
+            col_idx = stats.column_index(column_name, as_text=True)
             
             if col_idx is None:
                 messagebox.showerror("Error", f"Could not find column '{column_name}' in sheet.")
                 return
                 
-            # Collect unique non-empty values from this column
-            unique_values = set()
-            for row in range(header_row+2, sheet.max_row + 1):
-                cell_value = sheet.cell(row=row, column=col_idx).value
-                if cell_value:  # Only add non-empty values
-                    unique_values.add(str(cell_value))
-            
-            # Sort the values
-            unique_values = sorted(list(unique_values))
+            # Sorted unique non-empty values from this column
+            unique_values = stats.distinct(col_idx)
             
             # Create selection dialog with search
             self._show_value_selection_dialog(
@@ -3565,10 +3876,10 @@ class ExcelComparisonApp:
 
     def _custom_compare_and_update(self):
         """Compare and update using custom key columns"""
+        change_log = None
         try:
-            self.custom_status_var.set("Starting comparison...")
-            self.custom_progress_var.set(0)
-            self.root.update_idletasks()
+            self._update_custom_status("Starting comparison...", 0)
+            profile = RunProfile()
             
             # Get input values
             old_file = self.old_file_path.get()
@@ -3582,9 +3893,8 @@ class ExcelComparisonApp:
             # Get key columns
             key_columns = [key_var.get() for key_var, _ in self.key_columns]
             if not key_columns or not all(key_columns):
-                messagebox.showerror("Error", "Please define at least one key column")
-                self.custom_status_var.set("Ready")
-                self.custom_progress_var.set(0)
+                self._ui_call(messagebox.showerror, "Error", "Please define at least one key column")
+                self._update_custom_status("Ready", 0)
                 return
             
             # Debug confirmation of key columns
@@ -3593,9 +3903,8 @@ class ExcelComparisonApp:
             # Get selected sheets
             selected_sheets = [sheet for sheet, var in self.sheet_vars.items() if var.get()]
             if not selected_sheets:
-                messagebox.showerror("Error", "No sheets selected for processing.")
-                self.custom_status_var.set("Ready")
-                self.custom_progress_var.set(0)
+                self._ui_call(messagebox.showerror, "Error", "No sheets selected for processing.")
+                self._update_custom_status("Ready", 0)
                 return
             
             # Get filter values
@@ -3606,20 +3915,44 @@ class ExcelComparisonApp:
                     custom_filter_values[column] = values
                     print(f"Filter for {column}: {values}")
             
+            # Compile the filters once; a filter applies to every key part taken from its column
+            try:
+                key_filter = KeyFilter((part, ValueFilter(custom_filter_values[key_col], self.pattern_filters.get()))
+                                       for part, key_col in enumerate(key_columns)
+                                       if key_col in custom_filter_values)
+            except ValueError as e:
+                self._ui_call(messagebox.showerror, "Filter Error", str(e))
+                self._update_custom_status("Ready", 0)
+                return
+            
             # Load workbooks
-            self.custom_status_var.set("Loading workbooks...")
-            self.custom_progress_var.set(10)
-            self.root.update_idletasks()
+            self._update_custom_status("Loading workbooks...", 10)
             
             # Force closure of any open workbooks
             self._ensure_workbooks_closed()
-            
-            old_wb_raw = openpyxl.load_workbook(old_file, data_only=False)  # For preserving formulas
-            old_wb_eval = openpyxl.load_workbook(old_file, data_only=True)  # For evaluating formulas
-            new_wb = openpyxl.load_workbook(new_file, data_only=True)  # Always use evaluated values
-            
-            # Get formula relationships if enabled
-            formula_map = self.formula_relationships if self.formula_aware.get() else {}
+            profile.mark()
+            
+            old_book, new_wb = self._load_compare_workbooks(old_file, new_file, selected_sheets, header_row)
+            old_digest = file_digest(old_file)  # Keys the per-file formula index cache
+            old_wb_raw = old_book.workbook  # For preserving formulas
+            profile.lap("load")
+            
+            # Formula relationships of each selected sheet if enabled
+            formula_map = (self._detect_formula_relationships(old_file, selected_sheets, header_row)
+                           if self.formula_aware.get() else {})
+            
+            settings = {
+                "header_row": header_row,
+                "key_columns": key_columns,
+                "key_filter": key_filter,
+                "formula_map": formula_map,
+                "incremental": self.incremental_compare.get(),
+            }
+            # Row fingerprints from the last run on this exact old file
+            previous_fingerprints = load_sidecar(old_file, old_digest) if settings["incremental"] else {}
+            written_fingerprints = {}
+            in_sync_fingerprints = {}
+            change_log = self._open_change_log(old_file)  # Written sheet by sheet as changes are applied
             
             total_updates = 0
             sheets_processed = 0
@@ -3629,267 +3962,61 @@ class ExcelComparisonApp:
                 updated_cells[sheet_name] = []
                 updated_rows[sheet_name] = set()
                 
-                self.custom_status_var.set(f"Processing sheet: {sheet_name}...")
-                self.custom_progress_var.set(20 + (sheets_processed / len(selected_sheets) * 60))
-                self.root.update_idletasks()
+                self._update_custom_status(f"Processing sheet: {sheet_name}...", 20 + (sheets_processed / len(selected_sheets) * 60))
                 
                 # Get sheet objects
+                profile.mark()
                 try:
-                    old_sheet_raw = old_wb_raw[sheet_name]  # Contains formulas
-                    old_sheet_eval = old_wb_eval[sheet_name]  # Contains formula results
-                    new_sheet = new_wb[sheet_name]
+                    old_sheet_raw = old_book.formula_sheet(sheet_name)  # Contains formulas
+                    old_sheet_eval = old_book.value_sheet(sheet_name)  # Contains formula results
+                    new_sheet = new_wb[sheet_name]  # Streamed at this point in low-memory mode
                 except KeyError:
-                    messagebox.showerror("Error", f"Sheet '{sheet_name}' not found in one of the workbooks.")
+                    self._ui_call(messagebox.showerror, "Error", f"Sheet '{sheet_name}' not found in one of the workbooks.")
+                    profile.mark()
                     continue
+                profile.lap("load", sheet_name)
                 
-                # Create column mappings from header row
-                headers = {}
-                col_to_name = {}
+                # Formula cells come from one streaming pass over the sheet XML
+                # (cached by file content, so reruns on the same file are free)
+                formula_cells = formula_index(old_file, sheet_name, old_digest)
+                profile.lap("formula scan", sheet_name)
                 
-                for col in range(1, old_sheet_raw.max_column + 1):
-                    cell_value = old_sheet_raw.cell(row=header_row, column=col).value
-                    if cell_value:
-                        headers[str(cell_value)] = col
-                        col_to_name[col] = str(cell_value)
-                
-                # Print found headers for debugging
-                print(f"Found {len(headers)} headers in sheet {sheet_name}")
-                
-                # Validate all key columns exist in the headers
-                missing_columns = [col for col in key_columns if col not in headers]
-                if missing_columns:
-                    messagebox.showerror("Error", 
-                                        f"Key column(s) not found in sheet '{sheet_name}': {', '.join(missing_columns)}")
+                result = compare_custom_sheet(old_sheet_raw, old_sheet_eval, new_sheet, formula_cells,
+                                              settings, checkpoint=self._checkpoint, profile=profile,
+                                              previous=previous_fingerprints.get(sheet_name))
+                for message in result.errors:
+                    self._ui_call(messagebox.showerror, "Error", message)
+                if result.skipped or not result.matched_rows:
                     continue
                 
-                # Function to normalize cell values for consistent comparison
-                def normalize_value(value):
-                    if value is None:
-                        return ""
-                    elif isinstance(value, (int, float)):
-                        # Convert numbers to strings with no decimal for integers
-                        if isinstance(value, int) or value.is_integer():
-                            return str(int(value))
-                        return str(value)
-                    return str(value).strip()
-                
-                # Create keys and maps based on the pattern in the Excel file
-                old_keys = {}  # Maps composite key to row number
-                new_keys = {}
-                
-                # For old file - use evaluated values (formula results)
-                print(f"Processing {old_sheet_eval.max_row - header_row} rows in old sheet")
-                for row in range(header_row + 1, old_sheet_eval.max_row + 1):
-                    # Build the composite key from all key columns
-                    key_parts = []
-                    all_empty = True
-                    
-                    for key_col in key_columns:
-                        col_idx = headers[key_col]
-                        value = normalize_value(old_sheet_eval.cell(row=row, column=col_idx).value)
-                        key_parts.append(value)
-                        if value:  # Check if any part has content
-                            all_empty = False
-                    
-                    # Skip if all key parts are empty
-                    if all_empty:
-                        continue
-                        
-                    # Create composite key
-                    key = "|".join(key_parts)
-                    old_keys[key] = row
-                    
-                    # Debug print first few rows
-                    if len(old_keys) <= 5:
-                        print(f"Old sheet row {row} key: {key}")
-                
-                # For new file - use evaluated values
-                print(f"Processing {new_sheet.max_row - header_row} rows in new sheet")
-                for row in range(header_row + 1, new_sheet.max_row + 1):
-                    # Build the composite key from all key columns
-                    key_parts = []
-                    all_empty = True
-                    invalid_key = False
-                    
-                    for key_col in key_columns:
-                        # Check if column exists in new file
-                        if key_col not in headers:
-                            invalid_key = True
-                            break
-                            
-                        col_idx = headers[key_col]
-                        value = normalize_value(new_sheet.cell(row=row, column=col_idx).value)
-                        key_parts.append(value)
-                        if value:  # Check if any part has content
-                            all_empty = False
-                    
-                    # Skip if key is invalid or all parts are empty
-                    if invalid_key or all_empty:
+                write_failed = False
+                written = []
+                for change, key in zip(result.changes, result.change_keys):
+                    old_row, new_row, col, old_value, new_value = change
+                    try:
+                        # Update the cell value
+                        old_sheet_raw.cell(row=old_row, column=col).value = new_value
+                    except Exception as e:
+                        print(f"Error updating cell ({old_row}, {col}): {e}")
+                        write_failed = True
                         continue
-                        
-                    # Create composite key
-                    key = "|".join(key_parts)
-                    new_keys[key] = row
                     
-                    # Debug print first few rows
-                    if len(new_keys) <= 5:
-                        print(f"New sheet row {row} key: {key}")
-                
-                # Find common keys
-                all_common_keys = set(old_keys.keys()).intersection(set(new_keys.keys()))
-                print(f"Found {len(old_keys)} keys in old file, {len(new_keys)} keys in new file")
-                print(f"Common keys before filtering: {len(all_common_keys)}")
-                
-                # Apply filters if specified
-                filtered_keys = set()
-                
-                if custom_filter_values:  # If we have filters
-                    for key in all_common_keys:
-                        # Split the key into its components
-                        key_parts = key.split('|')
-                        
-                        # Check each filter
-                        passes_all_filters = True
-                        
-                        for i, key_col in enumerate(key_columns):
-                            if key_col in custom_filter_values and i < len(key_parts):
-                                # Get the value from this key part
-                                value = key_parts[i]
-                                
-                                # Check if it matches any of the filter values (case-insensitive)
-                                matches_filter = False
-                                for filter_val in custom_filter_values[key_col]:
-                                    if value.lower() == filter_val.lower():
-                                        matches_filter = True
-                                        break
-                                
-                                if not matches_filter:
-                                    passes_all_filters = False
-                                    break
-                        
-                        if passes_all_filters:
-                            filtered_keys.add(key)
-                else:
-                    # No filters, use all common keys
-                    filtered_keys = all_common_keys
-                
-                print(f"Keys after filtering: {len(filtered_keys)}")
-                
-                # If no keys match after filtering, inform the user but continue with other sheets
-                if not filtered_keys:
-                    print(f"No matching rows found in sheet {sheet_name} after applying filters")
-                    continue
-                
-                # Detect formula cells to preserve them
-                formula_cells = set()
-                
-                # Check for formulas in cells up to 100 rows past header row
-                max_formula_check_row = min(header_row + 100, old_sheet_raw.max_row + 1)
-                
-                # Find formula cells for preservation
-                for row in range(header_row + 1, max_formula_check_row):
-                    for col in range(1, old_sheet_raw.max_column + 1):
-                        try:
-                            cell = old_sheet_raw.cell(row=row, column=col)
-                            if cell.data_type == 'f' or (isinstance(cell.value, str) and cell.value and cell.value.startswith('=')):
-                                formula_cells.add((row, col))
-                        except Exception as e:
-                            print(f"Error checking formula at ({row}, {col}): {e}")
-                            continue
-                
-                print(f"Detected {len(formula_cells)} formula cells to preserve")
+                    # Track for highlighting and popup
+                    updated_cells[sheet_name].append((old_row, col, old_value, new_value))
+                    updated_rows[sheet_name].add(old_row)
+                    written.append((change, key))
+                change_log.add(sheet_name, [change for change, _ in written], [key for _, key in written])
+                profile.lap("write", sheet_name)
+                # A row left out of sync must be diffed again next time
+                if result.fingerprints is not None and not write_failed:
+                    written_fingerprints[sheet_name] = result.fingerprints
+                    in_sync_fingerprints[sheet_name] = result.in_sync_fingerprints
                 
-                # Create a set of formula columns to avoid
-                formula_columns = set()
-                for formula_col, src_col in formula_map.items():
-                    if formula_col in headers:
-                        formula_columns.add(headers[formula_col])
-                        print(f"Will preserve formula column: {formula_col}")
-                
-                # Process updates
-                updates_made = 0
-                skipped_rows = 0
-                skipped_formula = 0
-                
-                # For each matching key, update cells
-                for key in filtered_keys:
-                    old_row = old_keys[key]
-                    new_row = new_keys[key]
-                    
-                    # Debug for first few updates
-                    if updates_made < 3:
-                        print(f"Comparing match: old row {old_row}, new row {new_row}, key {key}")
-                    
-                    cells_updated = False
-                    
-                    # Loop through all columns to update
-                    for col in range(1, min(old_sheet_raw.max_column, new_sheet.max_column) + 1):
-                        # Skip header row
-                        if old_row <= header_row:
-                            continue
-                        
-                        # Skip if column has no name or is not in headers
-                        if col not in col_to_name:
-                            continue
-                        
-                        column_name = col_to_name[col]
-                        
-                        # Skip our key columns - don't update the keys themselves
-                        if column_name in key_columns:
-                            continue
-                            
-                        # Skip formula columns we identified in the mapping
-                        if col in formula_columns:
-                            skipped_formula += 1
-                            continue
-                        
-                        # Skip cells with formulas
-                        if (old_row, col) in formula_cells:
-                            skipped_formula += 1
-                            continue
-                            
-                        # Get cells for comparison
-                        try:
-                            new_cell = new_sheet.cell(row=new_row, column=col)
-                            old_cell = old_sheet_raw.cell(row=old_row, column=col)
-                            
-                            # Extra formula check (for safety)
-                            if isinstance(old_cell.value, str) and old_cell.value and old_cell.value.startswith('='):
-                                skipped_formula += 1
-                                continue
-                            
-                            # Compare values, handling None, empty strings, and different types
-                            old_value = old_cell.value
-                            new_value = new_cell.value
-                            
-                            # Convert to strings for comparison
-                            old_str = str(old_value) if old_value is not None else ""
-                            new_str = str(new_value) if new_value is not None else ""
-                            
-                            if old_str != new_str:
-                                # Debug for first few cell updates
-                                if updates_made < 3 and cells_updated < 3:
-                                    print(f"Updating cell ({old_row}, {col}) {column_name}: '{old_value}' -> '{new_value}'")
-                                
-                                # Update the cell value
-                                old_cell.value = new_value
-                                cells_updated = True
-                                
-                                # Track for highlighting and popup
-                                updated_cells[sheet_name].append((old_row, col, old_value, new_value))
-                                
-                        except Exception as e:
-                            print(f"Error updating cell ({old_row}, {col}): {e}")
-                            continue
-                    
-                    if cells_updated:
-                        updates_made += 1
-                        updated_rows[sheet_name].add(old_row)
-                    else:
-                        skipped_rows += 1
+                updates_made = len(updated_rows[sheet_name])
+                skipped_rows = result.matched_rows - updates_made
                 
                 total_updates += updates_made
-                print(f"Sheet {sheet_name}: Updated {updates_made} rows, skipped {skipped_rows} rows, skipped {skipped_formula} formula cells")
+                print(f"Sheet {sheet_name}: Updated {updates_made} rows, skipped {skipped_rows} rows, skipped {result.skipped_formula} formula cells")
                 sheets_processed += 1
             
             # Generate output filename based on selected save mode
@@ -3902,63 +4029,66 @@ class ExcelComparisonApp:
                 output_file = f"{base}_updated{filter_info}{ext}"
             else:
                 # Replace original file
-                if not messagebox.askyesno("Confirm Replace", 
+                if not self._ui_call(messagebox.askyesno, "Confirm Replace", 
                     "Are you sure you want to overwrite the original file?\nThis cannot be undone.", 
                     icon="warning"):
-                    self.custom_status_var.set("Operation cancelled")
+                    self._update_custom_status("Operation cancelled")
                     return
                 output_file = old_file
             
             # Save the updated workbook
-            self.custom_status_var.set("Saving updated workbook...")
-            self.custom_progress_var.set(90)
-            self.root.update_idletasks()
+            # Last chance to stop before anything is written
+            self._checkpoint()
+            self._update_custom_status("Saving updated workbook...", 90)
             
             try:
-                old_wb_raw.save(output_file)
+                profile.mark()
+                self._save_updated_workbook(old_wb_raw, old_file, output_file, updated_cells)
+                change_log.close()
+                profile.lap("save")
                 print(f"Successfully saved to {output_file}")
+                if settings["incremental"]:
+                    self._save_fingerprints(old_file, old_digest, output_file, previous_fingerprints,
+                                            selected_sheets, written_fingerprints, in_sync_fingerprints)
             except Exception as save_error:
-                messagebox.showerror("Save Error", f"Failed to save workbook: {str(save_error)}")
-                self.custom_status_var.set("Save failed")
+                self._ui_call(messagebox.showerror, "Save Error", f"Failed to save workbook: {str(save_error)}")
+                self._update_custom_status("Save failed")
                 return
             
             # Create highlighted file if option is enabled
             if self.create_highlighted_file.get() and any(cells for cells in updated_cells.values()):
-                self.custom_status_var.set("Creating highlighted changes file...")
-                self.custom_progress_var.set(95)
-                self.root.update_idletasks()
-                highlighted_file = self._create_highlighted_file(old_file, output_file, updated_cells)
+                self._checkpoint()
+                self._update_custom_status("Creating highlighted changes file...", 95)
+                highlighted_file = self._create_highlighted_file(old_wb_raw, output_file, updated_cells)
+                profile.lap("highlight")
                 if highlighted_file:
-                    messagebox.showinfo("Highlighted File Created", 
-                                       f"A file with highlighted changes has been created at:\n{highlighted_file}")
+                    self._ui_call(messagebox.showinfo, "Highlighted File Created",
+                                  f"A file with highlighted changes has been created at:\n{highlighted_file}")
             
             # Show popup with updated rows if option is enabled
             if self.show_update_popup.get() and any(rows for rows in updated_rows.values()):
-                self._show_update_index_popup(updated_rows, header_row)
+                self._ui_call(self._show_update_index_popup, updated_rows, header_row)
             
-            # Close all workbooks
-            old_wb_raw.close()
-            old_wb_eval.close()
-            new_wb.close()
+            # Close the edited workbook (new_wb stays in the cache unless streamed)
+            old_book.close()
+            if isinstance(new_wb, StreamedWorkbook):
+                new_wb.close()
+            run_summary = self._finish_profile(profile, output_file, updated_cells)
             
-            # Reset if needed
-            if self.clear_after_update.get():
-                self.old_file_path.set("")
-                self.new_file_path.set("")
-                self.sheet_vars.clear()
+            # Reset if needed (Tk variables, so on the Tk thread)
+            self._ui_call(self._clear_custom_after_update)
             
-            self.custom_status_var.set("Complete!")
-            self.custom_progress_var.set(100)
+            self._update_custom_status(f"Complete! {run_summary}", 100)
             
             if total_updates == 0:
-                messagebox.showinfo("No Updates", 
-                                  f"No rows were updated. This could be because:\n"
-                                  f"1. No matching rows were found based on your key columns\n"
-                                  f"2. The filter criteria excluded all matches\n"
-                                  f"3. No data differences were detected\n\n"
-                                  f"Key columns used: {', '.join(key_columns)}\n" +
-                                  (f"Filters applied: {', '.join(f'{col}: {vals}' for col, vals in custom_filter_values.items())}" 
-                                   if custom_filter_values else "No filters applied"))
+                self._ui_call(messagebox.showinfo, "No Updates",
+                              f"No rows were updated. This could be because:\n"
+                              f"1. No matching rows were found based on your key columns\n"
+                              f"2. The filter criteria excluded all matches\n"
+                              f"3. No data differences were detected\n\n"
+                              f"Key columns used: {', '.join(key_columns)}\n" +
+                              (f"Filters applied: {', '.join(f'{col}: {vals}' for col, vals in custom_filter_values.items())}" 
+                               if custom_filter_values else "No filters applied"))
             else:
                 # Show success message
                 key_message = f"Key columns used: {', '.join(key_columns)}"
@@ -3970,17 +4100,23 @@ class ExcelComparisonApp:
                 
                 sheet_message = f"\nProcessed sheets: {', '.join(selected_sheets)}"
                 
-                messagebox.showinfo("Success", 
-                                   f"Updated {total_updates} rows successfully!\n"
-                                   f"Saved to: {output_file}\n"
-                                   f"{key_message}{sheet_message}{filter_message}")
-            
+                self._ui_call(messagebox.showinfo, "Success",
+                              f"Updated {total_updates} rows successfully!\n"
+                              f"Saved to: {output_file}\n"
+                              f"{key_message}{sheet_message}{filter_message}")
+            
+        except JobCancelled:
+            self._update_custom_status("Cancelled", 0)
+            print("Comparison cancelled")
         except Exception as e:
-            self.custom_status_var.set("Error occurred")
-            self.custom_progress_var.set(0)
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            self._update_custom_status("Error occurred", 0)
+            self._ui_call(messagebox.showerror, "Error", f"An error occurred: {str(e)}")
             import traceback
             traceback.print_exc()
+        finally:
+            # A run that did not get as far as saving leaves no change log behind
+            if change_log is not None:
+                change_log.close(commit=False)
     
     
 
@@ -4193,6 +4329,8 @@ class ExcelComparisonApp:
         self.root.protocol("WM_DELETE_WINDOW", on_close)
 
 if __name__ == "__main__":
+    # Needed by the sheet worker processes when running as a frozen executable
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ExcelComparisonApp(root)
     root.mainloop()
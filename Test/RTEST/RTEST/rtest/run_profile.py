@@ -0,0 +1,111 @@
+import json
+import time
+from datetime import datetime
+
+
+# Phases in the order a compare run goes through them (used to order reports)
+PHASES = ("load", "header map", "key build", "filter", "formula scan", "fingerprint", "diff", "write", "save",
+          "highlight")
+
+# Counters every report lists, even when zero
+COUNTERS = ("rows scanned", "keys matched", "rows unchanged", "cells compared", "cells written",
+            "formula cells skipped")
+
+# Totals over every sheet (None is the key of run-level entries)
+_ALL_SHEETS = object()
+
+
+class RunProfile:
+    """Wall and CPU time per phase plus counters for one compare run
+
+    Timing works like laps on a stopwatch: lap(phase) books the time since
+    the previous lap (or mark()) to that phase. Phases and counters can be
+    booked per sheet. Profiles from worker processes are plain data and
+    are folded into the run's profile with merge().
+    """
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.phases = {}  # (sheet, phase) -> [wall seconds, cpu seconds]
+        self.counters = {}  # (sheet, counter) -> value
+        self.wall_time = None  # Set by finish()
+        self._run_start = time.perf_counter()
+        self.mark()
+
+    def mark(self):
+        """Restart the lap clock without booking the time since the last lap"""
+        self._clock = (time.perf_counter(), time.process_time())
+
+    def lap(self, phase, sheet=None):
+        """Book the time since the last lap or mark to phase"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        entry = self.phases.setdefault((sheet, phase), [0.0, 0.0])
+        entry[0] += wall - self._clock[0]
+        entry[1] += cpu - self._clock[1]
+        self._clock = (wall, cpu)
+
+    def count(self, counter, n=1, sheet=None):
+        self.counters[(sheet, counter)] = self.counters.get((sheet, counter), 0) + int(n)
+
+    def merge(self, other):
+        """Add the phases and counters of another profile (e.g. from a worker process)"""
+        for key, (wall, cpu) in other.phases.items():
+            entry = self.phases.setdefault(key, [0.0, 0.0])
+            entry[0] += wall
+            entry[1] += cpu
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def finish(self):
+        """Stop the run clock"""
+        self.wall_time = time.perf_counter() - self._run_start
+
+    def _ordered(self, names, known):
+        return sorted(names, key=lambda name: (known.index(name) if name in known else len(known), name))
+
+    def _phase_totals(self, sheet=_ALL_SHEETS):
+        totals = {}
+        for (phase_sheet, phase), (wall, cpu) in self.phases.items():
+            if sheet is _ALL_SHEETS or phase_sheet == sheet:
+                entry = totals.setdefault(phase, [0.0, 0.0])
+                entry[0] += wall
+                entry[1] += cpu
+        return {phase: {"wall_s": round(totals[phase][0], 4), "cpu_s": round(totals[phase][1], 4)}
+                for phase in self._ordered(totals, PHASES)}
+
+    def _counter_totals(self, sheet=_ALL_SHEETS):
+        totals = dict.fromkeys(COUNTERS, 0) if sheet is _ALL_SHEETS else {}
+        for (counter_sheet, counter), value in self.counters.items():
+            if sheet is _ALL_SHEETS or counter_sheet == sheet:
+                totals[counter] = totals.get(counter, 0) + value
+        return {counter: totals[counter] for counter in self._ordered(totals, COUNTERS)}
+
+    def to_dict(self):
+        """Run totals followed by the same figures per sheet"""
+        if self.wall_time is None:
+            self.finish()
+        sheets = {sheet for sheet, _ in self.phases} | {sheet for sheet, _ in self.counters}
+        sheets.discard(None)  # Run-level phases such as save only count towards the totals
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            # Phases in worker processes overlap, so their CPU time can exceed the wall time
+            "wall_s": round(self.wall_time, 4),
+            "cpu_s": round(sum(cpu for _, cpu in self.phases.values()), 4),
+            "phases": self._phase_totals(),
+            "counters": self._counter_totals(),
+            "sheets": {sheet: {"phases": self._phase_totals(sheet), "counters": self._counter_totals(sheet)}
+                       for sheet in sorted(sheets)},
+        }
+
+    def save(self, filename):
+        with open(filename, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+
+    def summary(self, top=3):
+        """One line for the status bar: total time and the slowest phases"""
+        report = self.to_dict()
+        slowest = sorted(report["phases"].items(), key=lambda item: item[1]["wall_s"], reverse=True)[:top]
+        phases = ", ".join(f"{phase} {timing['wall_s']:.2f}s" for phase, timing in slowest)
+        counters = report["counters"]
+        return (f"{report['wall_s']:.2f}s ({phases}); {counters['keys matched']} keys matched, "
+                f"{counters['cells written']} cells written")
@@ -0,0 +1,227 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import weakref
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from fast_reader import FastSheetReader, value_context
+from xlsx_reader import ValueSheet, sheet_comments, sheet_parts
+
+
+# Rough memory cost of a stored row: tuple and dict entry, plus each value
+_ROW_BYTES = 120
+_CELL_BYTES = 64
+
+# Rows per SQLite statement (stays below SQLite's bound-parameter limit)
+_SQL_BATCH = 500
+
+# Rows read back from disk one at a time that are kept decoded
+_ROW_CACHE_SIZE = 1024
+
+
+def _drop_database(connection, filename):
+    connection.close()
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+class RowStore:
+    """Row number -> tuple of values, kept in memory up to a limit and spilled to SQLite beyond it
+
+    Rows are appended in increasing row order. Once the estimated size of
+    the rows held in memory passes memory_limit_mb they are moved to a
+    temporary SQLite file, and every later row goes there in batches, so
+    memory use stays bounded whatever the size of the sheet.
+    """
+
+    def __init__(self, memory_limit_mb):
+        self.memory_limit_mb = memory_limit_mb
+        self._rows = {}
+        self._size = 0
+        self._db = None
+        self._cache = OrderedDict()
+        self._finalizer = None
+
+    @property
+    def spilled(self):
+        return self._db is not None
+
+    def append(self, row, values):
+        self._rows[row] = values
+        self._size += _ROW_BYTES + _CELL_BYTES * len(values)
+        if self._size > self.memory_limit_mb * (1 << 20) or (self._db is not None and len(self._rows) >= _SQL_BATCH):
+            self._flush()
+
+    def _flush(self):
+        if self._db is None:
+            fd, filename = tempfile.mkstemp(prefix="rtest_rows_", suffix=".sqlite")
+            os.close(fd)
+            self._db = sqlite3.connect(filename, check_same_thread=False)
+            # Scratch data: no journal and no fsync
+            self._db.execute("PRAGMA journal_mode=OFF")
+            self._db.execute("PRAGMA synchronous=OFF")
+            self._db.execute("CREATE TABLE rows (row INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+            # The file goes away with the store, even when a run is cancelled half way
+            self._finalizer = weakref.finalize(self, _drop_database, self._db, filename)
+            print(f"Row values passed {self.memory_limit_mb} MB, spilling to {filename}")
+        self._db.executemany("INSERT INTO rows VALUES (?, ?)",
+                             [(row, pickle.dumps(values, pickle.HIGHEST_PROTOCOL))
+                              for row, values in self._rows.items()])
+        self._rows = {}
+        self._size = 0
+
+    def finish(self):
+        """Write out what is still buffered once every row has been appended"""
+        if self._db is not None:
+            if self._rows:
+                self._flush()
+            self._db.commit()
+
+    def get(self, row):
+        if self._db is None:
+            return self._rows.get(row)
+        if row in self._cache:
+            self._cache.move_to_end(row)
+            return self._cache[row]
+        values = self.fetch([row]).get(row)
+        self._cache[row] = values
+        if len(self._cache) > _ROW_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return values
+
+    def fetch(self, rows):
+        """Row number -> values for those of the given rows that hold anything"""
+        if self._db is None:
+            return {row: self._rows[row] for row in rows if row in self._rows}
+        found = {}
+        wanted = sorted({int(row) for row in rows})
+        for start in range(0, len(wanted), _SQL_BATCH):
+            batch = wanted[start:start + _SQL_BATCH]
+            query = f"SELECT row, data FROM rows WHERE row IN ({','.join('?' * len(batch))})"
+            for row, data in self._db.execute(query, batch):
+                found[row] = pickle.loads(data)
+        return found
+
+    def scan(self, first_row, last_row):
+        """Yield (row, values) for the stored rows between first_row and last_row, in row order"""
+        if self._db is None:
+            for row, values in self._rows.items():
+                if first_row <= row <= last_row:
+                    yield row, values
+            return
+        for row, data in self._db.execute("SELECT row, data FROM rows WHERE row BETWEEN ? AND ? ORDER BY row",
+                                          (first_row, last_row)):
+            yield row, pickle.loads(data)
+
+    def close(self):
+        self._rows = {}
+        self._cache.clear()
+        if self._finalizer is not None:
+            self._finalizer()
+            self._db = None
+
+
+class StreamedSheet(ValueSheet):
+    """Values of one worksheet read in a single pass into a RowStore
+
+    rows yields (row number, tuple of values from column A) in row order,
+    as FastSheetReader.rows() does, so no openpyxl cells are ever built.
+    Bounds are those of the rows yielded, widened by max_row and
+    max_column when given.
+    """
+
+    def __init__(self, title, rows, memory_limit_mb, checkpoint=None, max_row=1, max_column=1):
+        self.title = title
+        self.rows = RowStore(memory_limit_mb)
+        self.max_row = max_row
+        self.max_column = max_column
+        for count, (row, values) in enumerate(rows, start=1):
+            self.max_row = max(self.max_row, row)
+            self.max_column = max(self.max_column, len(values))
+            # Trailing empty cells are not stored
+            end = len(values)
+            while end and values[end - 1] is None:
+                end -= 1
+            if end:
+                self.rows.append(row, tuple(values[:end]))
+            if checkpoint is not None and not count % 10000:
+                checkpoint()
+        self.rows.finish()
+
+    def value(self, row, column):
+        values = self.rows.get(row)
+        if values is None or column > len(values):
+            return None
+        return values[column - 1]
+
+    def read_columns(self, col_indices, first_row, last_row):
+        columns = [[None] * max(0, last_row - first_row + 1) for _ in col_indices]
+        for row, values in self.rows.scan(first_row, last_row):
+            for column, col in zip(columns, col_indices):
+                if col <= len(values):
+                    column[row - first_row] = values[col - 1]
+        return columns
+
+    def read_block(self, rows, cols):
+        found = self.rows.fetch(rows)
+        block = np.empty((len(rows), len(cols)), dtype=object)
+        for i, row in enumerate(rows):
+            values = found.get(int(row), ())
+            for j, col in enumerate(cols):
+                block[i, j] = values[col - 1] if col <= len(values) else None
+        return block
+
+    def close(self):
+        self.rows.close()
+
+
+def stream_sheet(filename, sheet_name, memory_limit_mb, checkpoint=None):
+    """StreamedSheet of the evaluated values of one worksheet, read with the fast values-only reader"""
+    with zipfile.ZipFile(filename) as archive:
+        part = sheet_parts(archive).get(sheet_name)
+        if part is None:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        with archive.open(part) as source:
+            reader = FastSheetReader(source, value_context(archive))
+            sheet = StreamedSheet(sheet_name, reader.rows(), memory_limit_mb, checkpoint)
+        # A full load also creates the cells of merged ranges and comments
+        for _, _, max_row, max_column in reader.merged:
+            sheet.max_row = max(sheet.max_row, max_row)
+            sheet.max_column = max(sheet.max_column, max_column)
+        for row, column in sheet_comments(archive, part):
+            sheet.max_row = max(sheet.max_row, row)
+            sheet.max_column = max(sheet.max_column, column)
+    return sheet
+
+
+class StreamedWorkbook:
+    """Stand-in for the new workbook in low-memory runs
+
+    Sheets are streamed on first access and only one is held at a time;
+    opening another sheet releases the previous one.
+    """
+
+    def __init__(self, filename, memory_limit_mb, checkpoint=None):
+        self.filename = filename
+        self.memory_limit_mb = memory_limit_mb
+        self.checkpoint = checkpoint
+        with zipfile.ZipFile(filename) as archive:
+            self.sheetnames = list(sheet_parts(archive))
+        self._sheet = None
+
+    def __getitem__(self, sheet_name):
+        if self._sheet is None or self._sheet.title != sheet_name:
+            self.close()
+            self._sheet = stream_sheet(self.filename, sheet_name, self.memory_limit_mb, self.checkpoint)
+        return self._sheet
+
+    def close(self):
+        if self._sheet is not None:
+            self._sheet.close()
+            self._sheet = None
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tool's modules are flat siblings imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
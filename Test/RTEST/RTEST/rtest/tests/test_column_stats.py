@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import openpyxl
+
+import rtest
+
+
+class _Var:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def _app(old_file):
+    app = rtest.ExcelComparisonApp.__new__(rtest.ExcelComparisonApp)
+    app._stats_pool = ThreadPoolExecutor(max_workers=1)
+    app._stats_jobs = {}
+    app.old_file_path = _Var(old_file)
+    app.header_row = _Var(1)
+    app.sheet_vars = {"Data": _Var(True)}
+    return app
+
+
+def test_repeated_ticks_parse_the_old_file_once(tmp_path, monkeypatch):
+    old_file = str(tmp_path / "old.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "Data"
+    workbook.active.append(["Team", "App"])
+    for i in range(50):
+        workbook.active.append([f"T{i % 3}", f"A{i}"])
+    workbook.save(old_file)
+
+    parses = []
+
+    class CountingWorkbook(rtest.DualViewWorkbook):
+        def __init__(self, path):
+            parses.append(path)
+            super().__init__(path)
+
+    monkeypatch.setattr(rtest, "DualViewWorkbook", CountingWorkbook)
+    monkeypatch.setattr(rtest, "_workbook_cache", rtest.WorkbookCache())
+    app = _app(old_file)
+    for _ in range(20):
+        app._prepare_column_stats("Data")
+    stats = app._column_stats(old_file, "Data")
+    app._stats_pool.shutdown(wait=True)
+
+    assert len(parses) == 1
+    assert stats.distinct(1) == ["T0", "T1", "T2"]
+    assert not app._stats_jobs
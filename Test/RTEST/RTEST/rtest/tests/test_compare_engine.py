@@ -0,0 +1,52 @@
+import openpyxl
+import pytest
+from openpyxl.comments import Comment
+
+from compare_engine import compare_keyed_sheet_file
+
+HEADERS = ["Team", "App Name", "Category", "Owner", "Count"]
+
+
+def _rows(count, changed=()):
+    rows = []
+    for i in range(count):
+        owner = f"owner {i}" + (" (moved)" if i in changed else "")
+        rows.append([f"T{i % 3}", f"App{i}", "Cat" if i % 2 else "Misc", owner, i])
+    return rows
+
+
+def _save(path, rows, comments=None):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Data"
+    sheet.append(HEADERS)
+    for row in rows:
+        sheet.append(row)
+    for (row, col), text in (comments or {}).items():
+        sheet.cell(row=row, column=col).comment = Comment(text, "tester")
+    workbook.save(path)
+    return str(path)
+
+
+def _settings(**extra):
+    settings = {"header_row": 1, "team_column": "Team", "app_name_column": "App Name",
+                "category_column": "Category", "additional_criteria": [], "filters": [],
+                "formula_map": {}, "incremental": False}
+    settings.update(extra)
+    return settings
+
+
+@pytest.fixture
+def files(tmp_path):
+    old_file = _save(tmp_path / "old.xlsx", _rows(30))
+    # Reversed, so matching rows sit on other row numbers
+    new_rows = list(reversed(_rows(30, changed={4, 17})))
+    new_file = _save(tmp_path / "new.xlsx", new_rows, {(31 - 4, 4): "moved team", (2, 1): "untouched"})
+    return old_file, new_file
+
+
+def test_worker_result_carries_comments_of_changed_cells(files):
+    result = compare_keyed_sheet_file(*files, "Data", _settings())
+    assert sorted((old_row, col, new_value) for old_row, _, col, _, new_value in result.changes) == [
+        (6, 4, "owner 4 (moved)"), (19, 4, "owner 17 (moved)")]
+    assert {key: comment.text for key, comment in result.comments.items()} == {(27, 4): "moved team"}
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from compare_engine import ValueFilter
+
+
+def _passed(value_filter, values):
+    mask = value_filter.mask(pd.Series(values, dtype=object))
+    return [value for value, keep in zip(values, mask) if keep]
+
+
+def test_plain_values_match_whole_values_ignoring_case():
+    assert _passed(ValueFilter(["team a"]), ["Team A", "Team AB", "team a"]) == ["Team A", "team a"]
+
+
+def test_wildcards_and_regexes_are_literal_without_patterns():
+    values = ["Team*", "Team A", "re:^T", "Tx"]
+    assert _passed(ValueFilter(["Team*", "re:^T"]), values) == ["Team*", "re:^T"]
+
+
+def test_patterns_opt_in():
+    values = ["Team A", "Team B", "Other", "T1"]
+    assert _passed(ValueFilter(["team ?"], patterns=True), values) == ["Team A", "Team B"]
+    assert _passed(ValueFilter([r"re:^t\d$"], patterns=True), values) == ["T1"]
+
+
+def test_invalid_regex_is_rejected_with_a_message():
+    with pytest.raises(ValueError, match="Invalid regular expression"):
+        ValueFilter(["re:("], patterns=True)
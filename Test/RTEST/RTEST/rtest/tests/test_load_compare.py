@@ -0,0 +1,56 @@
+import multiprocessing
+import time
+
+import openpyxl
+import pytest
+
+import rtest
+from job_runner import JobCancelled
+
+
+def _slow_read(*args):
+    time.sleep(60)
+
+
+@pytest.fixture
+def workbook_pair(tmp_path):
+    paths = []
+    for name in ("old", "new"):
+        path = str(tmp_path / f"{name}.xlsx")
+        workbook = openpyxl.Workbook()
+        workbook.active.title = "Data"
+        for row in range(2000):
+            workbook.active.append([f"{name} {row}", row, row * 2.5])
+        workbook.save(path)
+        paths.append(path)
+    return paths
+
+
+def test_cancelled_load_terminates_the_worker_process(workbook_pair, monkeypatch):
+    monkeypatch.setattr(rtest, "PARALLEL_LOAD_MIN_BYTES", 0)
+    monkeypatch.setattr(rtest.os, "cpu_count", lambda: 2)
+    monkeypatch.setattr(rtest, "_workbook_cache", rtest.WorkbookCache())
+    # The worker is still parsing when the run is cancelled
+    monkeypatch.setattr(rtest, "read_value_workbook", _slow_read)
+
+    def cancelled():
+        raise JobCancelled()
+
+    with pytest.raises(JobCancelled):
+        rtest.load_compare_workbooks(*workbook_pair, ["Data"], None, cancelled)
+    deadline = time.time() + 5
+    while multiprocessing.active_children() and time.time() < deadline:
+        time.sleep(0.05)
+    assert not multiprocessing.active_children()
+
+
+def test_worker_load_matches_a_load_in_this_process(workbook_pair, monkeypatch):
+    monkeypatch.setattr(rtest, "_workbook_cache", rtest.WorkbookCache())
+    _, local = rtest.load_compare_workbooks(*workbook_pair, ["Data"])
+    monkeypatch.setattr(rtest, "PARALLEL_LOAD_MIN_BYTES", 0)
+    monkeypatch.setattr(rtest.os, "cpu_count", lambda: 2)
+    monkeypatch.setattr(rtest, "_workbook_cache", rtest.WorkbookCache())
+    _, worker = rtest.load_compare_workbooks(*workbook_pair, ["Data"])
+    rows = lambda book: list(book["Data"].iter_rows(values_only=True))
+    assert rows(worker) == rows(local)
+    assert rows(local)[5] == ("new 5", 5, 12.5)
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from rtest import WorkbookCache
+
+
+@pytest.fixture
+def workbook_file(tmp_path):
+    path = tmp_path / "book.xlsx"
+    path.write_bytes(b"not parsed by these tests")
+    return str(path)
+
+
+def _slow_loader(calls, started, value="parsed"):
+    def load():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return value
+    return load
+
+
+def test_concurrent_gets_share_one_load(workbook_file):
+    cache = WorkbookCache()
+    calls, started, results = [], threading.Event(), []
+    loader = _slow_loader(calls, started, object())
+    first = threading.Thread(target=lambda: results.append(cache.get(workbook_file, "dual", loader)))
+    first.start()
+    started.wait()
+    assert cache.contains(workbook_file, "dual")
+    results.append(cache.get(workbook_file, "dual", loader))
+    first.join()
+    assert len(calls) == 1
+    assert results[0] is results[1]
+
+
+def test_take_waits_for_a_load_in_progress_and_removes_it(workbook_file):
+    cache = WorkbookCache()
+    calls, started = [], threading.Event()
+    loader = _slow_loader(calls, started)
+    thread = threading.Thread(target=cache.get, args=(workbook_file, "dual", loader))
+    thread.start()
+    started.wait()
+    assert cache.take(workbook_file, "dual", loader) == "parsed"
+    thread.join()
+    assert len(calls) == 1
+    assert not cache.contains(workbook_file, "dual")
+
+
+def test_failed_load_is_not_cached(workbook_file):
+    cache = WorkbookCache()
+
+    def fail():
+        raise OSError("locked")
+
+    with pytest.raises(OSError):
+        cache.get(workbook_file, "dual", fail)
+    assert not cache.contains(workbook_file, "dual")
+    assert cache.get(workbook_file, "dual", lambda: "parsed") == "parsed"
+
+
+def test_failed_store_releases_waiters(workbook_file, monkeypatch):
+    cache = WorkbookCache()
+    calls, started, errors = [], threading.Event(), []
+
+    def broken_store(key, value):
+        raise TypeError("cannot size")
+
+    monkeypatch.setattr(cache, "_store", broken_store)
+
+    def first():
+        try:
+            cache.get(workbook_file, "dual", _slow_loader(calls, started))
+        except TypeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    started.wait()
+    with pytest.raises(TypeError):
+        cache.get(workbook_file, "dual", _slow_loader(calls, threading.Event()))
+    thread.join()
+    assert len(errors) == 1
+    assert len(calls) == 1
+    assert not cache.contains(workbook_file, "dual")
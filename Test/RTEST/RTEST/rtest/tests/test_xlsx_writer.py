@@ -0,0 +1,97 @@
+import zipfile
+
+import openpyxl
+import pytest
+
+import xlsx_writer
+from xlsx_writer import patch_workbook, PatchUnsupported
+
+
+def _with_cached_values(path, cached):
+    """Give formula cells the cached results Excel would have saved; openpyxl writes none"""
+    with zipfile.ZipFile(path) as archive:
+        parts = {info.filename: archive.read(info) for info in archive.infolist()}
+    sheet = parts['xl/worksheets/sheet1.xml'].decode()
+    for ref, value in cached.items():
+        start = sheet.index(f'<c r="{ref}"')
+        end = sheet.index('</f>', start) + len('</f>')
+        sheet = sheet[:end] + f'<v>{value}</v>' + sheet[end:]
+    parts['xl/worksheets/sheet1.xml'] = sheet.encode()
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+
+
+@pytest.fixture
+def workbook_file(tmp_path):
+    path = str(tmp_path / "old.xlsx")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Data"
+    for row in range(1, 201):
+        sheet.append([row * 10, f"=A{row}*2", f"name {row}"])
+    workbook.create_sheet("Other")["A1"] = "untouched"
+    workbook.save(path)
+    _with_cached_values(path, {f"B{row}": row * 20 for row in range(1, 201)})
+    return path
+
+
+def test_patched_values_round_trip(workbook_file, tmp_path, monkeypatch):
+    # Small chunks make the rows cross chunk boundaries
+    monkeypatch.setattr(xlsx_writer, "_CHUNK_SIZE", 64)
+    output = str(tmp_path / "new.xlsx")
+    patch_workbook(workbook_file, output, {"Data": {(1, 1): 99, (150, 3): "renamed", (250, 2): True}})
+
+    sheet = openpyxl.load_workbook(output)["Data"]
+    assert sheet["A1"].value == 99
+    assert sheet["B1"].value == "=A1*2"
+    assert sheet["C150"].value == "renamed"
+    assert sheet["B250"].value is True
+    assert sheet["C149"].value == "name 149"
+    assert openpyxl.load_workbook(output)["Other"]["A1"].value == "untouched"
+
+
+def test_dependent_formulas_are_not_left_stale(workbook_file, tmp_path):
+    assert openpyxl.load_workbook(workbook_file, data_only=True)["Data"]["B1"].value == 20
+    output = str(tmp_path / "new.xlsx")
+    patch_workbook(workbook_file, output, {"Data": {(1, 1): 99}})
+
+    workbook = openpyxl.load_workbook(output, data_only=True)
+    assert workbook["Data"]["A1"].value == 99
+    assert workbook["Data"]["B1"].value is None
+    assert workbook["Data"]["B200"].value is None
+    assert workbook.calculation.fullCalcOnLoad
+
+
+def test_calculation_chain_is_dropped(workbook_file, tmp_path):
+    with zipfile.ZipFile(workbook_file) as archive:
+        parts = {info.filename: archive.read(info) for info in archive.infolist()}
+    parts['xl/calcChain.xml'] = (b'<calcChain xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                                 b'<c r="B1" i="1"/></calcChain>')
+    parts['xl/_rels/workbook.xml.rels'] = parts['xl/_rels/workbook.xml.rels'].replace(
+        b'</Relationships>',
+        b'<Relationship Id="rIdChain" Target="calcChain.xml" Type="http://schemas.openxmlformats.org/'
+        b'officeDocument/2006/relationships/calcChain"/></Relationships>')
+    parts['[Content_Types].xml'] = parts['[Content_Types].xml'].replace(
+        b'</Types>',
+        b'<Override PartName="/xl/calcChain.xml" ContentType="application/vnd.openxmlformats-officedocument.'
+        b'spreadsheetml.calcChain+xml"/></Types>')
+    with zipfile.ZipFile(workbook_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+
+    output = str(tmp_path / "new.xlsx")
+    patch_workbook(workbook_file, output, {"Data": {(1, 1): 99}})
+    with zipfile.ZipFile(output) as archive:
+        assert 'xl/calcChain.xml' not in archive.namelist()
+        assert b'calcChain' not in archive.read('xl/_rels/workbook.xml.rels')
+        assert b'calcChain' not in archive.read('[Content_Types].xml')
+    assert openpyxl.load_workbook(output)["Data"]["A1"].value == 99
+
+
+def test_unsupported_value_leaves_output_untouched(workbook_file, tmp_path):
+    output = tmp_path / "new.xlsx"
+    with pytest.raises(PatchUnsupported):
+        patch_workbook(workbook_file, str(output), {"Data": {(1, 1): float("nan")}})
+    assert not output.exists()
+    assert list(tmp_path.iterdir()) == [tmp_path / "old.xlsx"]
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import os
 import sys
+import multiprocessing
 from pathlib import Path
 
 class ToolLauncher:
@@ -877,4 +878,6 @@ def main():
         messagebox.showerror("Startup Error", f"Failed to start Tool Launcher:\n{str(e)}")
 
 if __name__ == "__main__":
+    # Needed by the sheet worker processes when running as a frozen executable
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
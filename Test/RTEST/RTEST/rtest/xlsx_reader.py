@@ -0,0 +1,741 @@
+import hashlib
+import posixpath
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+import openpyxl
+import openpyxl.reader.excel as excel_reader
+from openpyxl.worksheet._reader import (
+    WorkSheetParser, WorksheetReader, VALUE_TAG, _cast_number
+)
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple, range_boundaries
+from openpyxl.comments.comment_sheet import CommentSheet
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+from openpyxl.xml.constants import COMMENTS_NS, SHEET_MAIN_NS, REL_NS, PKG_REL_NS
+from openpyxl.xml.functions import fromstring
+
+from fast_reader import FastSheetReader, value_context
+
+
+# Lightweight stand-in for an openpyxl cell when only the value (and comment) is needed
+ValueCell = namedtuple("ValueCell", ["value", "comment"], defaults=[None])
+
+# openpyxl picks its worksheet reader from a module global, so swapping it
+# has to be serialised between threads
+_reader_lock = threading.Lock()
+
+_CELL_TAG = '{%s}c' % SHEET_MAIN_NS
+_ROW_TAG = '{%s}row' % SHEET_MAIN_NS
+_FORMULA_TAG = '{%s}f' % SHEET_MAIN_NS
+_SHEET_TAG = '{%s}sheet' % SHEET_MAIN_NS
+_REL_TAG = '{%s}Relationship' % PKG_REL_NS
+_REL_ID = '{%s}id' % REL_NS
+_DIMENSION_TAG = '{%s}dimension' % SHEET_MAIN_NS
+_SHEET_DATA_TAG = '{%s}sheetData' % SHEET_MAIN_NS
+_INLINE_TAG = '{%s}is' % SHEET_MAIN_NS
+_SI_TAG = '{%s}si' % SHEET_MAIN_NS
+_TEXT_TAG = '{%s}t' % SHEET_MAIN_NS
+_RUN_TAG = '{%s}r' % SHEET_MAIN_NS
+
+# Formula indexes already built, keyed by (file digest, sheet name)
+_FORMULA_INDEX_CACHE_SIZE = 32
+_formula_index_cache = OrderedDict()
+_formula_index_lock = threading.Lock()
+
+
+class _ProjectedParser(WorkSheetParser):
+    """Worksheet parser that only decodes the cells of some columns
+
+    columns is a set of 1-based column indices, or None for every column.
+    A skipped cell is still kept when it is the first to reach a new
+    column or is the only cell of its row, so the sheet reports the same
+    max_row and max_column as a full parse.
+    """
+
+    def __init__(self, *args, columns=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.columns = columns
+        self._max_column = 0
+
+    def parse_row(self, row):
+        if self.columns is not None and len(row) and all('r' in cell.attrib for cell in row):
+            kept = []
+            for cell in row:
+                col = column_index_from_string(cell.get('r').rstrip('0123456789'))
+                if col in self.columns or col > self._max_column:
+                    kept.append(cell)
+                self._max_column = max(self._max_column, col)
+            # Positions of the cells are in their r attributes, so dropping the rest is safe
+            row[:] = kept or row[:1]
+        return super().parse_row(row)
+
+
+class _DualViewParser(_ProjectedParser):
+    """Worksheet parser that also keeps the cached result of formula cells"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cached_values = {}
+
+    def parse_cell(self, element):
+        cell = super().parse_cell(element)
+        if cell['data_type'] == 'f':
+            self.cached_values[(cell['row'], cell['column'])] = self._cached_value(element, cell['style_id'])
+        return cell
+
+    def _cached_value(self, element, style_id):
+        """Decode the <v> of a formula cell the same way data_only=True would"""
+        value = element.findtext(VALUE_TAG, None) or None
+        if value is None:
+            return None
+
+        data_type = element.get('t', 'n')
+        try:
+            if data_type == 'n':
+                value = _cast_number(value)
+                if style_id in self.date_formats:
+                    value = from_excel(value, self.epoch, timedelta=style_id in self.timedelta_formats)
+            elif data_type == 's':
+                value = self.shared_strings[int(value)]
+            elif data_type == 'b':
+                value = bool(int(value))
+            elif data_type == 'd':
+                value = from_ISO8601(value)
+        except (OverflowError, ValueError):
+            value = "#VALUE!"
+        return value
+
+
+class _DualViewWorksheetReader(WorksheetReader):
+    """WorksheetReader that parses with _DualViewParser"""
+
+    def __init__(self, ws, xml_source, shared_strings, data_only, rich_text):
+        super().__init__(ws, xml_source, shared_strings, data_only, rich_text)
+        self.parser = _DualViewParser(
+            xml_source, shared_strings, data_only, ws.parent.epoch,
+            ws.parent._date_formats, ws.parent._timedelta_formats, rich_text
+        )
+        ws._cached_values = self.parser.cached_values
+
+
+class ValueSheet:
+    """Base for read-only sheet views that look values up with value(row, column)"""
+
+    comments = {}  # (row, column) -> openpyxl Comment, for views that carry them
+
+    def value(self, row, column):
+        raise NotImplementedError
+
+    def cell(self, row, column):
+        """Mirror Worksheet.cell() for callers that only read .value and .comment"""
+        return ValueCell(self.value(row, column), self.comments.get((row, column)))
+
+    def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None, values_only=True):
+        """Yield rows of values (values_only is always on for these views)"""
+        min_row = min_row or 1
+        min_col = min_col or 1
+        max_row = max_row or self.max_row
+        max_col = max_col or self.max_column
+        for row in range(min_row, max_row + 1):
+            yield tuple(self.value(row, col) for col in range(min_col, max_col + 1))
+
+    def read_columns(self, col_indices, first_row, last_row):
+        """Whole columns (1-based indices) between two rows, as lists"""
+        rows = range(first_row, last_row + 1)
+        return [[self.value(row, col) for row in rows] for col in col_indices]
+
+    def read_block(self, rows, cols):
+        """2-D object matrix of values for the given rows and columns"""
+        block = np.empty((len(rows), len(cols)), dtype=object)
+        for j, col in enumerate(cols):
+            block[:, j] = [self.value(row, col) for row in rows]
+        return block
+
+
+class CachedValueSheet(ValueSheet):
+    """Read-only view of a formula worksheet that returns cached formula results"""
+
+    def __init__(self, worksheet, cached_values):
+        self.worksheet = worksheet
+        self.cached_values = cached_values
+        self.title = worksheet.title
+
+    @property
+    def max_row(self):
+        return self.worksheet.max_row
+
+    @property
+    def max_column(self):
+        return self.worksheet.max_column
+
+    def value(self, row, column):
+        key = (row, column)
+        if key in self.cached_values:
+            return self.cached_values[key]
+        cell = self.worksheet._cells.get(key)
+        return cell.value if cell is not None else None
+
+
+class SheetValues(ValueSheet):
+    """Cell values of one worksheet held in a plain dict, without openpyxl cells
+
+    overrides (the cached results of formula cells) take precedence over
+    values, which gives the data_only view of the same parse.
+    """
+
+    def __init__(self, title, values, overrides=None):
+        self.title = title
+        self.values = values
+        self.overrides = overrides or {}
+        # Same bounds openpyxl reports for a sheet holding these cells
+        self.max_row = max((row for row, _ in values), default=1)
+        self.max_column = max((col for _, col in values), default=1)
+
+    def value(self, row, column):
+        key = (row, column)
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.values.get(key)
+
+
+class DualViewWorkbook:
+    """Workbook parsed once that exposes both a formula view and a cached-value view
+
+    The formula view is a normal editable openpyxl workbook (what
+    load_workbook(data_only=False) returns). The cached-value view returns
+    what load_workbook(data_only=True) would, without a second parse.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with _reader_lock:
+            original_reader = excel_reader.WorksheetReader
+            excel_reader.WorksheetReader = _DualViewWorksheetReader
+            try:
+                self.workbook = openpyxl.load_workbook(filename, data_only=False)
+            finally:
+                excel_reader.WorksheetReader = original_reader
+
+        self._cached = {}
+        for ws in self.workbook.worksheets:
+            self._cached[ws.title] = getattr(ws, '_cached_values', {})
+            if hasattr(ws, '_cached_values'):
+                del ws._cached_values
+
+    @property
+    def sheetnames(self):
+        return self.workbook.sheetnames
+
+    def formula_sheet(self, sheet_name):
+        """Editable worksheet holding formulas"""
+        return self.workbook[sheet_name]
+
+    def value_sheet(self, sheet_name):
+        """Cached-value view of the same worksheet"""
+        return CachedValueSheet(self.workbook[sheet_name], self._cached.get(sheet_name, {}))
+
+    def save(self, filename):
+        self.workbook.save(filename)
+
+    def close(self):
+        self.workbook.close()
+        self._cached = {}
+
+
+def read_sheet_views(filename, sheet_name, columns=None):
+    """Parse a single worksheet into (formula view, cached-value view)
+
+    Only the workbook-level parts and this one sheet are read, which makes
+    it much cheaper than loading the whole workbook when a worker process
+    needs just one sheet. With columns (a set of column indices) only
+    those cells are decoded (see _ProjectedParser).
+    """
+    workbook = openpyxl.load_workbook(filename, read_only=True)
+    try:
+        worksheet = workbook[sheet_name]
+        values = {}
+        with worksheet._get_source() as source:
+            parser = _DualViewParser(
+                source, worksheet._shared_strings, False, workbook.epoch,
+                workbook._date_formats, workbook._timedelta_formats, columns=columns
+            )
+            for _, row in parser.parse():
+                for cell in row:
+                    values[(cell['row'], cell['column'])] = cell['value']
+    finally:
+        workbook.close()
+
+    return (SheetValues(sheet_name, values),
+            SheetValues(sheet_name, values, parser.cached_values))
+
+
+class GridSheet(ValueSheet):
+    """Cell values of one worksheet in a 2-D object array, cheap to send between processes
+
+    grid[row - 1, i] holds the value at column columns[i]; columns that
+    were not stored read as empty. max_row and max_column are those of
+    the whole sheet, which can be wider than the stored columns.
+    """
+
+    def __init__(self, title, grid, columns, max_row, max_column, comments=None):
+        self.title = title
+        self.grid = grid
+        self.columns = columns
+        self.max_row = max_row
+        self.max_column = max_column
+        self.comments = comments or {}
+        self._positions = {col: i for i, col in enumerate(columns.tolist())}
+
+    def value(self, row, column):
+        position = self._positions.get(column)
+        if position is None or not 1 <= row <= len(self.grid):
+            return None
+        return self.grid[row - 1, position]
+
+    def read_columns(self, col_indices, first_row, last_row):
+        count = max(0, last_row - first_row + 1)
+        stored = self.grid[max(first_row, 1) - 1:last_row]
+        lead = [None] * (max(1, first_row) - first_row)
+        columns = []
+        for col in col_indices:
+            position = self._positions.get(col)
+            if position is None:
+                columns.append([None] * count)
+            else:
+                values = lead + stored[:, position].tolist()
+                columns.append(values + [None] * (count - len(values)))
+        return columns
+
+    def read_block(self, rows, cols):
+        rows = np.asarray(rows, dtype=np.int64)
+        block = np.full((len(rows), len(cols)), None, dtype=object)
+        inside = (rows >= 1) & (rows <= len(self.grid))
+        for j, col in enumerate(cols):
+            position = self._positions.get(col)
+            if position is not None:
+                block[inside, j] = self.grid[rows[inside] - 1, position]
+        return block
+
+
+class ValueWorkbook:
+    """Read-only stand-in for a data_only workbook, holding a ValueSheet per loaded sheet"""
+
+    def __init__(self, sheets):
+        self._sheets = OrderedDict((sheet.title, sheet) for sheet in sheets)
+
+    @property
+    def sheetnames(self):
+        return list(self._sheets)
+
+    @property
+    def worksheets(self):
+        return list(self._sheets.values())
+
+    def __getitem__(self, sheet_name):
+        if sheet_name not in self._sheets:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        return self._sheets[sheet_name]
+
+    def close(self):
+        pass
+
+
+def sheet_comments(archive, part):
+    """(row, column) -> Comment of every cell comment of a worksheet part"""
+    comments = {}
+    rels_path = get_rels_path(part)
+    if rels_path not in archive.NameToInfo:
+        return comments
+    for rel in get_dependents(archive, rels_path).find(COMMENTS_NS):
+        comment_sheet = CommentSheet.from_tree(fromstring(archive.read(rel.target)))
+        for ref, comment in comment_sheet.comments:
+            comments[coordinate_to_tuple(ref)] = comment
+    return comments
+
+
+def _read_sheets_openpyxl(filename, sheet_names, columns):
+    """ValueSheets decoded with openpyxl's worksheet parser (cell dicts, no Cell objects)"""
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    sheets = []
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            parts = sheet_parts(archive)
+            for sheet_name in sheet_names:
+                worksheet = workbook[sheet_name]
+                rows, cols, values = [], [], []
+                with worksheet._get_source() as source:
+                    parser = _ProjectedParser(
+                        source, worksheet._shared_strings, True, workbook.epoch,
+                        workbook._date_formats, workbook._timedelta_formats, columns=columns.get(sheet_name)
+                    )
+                    for _, row in parser.parse():
+                        for cell in row:
+                            rows.append(cell['row'])
+                            cols.append(cell['column'])
+                            values.append(cell['value'])
+                merged = []
+                if parser.merged_cells:
+                    for cell_range in parser.merged_cells.mergeCell:
+                        min_col, min_row, max_col, max_row = range_boundaries(cell_range.ref)
+                        merged.append((min_row, min_col, max_row, max_col))
+                comments = sheet_comments(archive, parts[sheet_name])
+                sheets.append(_value_sheet(sheet_name, rows, cols, values, comments, merged))
+    finally:
+        workbook.close()
+    return sheets
+
+
+def _read_sheets_fast(filename, sheet_names, columns):
+    """ValueSheets decoded by FastSheetReader straight from the XML"""
+    sheets = []
+    with zipfile.ZipFile(filename) as archive:
+        parts = sheet_parts(archive)
+        context = value_context(archive)
+        for sheet_name in sheet_names:
+            if sheet_name not in parts:
+                raise KeyError(f"Worksheet {sheet_name} does not exist.")
+            rows, cols, values = [], [], []
+            last_row = 0
+            with archive.open(parts[sheet_name]) as source:
+                reader = FastSheetReader(source, context, columns.get(sheet_name))
+                for last_row, row_values in reader.rows():
+                    for col, value in enumerate(row_values, start=1):
+                        if value is not None:
+                            rows.append(last_row)
+                            cols.append(col)
+                            values.append(value)
+            # Empty cells still count towards the bounds
+            if last_row > max(rows, default=0) or reader.max_column > max(cols, default=0):
+                rows.append(last_row)
+                cols.append(reader.max_column)
+                values.append(None)
+            comments = sheet_comments(archive, parts[sheet_name])
+            sheets.append(_value_sheet(sheet_name, rows, cols, values, comments, reader.merged))
+    return sheets
+
+
+# Backends that can read the values of a workbook
+_VALUE_BACKENDS = {"openpyxl": _read_sheets_openpyxl, "fast": _read_sheets_fast}
+VALUE_BACKENDS = tuple(_VALUE_BACKENDS)
+
+
+def value_backend(formulas=False, styles=False):
+    """Backend for a read: the fast values-only reader, unless the job needs formulas or styles
+
+    Jobs that do need them have to load an openpyxl workbook (see
+    DualViewWorkbook); of the values-only backends openpyxl is the one
+    that shares its decoding with such loads.
+    """
+    return "openpyxl" if formulas or styles else "fast"
+
+
+def read_value_workbook(filename, sheet_names, columns=None, backend=None):
+    """ValueWorkbook of the evaluated values (what load_workbook(data_only=True) gives) of some sheets
+
+    Only the sheets in sheet_names are parsed, without building openpyxl
+    cells. columns maps a sheet name to the column indices to decode, as
+    in read_sheet_views(). Cell comments come along. The result is plain
+    arrays and dicts, so it is the way a worker process hands a parsed
+    workbook back. backend is one of VALUE_BACKENDS (value_backend() when
+    not given); a file the fast reader cannot read is read with openpyxl.
+    """
+    backend = backend or value_backend()
+    if backend not in _VALUE_BACKENDS:
+        raise ValueError(f"Unknown reader backend: {backend}")
+    columns = columns or {}
+    try:
+        return ValueWorkbook(_VALUE_BACKENDS[backend](filename, sheet_names, columns))
+    except (KeyError, OSError, zipfile.BadZipFile):
+        raise
+    except Exception as e:
+        if backend == "openpyxl":
+            raise
+        print(f"Fast reader failed on {filename} ({e}), reading it with openpyxl")
+        return ValueWorkbook(_read_sheets_openpyxl(filename, sheet_names, columns))
+
+
+def _value_sheet(title, rows, cols, values, comments, merged=()):
+    """GridSheet of parsed cells, or SheetValues when they are too sparse for a grid
+
+    Bounds take in cells with a comment and merged ranges, as a full load
+    creates cells for both. Covered cells of a merge hold no value in
+    files Excel writes, so their values are not cleared.
+    """
+    max_row = max([max(rows, default=1)] + [row for row, _ in comments] + [r[2] for r in merged])
+    max_column = max([max(cols, default=1)] + [col for _, col in comments] + [r[3] for r in merged])
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    stored = np.unique(cols)
+    grid_rows = int(rows.max()) if len(rows) else 0
+    if grid_rows * len(stored) > 4 * len(values) + (1 << 20):
+        sheet = SheetValues(title, dict(zip(zip(rows.tolist(), cols.tolist()), values)))
+        sheet.max_row, sheet.max_column = max_row, max_column
+        sheet.comments = comments
+        return sheet
+    grid = np.full((grid_rows, len(stored)), None, dtype=object)
+    value_array = np.empty(len(values), dtype=object)
+    value_array[:] = values
+    grid[rows - 1, np.searchsorted(stored, cols)] = value_array
+    return GridSheet(title, grid, stored, max_row, max_column, comments)
+
+
+def file_digest(filename, chunk_size=1 << 20):
+    """Content hash of a file, used to key caches that must survive renames"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sheet_parts(archive):
+    """Map each worksheet name to its XML part inside an open xlsx zip"""
+    targets = {}
+    with archive.open('xl/_rels/workbook.xml.rels') as fh:
+        for _, element in iterparse(fh):
+            if element.tag == _REL_TAG:
+                target = element.get('Target')
+                if target.startswith('/'):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join('xl', target))
+                targets[element.get('Id')] = target
+
+    parts = OrderedDict()
+    with archive.open('xl/workbook.xml') as fh:
+        for _, element in iterparse(fh):
+            if element.tag == _SHEET_TAG:
+                target = targets.get(element.get(_REL_ID))
+                if target and target in archive.NameToInfo:
+                    parts[element.get('name')] = target
+    return parts
+
+
+def _shared_strings_part(archive):
+    """Name of the shared strings part of an open xlsx zip, or None"""
+    with archive.open('xl/_rels/workbook.xml.rels') as fh:
+        for _, element in iterparse(fh):
+            if element.tag == _REL_TAG and element.get('Type', '').endswith('/sharedStrings'):
+                target = element.get('Target')
+                if target.startswith('/'):
+                    return target[1:]
+                return posixpath.normpath(posixpath.join('xl', target))
+    return None
+
+
+def _string_text(element):
+    """Text of a shared or inline string, rich text runs joined and phonetic hints left out"""
+    if element.find(_TEXT_TAG) is not None:
+        return element.findtext(_TEXT_TAG)
+    return "".join(run.findtext(_TEXT_TAG, "") for run in element.iter(_RUN_TAG))
+
+
+def _read_shared_strings(archive, indices):
+    """{index: text} of the given shared strings, reading the part only as far as the highest one"""
+    found = {}
+    part = _shared_strings_part(archive)
+    if not indices or part is None or part not in archive.NameToInfo:
+        return found
+    last = max(indices)
+    index = 0
+    with archive.open(part) as fh:
+        for _, element in iterparse(fh):
+            if element.tag == _SI_TAG:
+                if index in indices:
+                    found[index] = _string_text(element)
+                element.clear()
+                if index >= last:
+                    break
+                index += 1
+    return found
+
+
+def probe_workbook(filename):
+    """{sheet name: dimension ref or None} straight from the zip, without parsing any cell
+
+    The dimension is the used range the file declares (e.g. "A1:H65");
+    only the start of each worksheet part is read to find it.
+    """
+    sheets = OrderedDict()
+    with zipfile.ZipFile(filename) as archive:
+        for sheet_name, part in sheet_parts(archive).items():
+            dimension = None
+            with archive.open(part) as fh:
+                for event, element in iterparse(fh, events=('start',)):
+                    if element.tag == _DIMENSION_TAG:
+                        dimension = element.get('ref')
+                        break
+                    if element.tag == _SHEET_DATA_TAG:
+                        break  # <dimension> always comes before the cells
+            sheets[sheet_name] = dimension
+    return sheets
+
+
+def dimension_size(ref):
+    """(rows, columns) spanned by a dimension ref such as "A1:H65", or None"""
+    if not ref:
+        return None
+    first, _, last = ref.partition(":")
+    try:
+        min_row, min_col = coordinate_to_tuple(first)
+        max_row, max_col = coordinate_to_tuple(last or first)
+    except (ValueError, TypeError):
+        return None
+    return max_row - min_row + 1, max_col - min_col + 1
+
+
+def probe_header_row(filename, sheet_name, header_row, formulas=False):
+    """Values of one row of a sheet (index 0 is column A), read straight from the zip
+
+    The sheet XML is only read up to that row and the shared strings only
+    up to the highest one it uses, so this takes about the same time on
+    a sheet of any size. Numbers are not converted to dates. Formula
+    cells give their cached result, or with formulas their formula text
+    as the formula view does (only the start of it for shared formulas).
+    """
+    cells = {}  # column -> (type, raw text)
+    with zipfile.ZipFile(filename) as archive:
+        part = sheet_parts(archive).get(sheet_name)
+        if part is None:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        row_counter = 0
+        with archive.open(part) as fh:
+            for event, element in iterparse(fh, events=('start', 'end')):
+                if element.tag != _ROW_TAG:
+                    continue
+                if event == 'start':
+                    r = element.get('r')
+                    row_counter = int(r) if r else row_counter + 1
+                    if row_counter > header_row:
+                        break
+                    continue
+                if row_counter == header_row:
+                    col_counter = 0
+                    for cell in element.iter(_CELL_TAG):
+                        ref = cell.get('r')
+                        col_counter = coordinate_to_tuple(ref)[1] if ref else col_counter + 1
+                        data_type = cell.get('t', 'n')
+                        formula = cell.find(_FORMULA_TAG) if formulas else None
+                        if formula is not None:
+                            cells[col_counter] = ('str', '=' + (formula.text or ''))
+                        elif data_type == 'inlineStr':
+                            inline = cell.find(_INLINE_TAG)
+                            cells[col_counter] = ('str', _string_text(inline) if inline is not None else None)
+                        else:
+                            cells[col_counter] = (data_type, cell.findtext(VALUE_TAG) or None)
+                    break
+                element.clear()
+        strings = _read_shared_strings(archive, {int(text) for data_type, text in cells.values()
+                                                 if data_type == 's' and text is not None})
+
+    values = [None] * max(cells, default=0)
+    for col, (data_type, text) in cells.items():
+        if text is None:
+            continue
+        if data_type == 's':
+            value = strings.get(int(text))
+        elif data_type == 'n':
+            value = _cast_number(text)
+        elif data_type == 'b':
+            value = bool(int(text))
+        else:
+            value = text
+        values[col - 1] = value
+    return values
+
+
+class FormulaIndex:
+    """Positions of every formula cell in a sheet, stored as a packed bitmap
+
+    Lookups are O(1) and need no openpyxl cell objects. The bitmap only
+    spans the rows and columns that actually contain formulas.
+    """
+
+    def __init__(self, rows, cols):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        self.count = len(rows)
+        self.max_row = int(rows.max()) if self.count else 0
+        self.max_col = int(cols.max()) if self.count else 0
+        self._bits = np.zeros((self.max_row + 1, (self.max_col >> 3) + 1), dtype=np.uint8)
+        if self.count:
+            np.bitwise_or.at(self._bits, (rows, cols >> 3), (1 << (cols & 7)).astype(np.uint8))
+        self.columns = frozenset(np.unique(cols).tolist())
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, position):
+        row, col = position
+        if row < 1 or col < 1 or row > self.max_row or col > self.max_col:
+            return False
+        return bool((self._bits[row, col >> 3] >> (col & 7)) & 1)
+
+    def mask(self, rows, cols):
+        """Boolean matrix telling which (row, col) pairs of the grid hold formulas"""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        result = np.zeros((len(rows), len(cols)), dtype=bool)
+        row_ok = (rows >= 1) & (rows <= self.max_row)
+        col_ok = (cols >= 1) & (cols <= self.max_col)
+        if not self.count or not row_ok.any() or not col_ok.any():
+            return result
+        bits = self._bits[rows[row_ok]][:, cols[col_ok] >> 3]
+        hits = ((bits >> (cols[col_ok] & 7).astype(np.uint8)) & 1).astype(bool)
+        result[np.ix_(row_ok, col_ok)] = hits
+        return result
+
+
+def scan_formula_cells(source):
+    """Stream a worksheet XML part and return the (rows, cols) of every <f> cell"""
+    rows, cols = [], []
+    row_counter = col_counter = 0
+    current = None
+    for event, element in iterparse(source, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if tag == _ROW_TAG:
+                r = element.get('r')
+                row_counter = int(r) if r else row_counter + 1
+                col_counter = 0
+            elif tag == _CELL_TAG:
+                ref = element.get('r')
+                if ref:
+                    current = coordinate_to_tuple(ref)
+                    col_counter = current[1]
+                else:
+                    col_counter += 1
+                    current = (row_counter, col_counter)
+        elif tag == _FORMULA_TAG:
+            rows.append(current[0])
+            cols.append(current[1])
+        elif tag == _ROW_TAG:
+            element.clear()
+    return rows, cols
+
+
+def formula_index(filename, sheet_name, digest=None):
+    """FormulaIndex for one sheet of an xlsx file, cached by file content"""
+    digest = digest or file_digest(filename)
+    key = (digest, sheet_name)
+    with _formula_index_lock:
+        if key in _formula_index_cache:
+            _formula_index_cache.move_to_end(key)
+            return _formula_index_cache[key]
+
+    with zipfile.ZipFile(filename) as archive:
+        part = sheet_parts(archive).get(sheet_name)
+        if part is None:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        with archive.open(part) as fh:
+            index = FormulaIndex(*scan_formula_cells(fh))
+
+    with _formula_index_lock:
+        _formula_index_cache[key] = index
+        while len(_formula_index_cache) > _FORMULA_INDEX_CACHE_SIZE:
+            _formula_index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,351 @@
+import decimal
+import math
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, get_column_letter
+
+from xlsx_reader import sheet_parts
+
+
+# Size of the pieces zip members are copied and streamed in
+_CHUNK_SIZE = 1 << 20
+
+_SHEET_DATA_RE = re.compile(rb'<((?:[A-Za-z_][\w.-]*:)?)sheetData\b[^>]*?(/?)>')
+_ATTR_RE = re.compile(rb'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+_CALC_PR_RE = re.compile(rb'<((?:[A-Za-z_][\w.-]*:)?)calcPr\b([^>]*?)(/?)>')
+_FULL_CALC_RE = re.compile(rb'\s+fullCalcOnLoad\s*=\s*(?:"[^"]*"|\'[^\']*\')')
+_WORKBOOK_CLOSE_RE = re.compile(rb'</((?:[A-Za-z_][\w.-]*:)?)workbook\s*>')
+# Workbook children that come after calcPr in the schema
+_AFTER_CALC_PR_RE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?(?:oleSize|customWorkbookViews|pivotCaches|smartTagPr|'
+                               rb'smartTagTypes|webPublishing|fileRecoveryPr|webPublishObjects|extLst)\b')
+_RELATIONSHIP_RE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?Relationship\b[^>]*?/>')
+_OVERRIDE_RE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?Override\b[^>]*?/>')
+
+
+class PatchUnsupported(Exception):
+    """The edits cannot be written faithfully without a full openpyxl save"""
+
+
+def _attributes(tag_bytes):
+    return {name: (double if double is not None else single)
+            for name, double, single in _ATTR_RE.findall(tag_bytes)}
+
+
+def _copy_member(source, target, info, write=None):
+    """Copy one zip member across, streamed in chunks, keeping its name, date and compression
+
+    write(part_in, part_out) replaces the plain copy for parts that change.
+    """
+    copied = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    copied.compress_type = info.compress_type
+    copied.external_attr = info.external_attr
+    with source.open(info) as part_in, \
+            target.open(copied, 'w', force_zip64=info.file_size > 1 << 30) as part_out:
+        if write is None:
+            shutil.copyfileobj(part_in, part_out, _CHUNK_SIZE)
+        else:
+            write(part_in, part_out)
+
+
+def _cell_xml(prefix, ref, style, value):
+    """<c> element for a value, written the way openpyxl would type it"""
+    p = prefix.decode()
+    attrs = f' r="{ref}"'
+    if style:
+        attrs += f' s="{style}"'
+
+    if value is None:
+        return f'<{p}c{attrs}/>'.encode() if style else b''
+    if isinstance(value, bool):
+        return f'<{p}c{attrs} t="b"><{p}v>{int(value)}</{p}v></{p}c>'.encode()
+    if isinstance(value, (int, float, decimal.Decimal)):
+        if isinstance(value, float) and not math.isfinite(value):
+            raise PatchUnsupported(f"cannot write {value!r} to {ref}")
+        return f'<{p}c{attrs} t="n"><{p}v>{value}</{p}v></{p}c>'.encode()
+    if isinstance(value, str):
+        if ILLEGAL_CHARACTERS_RE.search(value):
+            raise PatchUnsupported(f"illegal characters in the value for {ref}")
+        if len(value) > 1 and value.startswith('='):
+            return f'<{p}c{attrs}><{p}f>{escape(value[1:])}</{p}f></{p}c>'.encode('utf-8')
+        if value in ERROR_CODES:
+            return f'<{p}c{attrs} t="e"><{p}v>{escape(value)}</{p}v></{p}c>'.encode()
+        space = ' xml:space="preserve"' if value.strip() != value else ''
+        return (f'<{p}c{attrs} t="inlineStr"><{p}is><{p}t{space}>{escape(value)}</{p}t></{p}is></{p}c>'
+                .encode('utf-8'))
+    # Dates and other types need number formats added to the styles part
+    raise PatchUnsupported(f"cannot patch a {type(value).__name__} value into {ref}")
+
+
+def _drop_cached_values(xml, prefix):
+    """Remove the cached results of formula cells, which edited cells may have made stale
+
+    xml holds whole <row> elements; cells without a formula are kept as they are.
+    """
+    formula = b'<' + prefix + b'f'
+    if formula not in xml:
+        return xml
+    p = re.escape(prefix)
+    # The result of a formula follows its <f> element
+    cached_re = re.compile(rb'(<' + p + rb'f\b[^>]*?(?:/>|>[^<]*</' + p + rb'f>))\s*<' + p + rb'v\b[^>]*?(?:/>|>[^<]*</'
+                           + p + rb'v>)')
+    return cached_re.sub(rb'\1', xml)
+
+
+def _rewrite_row(row_xml, row_num, prefix, row_edits):
+    """Return a <row> element with the edited cells replaced or inserted"""
+    open_end = row_xml.index(b'>') + 1
+    if row_xml[open_end - 2:open_end] == b'/>':
+        open_tag = row_xml[:open_end - 2] + b'>'
+        inner, close_tag = b'', b'</' + prefix + b'row>'
+    else:
+        open_tag = row_xml[:open_end]
+        close_at = row_xml.rindex(b'</')
+        inner, close_tag = row_xml[open_end:close_at], row_xml[close_at:]
+
+    cell_re = re.compile(rb'<' + re.escape(prefix) + rb'c\b([^>]*?)(?:/>|>.*?</' + re.escape(prefix) + rb'c>)',
+                         re.DOTALL)
+    pending = sorted(row_edits.items())
+    out = [open_tag]
+    pos = 0
+    col = 0
+    for match in cell_re.finditer(inner):
+        attrs = _attributes(match.group(1))
+        ref = attrs.get(b'r')
+        col = column_index_from_string(coordinate_from_string(ref.decode())[0]) if ref else col + 1
+
+        out.append(inner[pos:match.start()])
+        pos = match.end()
+        # New cells that belong before this one
+        while pending and pending[0][0] < col:
+            new_col, value = pending.pop(0)
+            out.append(_cell_xml(prefix, f"{get_column_letter(new_col)}{row_num}", None, value))
+        if pending and pending[0][0] == col:
+            _, value = pending.pop(0)
+            style = attrs.get(b's', b'').decode()
+            out.append(_cell_xml(prefix, f"{get_column_letter(col)}{row_num}", style, value))
+        else:
+            out.append(match.group(0))
+
+    out.append(inner[pos:])
+    for new_col, value in pending:
+        out.append(_cell_xml(prefix, f"{get_column_letter(new_col)}{row_num}", None, value))
+    out.append(close_tag)
+    return b''.join(out)
+
+
+def _new_rows(prefix, edits, rows):
+    return b''.join(_rewrite_row(b'<' + prefix + b'row r="%d"/>' % row, row, prefix, edits[row])
+                    for row in rows)
+
+
+def rewrite_sheet_xml(source, target, edits):
+    """Stream a worksheet part from source to target, rewriting edited cells only
+
+    edits maps row -> {col: value}. Edited rows get their <c> elements
+    replaced or inserted. Other rows are copied as they are, except that
+    formula cells lose their cached result, which the edits may have
+    made stale.
+    """
+    pending_rows = sorted(edits)
+    buffer = b''
+    eof = False
+
+    def fill(keep_from):
+        """Drop buffer[:keep_from] (already written) and read the next chunk"""
+        nonlocal buffer, eof
+        chunk = source.read(_CHUNK_SIZE)
+        buffer = buffer[keep_from:] + chunk
+        eof = not chunk
+
+    # Copy everything up to and including the <sheetData> tag
+    while True:
+        match = _SHEET_DATA_RE.search(buffer)
+        if match:
+            break
+        if eof:
+            raise PatchUnsupported("worksheet has no sheetData element")
+        fill(0)
+    prefix = match.group(1)
+    if match.group(2):
+        # Empty <sheetData/>: every edited row is new
+        target.write(buffer[:match.start()])
+        target.write(b'<' + prefix + b'sheetData>')
+        target.write(_new_rows(prefix, edits, pending_rows))
+        target.write(b'</' + prefix + b'sheetData>')
+        buffer = buffer[match.end():]
+    else:
+        row_open = b'<' + prefix + b'row'
+        row_close = b'</' + prefix + b'row>'
+        data_close = b'</' + prefix + b'sheetData>'
+        row_num = 0
+
+        def flush():
+            """Write the rows scanned so far, which are complete, and read on"""
+            target.write(_drop_cached_values(buffer[written:pos], prefix))
+            fill(pos)
+            return 0  # Where written and pos are in the refilled buffer
+
+        target.write(buffer[:match.end()])
+        # buffer[:written] is already in target; pos is where scanning resumes
+        written = pos = match.end()
+        while True:
+            start = buffer.find(b'<', pos)
+            tag_end = buffer.find(b'>', start) if start >= 0 else -1
+            if tag_end < 0:
+                if eof:
+                    raise PatchUnsupported("worksheet ends inside sheetData")
+                written = pos = flush()
+                continue
+
+            if buffer.startswith(data_close, start):
+                target.write(_drop_cached_values(buffer[written:start], prefix))
+                target.write(_new_rows(prefix, edits, pending_rows))
+                written = start
+                break
+
+            if not buffer.startswith(row_open, start):
+                # Whitespace or anything else between rows passes through
+                pos = tag_end + 1
+                continue
+
+            if buffer[tag_end - 1:tag_end] == b'/':
+                end = tag_end + 1
+            else:
+                end = buffer.find(row_close, tag_end)
+                if end < 0:
+                    if eof:
+                        raise PatchUnsupported("unterminated row element")
+                    written = pos = flush()
+                    continue
+                end += len(row_close)
+
+            r = _attributes(buffer[start:tag_end]).get(b'r')
+            row_num = int(r) if r else row_num + 1
+            pos = end
+            if not pending_rows or pending_rows[0] > row_num:
+                continue
+
+            target.write(_drop_cached_values(buffer[written:start], prefix))
+            # Edited rows missing from the sheet go before the first later row
+            while pending_rows and pending_rows[0] < row_num:
+                target.write(_new_rows(prefix, edits, [pending_rows.pop(0)]))
+            if pending_rows and pending_rows[0] == row_num:
+                pending_rows.pop(0)
+                row_xml = _rewrite_row(buffer[start:end], row_num, prefix, edits[row_num])
+                target.write(_drop_cached_values(row_xml, prefix))
+            else:
+                target.write(_drop_cached_values(buffer[start:end], prefix))
+            written = end
+        buffer = buffer[written:]
+
+    # The rest of the part is copied unchanged
+    target.write(buffer)
+    while True:
+        chunk = source.read(_CHUNK_SIZE)
+        if not chunk:
+            break
+        target.write(chunk)
+
+
+def _force_full_calculation(workbook_xml):
+    """workbook.xml with calcPr telling Excel to recalculate every formula on open"""
+    match = _CALC_PR_RE.search(workbook_xml)
+    if match:
+        attrs = _FULL_CALC_RE.sub(b'', match.group(2))
+        calc_pr = b'<%scalcPr%s fullCalcOnLoad="1"%s>' % (match.group(1), attrs, match.group(3))
+        return workbook_xml[:match.start()] + calc_pr + workbook_xml[match.end():]
+    close = _WORKBOOK_CLOSE_RE.search(workbook_xml)
+    if close is None:
+        raise PatchUnsupported("workbook.xml has no workbook element")
+    later = _AFTER_CALC_PR_RE.search(workbook_xml)
+    at = later.start() if later else close.start()
+    calc_pr = b'<%scalcPr fullCalcOnLoad="1"/>' % close.group(1)
+    return workbook_xml[:at] + calc_pr + workbook_xml[at:]
+
+
+def _calc_chain_part(rels_xml):
+    """Name of the calculation chain part named in workbook.xml.rels, or None"""
+    for relationship in _RELATIONSHIP_RE.findall(rels_xml):
+        attrs = _attributes(relationship)
+        if attrs.get(b'Type', b'').endswith(b'/calcChain'):
+            target = attrs.get(b'Target', b'').decode()
+            return target[1:] if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    return None
+
+
+def _without_calc_chain(xml, element_re, matches):
+    return element_re.sub(lambda m: b'' if matches(_attributes(m.group(0))) else m.group(0), xml)
+
+
+def patch_workbook(source_file, output_file, sheet_edits):
+    """Write output_file as source_file with only the given cell values changed
+
+    sheet_edits maps sheet name -> {(row, col): value}. Untouched parts are
+    streamed across unchanged, so the save time follows the number of
+    edited sheets, not the size of the workbook. Formulas that depend on
+    edited cells are left to recalculate: the workbook is flagged for a
+    full recalculation on load, its calculation chain is dropped and the
+    edited sheets lose the cached results of their formulas. Raises
+    PatchUnsupported when a value cannot be written this way; the output
+    file is then left untouched.
+    """
+    by_row = {}
+    for sheet_name, cells in sheet_edits.items():
+        rows = {}
+        for (row, col), value in cells.items():
+            rows.setdefault(row, {})[col] = value
+        if rows:
+            by_row[sheet_name] = rows
+
+    out_dir = os.path.dirname(os.path.abspath(output_file))
+    fd, temp_file = tempfile.mkstemp(suffix='.xlsx', dir=out_dir)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(source_file) as source:
+            parts = sheet_parts(source)
+            missing = [name for name in by_row if name not in parts]
+            if missing:
+                raise PatchUnsupported(f"sheets not found: {', '.join(missing)}")
+            edited_parts = {parts[name]: rows for name, rows in by_row.items()}
+
+            # Small XML parts that change along with edited sheets
+            replaced = {}
+            calc_chain = None
+            if edited_parts:
+                rels_part = 'xl/_rels/workbook.xml.rels'
+                replaced['xl/workbook.xml'] = _force_full_calculation(source.read('xl/workbook.xml'))
+                rels_xml = source.read(rels_part)
+                calc_chain = _calc_chain_part(rels_xml)
+                if calc_chain is not None:
+                    replaced[rels_part] = _without_calc_chain(
+                        rels_xml, _RELATIONSHIP_RE, lambda attrs: attrs.get(b'Type', b'').endswith(b'/calcChain'))
+                    replaced['[Content_Types].xml'] = _without_calc_chain(
+                        source.read('[Content_Types].xml'), _OVERRIDE_RE,
+                        lambda attrs: attrs.get(b'PartName', b'').decode().lstrip('/') == calc_chain)
+
+            with zipfile.ZipFile(temp_file, 'w') as target:
+                for info in source.infolist():
+                    if info.filename == calc_chain:
+                        continue
+                    rows = edited_parts.get(info.filename)
+                    data = replaced.get(info.filename)
+                    if rows is not None:
+                        _copy_member(source, target, info,
+                                     lambda part_in, part_out: rewrite_sheet_xml(part_in, part_out, rows))
+                    elif data is not None:
+                        _copy_member(source, target, info, lambda part_in, part_out: part_out.write(data))
+                    else:
+                        _copy_member(source, target, info)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
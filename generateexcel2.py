@@ -9,16 +9,20 @@ from openpyxl.drawing.image import Image
 from openpyxl.worksheet.dimensions import ColumnDimension
 from openpyxl.utils import get_column_letter
 import os
-from faker import Faker
+import argparse
 
-# Initialize faker to generate realistic data
-fake = Faker()
 
 def generate_test_id(index):
     """Generate test IDs with proper formatting"""
     return f"T{index:04d}"
 
 def create_test_excel_files():
+    # Faker is only needed for the demo files, not for the benchmark fixtures
+    from faker import Faker
+    
+    # Initialize faker to generate realistic data
+    fake = Faker()
+    
     # Create directory if it doesn't exist
     output_dir = "test_files"
     if not os.path.exists(output_dir):
@@ -445,5 +449,160 @@ def create_test_excel_files():
     print(f"- Old file: {old_file_path}")
     print(f"- New file: {new_file_path}")
 
+# Layout of the benchmark fixtures: title rows, then headers on row 4 (the compare tool's default)
+BENCHMARK_HEADER_ROW = 4
+BENCHMARK_KEY_HEADERS = ["Test ID", "Team", "App Name", "Category"]
+BENCHMARK_TEAMS = ["Team Alpha", "Team Beta", "Team Gamma", "Team Delta", "Team Epsilon", "Team Omega"]
+BENCHMARK_APPS = ["Inventory App", "CRM Portal", "Reporting Tool", "Mobile App", "Admin Panel",
+                  "Payment Gateway", "Analytics Engine", "User Portal"]
+
+
+def _benchmark_keys(index):
+    """Test ID, Team, App Name and Category of a fixture row"""
+    return [generate_test_id(index),
+            BENCHMARK_TEAMS[index % len(BENCHMARK_TEAMS)],
+            BENCHMARK_APPS[(index // len(BENCHMARK_TEAMS)) % len(BENCHMARK_APPS)],
+            f"CAT-{index:07d}"]
+
+
+def _changed_value(value):
+    if isinstance(value, str):
+        return value + "-changed"
+    return value + 1
+
+
+class _BenchmarkLayout:
+    """Column layout and row contents of one benchmark fixture
+    
+    Every row is generated from its own seeded random source, so the new
+    file can be written in shuffled order without keeping rows in memory.
+    """
+    
+    def __init__(self, columns, change_rate, formula_share, duplicate_rate, seed):
+        if columns < len(BENCHMARK_KEY_HEADERS) + 1:
+            raise ValueError(f"columns must be at least {len(BENCHMARK_KEY_HEADERS) + 1}")
+        self.change_rate = change_rate
+        self.duplicate_rate = duplicate_rate
+        self.seed = seed
+        self.data_columns = columns - len(BENCHMARK_KEY_HEADERS)
+        formula_count = int(self.data_columns * formula_share)
+        
+        # Formula columns sit at the end, each one doubling a numeric data column
+        self.formula_columns = list(range(self.data_columns - formula_count, self.data_columns))
+        numeric = [col for col in range(self.data_columns - formula_count) if col % 2 == 0]
+        self.formula_sources = {col: numeric[i % len(numeric)] if numeric else None
+                                for i, col in enumerate(self.formula_columns)}
+        self.changeable = list(range(self.data_columns - formula_count))
+        self.headers = BENCHMARK_KEY_HEADERS + [
+            f"Formula {col + 1}" if col in self.formula_sources else f"Field {col + 1}"
+            for col in range(self.data_columns)
+        ]
+    
+    def rows(self, sheet_index, index):
+        """(old row, new row) for data row number index (1-based)"""
+        rng = random.Random(f"{self.seed}-{sheet_index}-{index}")
+        keys = _benchmark_keys(index)
+        if index > 1 and rng.random() < self.duplicate_rate:
+            keys = _benchmark_keys(index - 1)
+        
+        values = [rng.randrange(1000000) if col % 2 == 0 else f"text-{rng.randrange(100000)}"
+                  for col in range(self.data_columns)]
+        old_values = list(values)
+        new_values = list(values)
+        excel_row = BENCHMARK_HEADER_ROW + index
+        for col, source in self.formula_sources.items():
+            if source is None:
+                old_values[col] = "=ROW()*2"
+                new_values[col] = excel_row * 2
+            else:
+                source_letter = get_column_letter(len(BENCHMARK_KEY_HEADERS) + source + 1)
+                old_values[col] = f"={source_letter}{excel_row}*2"
+                new_values[col] = values[source] * 2
+        if rng.random() < self.change_rate:
+            col = rng.choice(self.changeable)
+            new_values[col] = _changed_value(new_values[col])
+        return keys + old_values, keys + new_values
+
+
+def benchmark_fixture_name(rows, columns, change_rate=0.05, formula_share=0.1, duplicate_rate=0.0, sheets=1,
+                           shuffle=True, seed=0):
+    """Base name of the fixture pair made with these parameters, so pairs made with other ones never collide"""
+    order = "shuffled" if shuffle else "ordered"
+    return (f"bench_{rows}x{columns}_chg{change_rate:g}_fx{formula_share:g}_dup{duplicate_rate:g}"
+            f"_{sheets}sheets_{order}_seed{seed}")
+
+
+def create_benchmark_files(output_dir="benchmark_files", rows=10000, columns=10, change_rate=0.05,
+                           formula_share=0.1, duplicate_rate=0.0, sheets=1, shuffle=True, seed=0):
+    """Generate an old/new xlsx pair for benchmarking the compare tool
+    
+    Both files are streamed with write-only workbooks and no styling, so
+    even 1M rows x 200 columns only holds one row at a time in memory.
+    Each sheet has headers on row 4: Test ID, Team, App Name, Category
+    (Category is unique per row, so Team/App/Category is a usable key),
+    followed by data columns. formula_share of the data columns hold
+    formulas in the old file and plain values in the new one (as if the
+    new file were an export). change_rate of the rows get one changed data
+    cell in the new file, duplicate_rate of the rows repeat the keys of
+    the row before them, and shuffle writes the new rows in another order.
+    
+    Returns (old file path, new file path).
+    """
+    layout = _BenchmarkLayout(columns, change_rate, formula_share, duplicate_rate, seed)
+    
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    name = benchmark_fixture_name(rows, columns, change_rate, formula_share, duplicate_rate, sheets, shuffle, seed)
+    old_file_path = os.path.join(output_dir, f"{name}_old.xlsx")
+    new_file_path = os.path.join(output_dir, f"{name}_new.xlsx")
+    
+    old_wb = openpyxl.Workbook(write_only=True)
+    new_wb = openpyxl.Workbook(write_only=True)
+    for sheet_index in range(sheets):
+        title = "Data" if sheet_index == 0 else f"Data {sheet_index + 1}"
+        old_sheet = old_wb.create_sheet(title)
+        new_sheet = new_wb.create_sheet(title)
+        for sheet in (old_sheet, new_sheet):
+            sheet.append([f"BENCHMARK {name} - {title}"])
+            sheet.append([])
+            sheet.append([])
+            sheet.append(layout.headers)
+        
+        for index in range(1, rows + 1):
+            old_sheet.append(layout.rows(sheet_index, index)[0])
+        
+        new_order = list(range(1, rows + 1))
+        if shuffle:
+            random.Random(f"{seed}-{sheet_index}-order").shuffle(new_order)
+        for index in new_order:
+            new_sheet.append(layout.rows(sheet_index, index)[1])
+    
+    old_wb.save(old_file_path)
+    new_wb.save(new_file_path)
+    return old_file_path, new_file_path
+
+
 if __name__ == "__main__":
-    create_test_excel_files()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate Excel test files for the compare tool")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="generate large old/new benchmark files instead of the demo files")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--formula-share", type=float, default=0.1)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="benchmark_files")
+    args = parser.parse_args()
+    
+    if args.benchmark:
+        old_path, new_path = create_benchmark_files(
+            args.output_dir, args.rows, args.columns, args.change_rate,
+            args.formula_share, args.duplicate_rate, args.sheets, seed=args.seed
+        )
+        print("Created benchmark files:")
+        print(f"- Old file: {old_path}")
+        print(f"- New file: {new_path}")
+    else:
+        create_test_excel_files()
\ No newline at end of file
@@ -6,6 +6,7 @@ from openpyxl.utils import get_column_letter
 import os
 from openpyxl.utils.dataframe import dataframe_to_rows
 import threading
+from bisect import bisect_right
 
 import requests
 import json
@@ -14,6 +15,41 @@ import tempfile
 import webbrowser
 from urllib.parse import urlparse, quote
 
+class MergedCellIndex:
+    """Merged ranges of a sheet indexed by row, built once per sheet
+
+    anchor(row, col) returns the top-left cell of the merged range that
+    covers (row, col), or None when the cell is not merged. Each row keeps
+    the column spans of the ranges crossing it sorted by first column, so
+    a lookup is a dict hit plus a binary search instead of a scan over
+    every merged range of the sheet.
+    """
+
+    def __init__(self, sheet):
+        spans = {}
+        for merged_range in sheet.merged_cells.ranges:
+            anchor = (merged_range.min_row, merged_range.min_col)
+            for row in range(merged_range.min_row, merged_range.max_row + 1):
+                spans.setdefault(row, []).append((merged_range.min_col, merged_range.max_col, anchor))
+        self._starts = {}
+        self._spans = {}
+        for row, row_spans in spans.items():
+            # Merged ranges never overlap, so the spans of a row are disjoint
+            row_spans.sort()
+            self._starts[row] = [min_col for min_col, _, _ in row_spans]
+            self._spans[row] = row_spans
+
+    def anchor(self, row, col):
+        starts = self._starts.get(row)
+        if not starts:
+            return None
+        i = bisect_right(starts, col) - 1
+        if i < 0:
+            return None
+        _, max_col, anchor = self._spans[row][i]
+        return anchor if col <= max_col else None
+
+
 class ExcelComparisonApp:
     def __init__(self, root):
         self.root = root
@@ -835,6 +871,9 @@ class ExcelComparisonApp:
                 old_sheet_eval = old_wb_eval[sheet_name]  # Contains formula results
                 new_sheet = new_wb[sheet_name]
                 
+                # Merged-cell lookups for both update paths below
+                merged_cells = MergedCellIndex(old_sheet_raw)
+                
                 # COLUMN-BASED MODE
                 if not is_row_mode:
                     # Column-based comparison
@@ -1007,21 +1046,9 @@ class ExcelComparisonApp:
                             # Better merged cell handling
                             try:
                                 # Check if cell is part of a merged range
-                                is_merged = False
-                                merged_cell_addr = None
+                                merged_cell_addr = merged_cells.anchor(old_row, col)
                                 
-                                for merged_range in old_sheet_raw.merged_cells.ranges:
-                                    # Get the bounds of the merged range
-                                    bounds = openpyxl.utils.cell.range_boundaries(merged_range.coord)
-                                    min_col, min_row, max_col, max_row = bounds
-                                    
-                                    # Check if our cell is within those bounds
-                                    if (min_row <= old_row <= max_row) and (min_col <= col <= max_col):
-                                        is_merged = True
-                                        merged_cell_addr = (min_row, min_col)
-                                        break
-                                
-                                if is_merged and merged_cell_addr != (old_row, col):
+                                if merged_cell_addr is not None and merged_cell_addr != (old_row, col):
                                     # This is not the top-left cell, so skip it
                                     continue
                                 
@@ -1187,21 +1214,9 @@ class ExcelComparisonApp:
                                     # Handle merged cells
                                     try:
                                         # Check if cell is part of a merged range
-                                        is_merged = False
-                                        merged_cell_addr = None
-                                        
-                                        for merged_range in old_sheet_raw.merged_cells.ranges:
-                                            # Get the bounds of the merged range
-                                            bounds = openpyxl.utils.cell.range_boundaries(merged_range.coord)
-                                            min_col, min_row, max_col, max_row_merged = bounds
-                                            
-                                            # Check if our cell is within those bounds
-                                            if (min_row <= row <= max_row_merged) and (min_col <= old_col <= max_col):
-                                                is_merged = True
-                                                merged_cell_addr = (min_row, min_col)
-                                                break
+                                        merged_cell_addr = merged_cells.anchor(row, old_col)
                                         
-                                        if is_merged and merged_cell_addr != (row, old_col):
+                                        if merged_cell_addr is not None and merged_cell_addr != (row, old_col):
                                             # This is not the top-left cell, skip it
                                             continue
                                         